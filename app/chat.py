@@ -0,0 +1,359 @@
+import importlib, json, logging, os, re, time
+from typing import Dict, Iterator, List, NamedTuple, Optional, Protocol, Tuple
+
+import httpx
+from rapidfuzz import fuzz, process
+
+from . import data, places_db
+from .chat_cache import cache as answers
+
+log = logging.getLogger(__name__)
+
+# /chat engine. Most questions are about the catalog ("how high is Annapurna Circuit", "best
+# season for the W trek", "where to stay in Namche"), and those are answered straight from
+# in-memory indexes over data.catalog and the places search, without a model call. Only what
+# the router can't place goes to the LLM backend, with a short retrieved context and a history
+# window trimmed to CHAT_HISTORY_TOKENS. Model answers go through chat_cache, so a repeated
+# question is only paid for once.
+
+HISTORY_TOKENS = int(os.getenv("CHAT_HISTORY_TOKENS", "800"))
+HISTORY_TURNS = int(os.getenv("CHAT_HISTORY_TURNS", "8"))
+# "stub" | "openai" | "package.module:factory"; with an OpenAI key and no choice, the real model
+BACKEND = os.getenv("CHAT_LLM") or ("openai" if os.getenv("OPENAI_API_KEY") else "stub")
+NAME_MIN_SCORE = 85   # rapidfuzz ratio for a misspelled word of a trek name ("everst")
+# nicknames -> catalog names; names of 3+ words also answer to their initials ("EBC")
+ALIASES = {"w trek": "Torres del Paine W Trek", "the w": "Torres del Paine W Trek"}
+# words that don't tell one trek from another; a match needs at least one other word of the name
+GENERIC = frozenset({"trek", "trekking", "trail", "route", "circuit", "base", "camp", "the", "and", "del", "walk"})
+STUB_TOKEN_DELAY_S = float(os.getenv("CHAT_STUB_TOKEN_DELAY_S", "0"))   # makes the stub behave like a slow model
+SYSTEM_PROMPT = ("You are Khoj, a mountaineering and trekking assistant. Be concise and safety-minded. "
+                 "Use the context when it is relevant; say so when you don't know.")
+
+Reply = Tuple[str, bool, Optional[int], str]   # text, showPlan, selectedTrekId, intent
+Event = Tuple[str, dict]                        # ("token", {"text"}) ... ("done", ChatOut fields)
+
+# ----- history window -----
+def tokens(text: str) -> int:
+    # ~4 characters per token is close enough for budgeting
+    return len(text) // 4 + 1
+
+def window(history: List[dict], budget: int = HISTORY_TOKENS, max_turns: int = HISTORY_TURNS) -> List[dict]:
+    """
+    Newest turns that fit the token budget, oldest first, as {role, content} messages.
+    Accepts the frontend's {type: 'user'|'ai', text} and OpenAI-style {role, content} items.
+    """
+    out, used = [], 0
+    for h in reversed(history[-max_turns:]):
+        text = str(h.get("text", h.get("content", "")))
+        role = h.get("role") or ("assistant" if h.get("type") == "ai" else "user")
+        cost = tokens(text)
+        if used + cost > budget: break
+        out.append({"role": role, "content": text}); used += cost
+    return out[::-1]
+
+# ----- LLM backends -----
+class LLM(Protocol):
+    def complete(self, messages: List[dict]) -> str: ...
+    # optional: def stream(self, messages) -> Iterator[str], yielding text pieces as they're produced
+
+_PIECE = re.compile(r"\S+\s*")
+
+def pieces(text: str) -> Iterator[str]:
+    # word-sized chunks (with their trailing space), for text that isn't produced incrementally
+    for m in _PIECE.finditer(text): yield m.group()
+
+class StubLLM:
+    """Deterministic local backend (default without a key, and for tests): echoes what it would have been asked."""
+    cacheable = False   # not an answer: never cached, and sent with intent "stub"
+
+    def __init__(self, delay_s: float = STUB_TOKEN_DELAY_S):
+        self.delay_s = delay_s
+
+    def complete(self, messages: List[dict]) -> str:
+        question = messages[-1]["content"]
+        ctx = next((m["content"] for m in messages if m["role"] == "system" and m["content"].startswith("Context:")), "")
+        hint = f" Here is what I found: {ctx[len('Context:'):].strip()}" if ctx else ""
+        return f"I can't answer \"{question}\" from the trek catalog alone.{hint}"
+
+    def stream(self, messages: List[dict]) -> Iterator[str]:
+        for p in pieces(self.complete(messages)):
+            if self.delay_s: time.sleep(self.delay_s)
+            yield p
+
+class OpenAILLM:
+    """Any OpenAI-compatible chat completions endpoint; key from OPENAI_API_KEY."""
+    def __init__(self):
+        self.url = os.getenv("CHAT_LLM_URL", "https://api.openai.com/v1/chat/completions")
+        self.model = os.getenv("CHAT_LLM_MODEL", "gpt-4o-mini")
+        self.client = httpx.Client(timeout=30, headers={"Authorization": f"Bearer {os.environ['OPENAI_API_KEY']}"})
+
+    def complete(self, messages: List[dict]) -> str:
+        r = self.client.post(self.url, json={"model": self.model, "messages": messages})
+        r.raise_for_status()
+        return r.json()["choices"][0]["message"]["content"]
+
+    def stream(self, messages: List[dict]) -> Iterator[str]:
+        # closing this generator early leaves the `with`, which drops the upstream connection
+        with self.client.stream("POST", self.url, json={"model": self.model, "messages": messages, "stream": True}) as r:
+            r.raise_for_status()
+            for line in r.iter_lines():
+                if not line.startswith("data:"): continue
+                data = line[5:].strip()
+                if data == "[DONE]": return
+                delta = json.loads(data)["choices"][0]["delta"].get("content")
+                if delta: yield delta
+
+_backends = {"stub": StubLLM, "openai": OpenAILLM}
+_llm: Optional[LLM] = None
+
+def llm() -> LLM:
+    # built on first use: a deployment that never falls through to the model never needs a key
+    global _llm
+    if _llm is None:
+        if BACKEND in _backends:
+            _llm = _backends[BACKEND]()
+        else:
+            mod, attr = BACKEND.split(":", 1)
+            _llm = getattr(importlib.import_module(mod), attr)()
+    return _llm
+
+def set_llm(backend: Optional[LLM]):
+    global _llm
+    _llm = backend
+
+def _llm_stream(messages: List[dict], backend: Optional[LLM] = None) -> Iterator[str]:
+    backend = backend or llm()
+    if hasattr(backend, "stream"): return backend.stream(messages)
+    return iter((backend.complete(messages),))
+
+# ----- catalog index -----
+_WORD = re.compile(r"[\w']+")
+
+class _Index:
+    """Trek names and locations of one catalog, for matching them inside free text."""
+    def __init__(self, catalog: "data.Catalog"):
+        self.catalog = catalog
+        self.names = {r.id: r.name for r in catalog.records}
+        self.by_word: Dict[str, List[int]] = {}
+        aliases: Dict[str, int] = {}
+        for r in catalog.records:
+            words = _WORD.findall(r.name.casefold())
+            for w in set(words):
+                if len(w) > 2: self.by_word.setdefault(w, []).append(r.id)
+            if len(words) >= 3: aliases.setdefault("".join(w[0] for w in words), r.id)
+        by_name = {n.casefold(): i for i, n in self.names.items()}
+        aliases.update({a: by_name[n.casefold()] for a, n in ALIASES.items() if n.casefold() in by_name})
+        self.aliases = aliases
+        self.alias_rx = re.compile(r"\b(" + "|".join(map(re.escape, sorted(aliases, key=len, reverse=True))) + r")\b") if aliases else None
+        self.locations = {r.location.casefold(): r.location for r in catalog.records}
+
+    def trek_in(self, text: str) -> Optional[int]:
+        """
+        Trek named in text: by alias, else the name sharing the most distinctive words with it.
+        Words match exactly or, from 4 letters on, with a typo ("everst base camp", "torres del paine gear").
+        """
+        low = text.casefold()
+        m = self.alias_rx.search(low) if self.alias_rx else None
+        if m: return self.aliases[m.group(1)]
+        matched: Dict[int, set] = {}
+        for w in set(_WORD.findall(low)):
+            if len(w) <= 2: continue
+            if w in self.by_word:
+                vocab = [w]
+            elif len(w) > 3:
+                vocab = [v for v, _, _ in process.extract(w, self.by_word.keys(), scorer=fuzz.ratio,
+                                                          score_cutoff=NAME_MIN_SCORE, limit=None)]
+            else:
+                continue
+            for v in vocab:
+                for i in self.by_word[v]: matched.setdefault(i, set()).add(v)
+        ranked = [(len(ws - GENERIC), len(ws), i) for i, ws in matched.items() if ws - GENERIC]
+        return max(ranked, key=lambda r: r[:2])[2] if ranked else None
+
+    def location_in(self, text: str) -> Optional[str]:
+        words = set(_WORD.findall(text.casefold()))
+        return next((loc for key, loc in self.locations.items() if key in words), None)
+
+_index: Optional[_Index] = None
+
+def index() -> _Index:
+    global _index
+    if _index is None or _index.catalog is not data.catalog:
+        _index = _Index(data.catalog)
+    return _index
+
+# ----- intent router -----
+_INTENTS = [   # first match wins; checked against the lower-cased message
+    ("greeting", re.compile(r"^\s*(hi|hello|hey|namaste|good (morning|evening))\b[\s!.]*$")),
+    ("places", re.compile(r"\b(where (can|to|do) i (eat|stay|sleep)|restaurant|cafe|café|hotel|guest ?house|lodges? (in|near|at)|near(by)? )")),
+    ("plan", re.compile(r"\b(plan|itinerary|book|organi[sz]e)\b")),
+    ("altitude", re.compile(r"\b(altitude|elevation|how high|height|max(imum)? height)\b")),
+    ("season", re.compile(r"\b(season|when|best time|month|weather)\b")),
+    ("cost", re.compile(r"\b(cost|price|budget|expensive|cheap|how much)\b")),
+    ("duration", re.compile(r"\b(how long|duration|days?|weeks?)\b")),
+    ("difficulty", re.compile(r"\b(difficult|difficulty|hard|easy|fitness|beginner)\b")),
+    ("gear", re.compile(r"\b(gear|equipment|pack|bring|clothes)\b")),
+    ("guides", re.compile(r"\bguides?\b")),
+    ("lodging", re.compile(r"\b(lodging|accommodation|stay|tea ?house|refugio)\b")),
+    ("list", re.compile(r"\b(treks|routes|trails|recommend|suggest|options)\b")),
+]
+
+def classify(message: str) -> str:
+    m = message.casefold()
+    return next((name for name, rx in _INTENTS if rx.search(m)), "open")
+
+def _trek_from(message: str, history: List[dict]) -> Optional[int]:
+    # named in this message, else the most recent one named in the conversation
+    idx = index()
+    tid = idx.trek_in(message)
+    if tid is None:
+        for h in reversed(history):
+            tid = idx.trek_in(h["content"])
+            if tid is not None: break
+    return tid
+
+def _catalog_answer(intent: str, t: "data.TrekRecord") -> str:
+    cat = data.catalog
+    if intent == "altitude":
+        return f"{t.name} tops out at {t.altitude:,} m." + (" Plan acclimatization days above 3,000 m." if t.altitude >= 3000 else "")
+    if intent == "season":
+        return f"The best season for {t.name} is {t.bestSeason}."
+    if intent == "cost":
+        return f"{t.name} usually costs ${t.cost_min:,}-{t.cost_max:,} for about {t.duration} days."
+    if intent == "duration":
+        return f"{t.name} takes about {t.duration} days."
+    if intent == "difficulty":
+        return f"{t.name} is rated {t.difficulty} (risk level {t.riskLevel})."
+    if intent == "gear":
+        return f"For {t.name} bring: {', '.join(t.gear)}."
+    if intent == "guides":
+        g = cat.guides_for(t.location)
+        if not g: return f"I don't have guide listings for {t.location} yet."
+        return f"Guides in {t.location}: " + "; ".join(f"{x['name']} ({x['rating']}★, ${x['price_per_day']}/day)" for x in g)
+    if intent == "lodging":
+        lod = cat.lodging_for(t.location)
+        if not lod: return f"I don't have lodging listings for {t.location} yet."
+        return f"Lodging around {t.name}: " + "; ".join(f"{x['type']} {x['price_range']}" for x in lod)
+    # plan / open question about a named trek: short profile
+    return (f"{t.name} ({t.location}): {t.difficulty}, {t.duration} days, up to {t.altitude:,} m, "
+            f"best {t.bestSeason}, ${t.cost_min:,}-{t.cost_max:,}. Highlights: {', '.join(t.highlights)}.")
+
+def _places_answer(message: str) -> Optional[str]:
+    rows = places_db.search_text(message, 5)
+    if not rows: return None
+    return "Places that match: " + "; ".join(f"{r['name']} ({r['kind']}{', ' + r['address'] if r.get('address') else ''})" for r in rows)
+
+def _list_answer(message: str) -> Optional[str]:
+    cat = data.catalog
+    loc = index().location_in(message)
+    m = message.casefold()
+    diff = next((d for d in ("easy", "moderate", "hard") if d in m), None)
+    if loc is None and diff is None: return None
+    hits = cat.filter(location=loc, difficulty=diff)
+    if not hits: return f"I have no {diff or ''} treks{' in ' + loc if loc else ''} in the catalog.".replace("  ", " ")
+    shown = [cat.records[i] for i in hits[:5]]
+    more = f" (+{len(hits) - 5} more)" if len(hits) > 5 else ""
+    return "Treks: " + "; ".join(f"{t.name} ({t.location}, {t.difficulty}, {t.duration} d)" for t in shown) + more
+
+def _context(message: str, trek: Optional["data.TrekRecord"]) -> str:
+    # retrieved snippets for the model: the trek in focus and a few matching places
+    parts = []
+    if trek: parts.append(_catalog_answer("open", trek))
+    places = _places_answer(message)
+    if places: parts.append(places)
+    return " ".join(parts)
+
+class _Ask(NamedTuple):
+    """What goes to the model when the indexes can't answer."""
+    messages: List[dict]
+    context: str
+    trek_id: Optional[int]
+
+def _route(message: str, history: List[dict]):
+    """A Reply when the indexes answer, else an _Ask for the model."""
+    intent = classify(message)
+    if intent == "greeting":
+        return "Namaste! Ask me about a trek (altitude, season, cost, gear) or where to stay and eat.", False, None, intent
+    tid = _trek_from(message, history)
+    trek = data.catalog.get(tid) if tid is not None else None
+    if intent == "places":
+        text = _places_answer(message)
+        if text: return text, False, tid, intent
+    elif intent == "list":
+        text = _list_answer(message)
+        if text: return text, False, None, intent
+    elif trek is not None and intent != "open":
+        return _catalog_answer(intent, trek), intent == "plan", trek.id, intent
+
+    # nothing in the indexes answers this: ask the model, with the little context we have
+    msgs = [{"role": "system", "content": SYSTEM_PROMPT}]
+    ctx = _context(message, trek)
+    if ctx: msgs.append({"role": "system", "content": f"Context: {ctx}"})
+    msgs += history + [{"role": "user", "content": message}]
+    return _Ask(msgs, ctx, tid)
+
+def answer(message: str, history: List[dict]) -> Reply:
+    """history: window()-ed {role, content} messages."""
+    r = _route(message, history)
+    if not isinstance(r, _Ask): return r
+    hit = answers.get(message, r.trek_id)
+    if hit: return hit[0], False, r.trek_id, "cache"
+    backend = None
+    try:
+        t0 = time.perf_counter()
+        backend = llm()
+        text = backend.complete(r.messages)
+        if _cacheable(backend): answers.put(message, r.trek_id, text, time.perf_counter() - t0)
+    except Exception:
+        log.exception("chat backend failed")
+        text = r.context or "Sorry, I can't answer that right now."
+    return text, False, r.trek_id, _intent(backend)
+
+def _cacheable(backend: Optional[LLM]) -> bool:
+    return getattr(backend, "cacheable", True)
+
+def _intent(backend: Optional[LLM]) -> str:
+    return "llm" if _cacheable(backend) else "stub"
+
+def respond(message: str, history: Optional[List[dict]] = None) -> Reply:
+    return answer(message, window(history or []))
+
+def _done(text: str, show_plan: bool, trek_id: Optional[int], intent: str) -> Event:
+    return "done", {"reply": text, "showPlan": show_plan, "selectedTrekId": trek_id, "intent": intent}
+
+def stream(message: str, history: Optional[List[dict]] = None) -> Iterator[Event]:
+    """
+    respond() as events: ("token", {"text"}) pieces of the reply as they are produced, then one
+    ("done", {...ChatOut fields}). Pull-driven - the backend only produces the next piece when the
+    consumer asks for it - and close() stops the backend stream (and its upstream request).
+    """
+    r = _route(message, window(history or []))
+    if not isinstance(r, _Ask):
+        for p in pieces(r[0]): yield "token", {"text": p}
+        yield _done(*r)
+        return
+    hit = answers.get(message, r.trek_id)
+    if hit:
+        for p in pieces(hit[0]): yield "token", {"text": p}
+        yield _done(hit[0], False, r.trek_id, "cache")
+        return
+    out: List[str] = []
+    gen = backend = None
+    try:
+        t0 = time.perf_counter()
+        backend = llm()
+        gen = _llm_stream(r.messages, backend)
+        for p in gen:
+            out.append(p)
+            yield "token", {"text": p}
+        # only complete answers are cached; an abandoned stream never gets here
+        if _cacheable(backend): answers.put(message, r.trek_id, "".join(out), time.perf_counter() - t0)
+    except Exception:
+        log.exception("chat backend failed")
+        if not out:   # nothing sent yet: same fallback as respond()
+            out = [r.context or "Sorry, I can't answer that right now."]
+            yield "token", {"text": out[0]}
+    finally:
+        close = getattr(gen, "close", None)
+        if close: close()
+    yield _done("".join(out), False, r.trek_id, _intent(backend))
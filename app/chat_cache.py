@@ -0,0 +1,114 @@
+import functools, os, re, threading, time
+from typing import Optional, Tuple
+
+from rapidfuzz import fuzz, process
+
+from . import data
+from .risk_cache import TTLCache
+
+# Answer cache in front of the chat model. Chat traffic is mostly the same few hundred questions,
+# so model answers are kept by (catalog version, trek in focus, normalized question):
+#  - exact: "Best season for Annapurna Circuit?" and "best season for annapurna circuit" share a key
+#  - near:  otherwise the closest cached question about the same trek, if rapidfuzz scores it at
+#           least CHAT_CACHE_THRESHOLD (token_sort_ratio, 0-100), both have exactly the same
+#           negations, and every content word on either side has a close spelling on the other
+#           (fuzz.ratio >= CHAT_CACHE_WORD_THRESHOLD) - so stopwords, word order and typos may
+#           differ ("can i drink tap watr"), but not meaning. A fuzzy score alone puts
+#           "can i drink the tap water" and "can i not drink the tap water" at 92.6.
+# Keying on the trek keeps "cost of Manaslu Circuit" from matching "cost of Annapurna Circuit";
+# keying on the catalog version (and clearing on change) drops answers about stale trek data.
+
+CACHE_SIZE = int(os.getenv("CHAT_CACHE_SIZE", "2048"))
+CACHE_TTL_S = float(os.getenv("CHAT_CACHE_TTL_S", "86400"))
+THRESHOLD = float(os.getenv("CHAT_CACHE_THRESHOLD", "90"))
+WORD_THRESHOLD = float(os.getenv("CHAT_CACHE_WORD_THRESHOLD", "80"))
+_WORD = re.compile(r"\w+")
+# "t" is what's left of n't ("don't" -> "don", "t")
+NEGATIONS = frozenset("not no never nor none nothing neither without cannot cant dont doesnt didnt isnt arent wasnt "
+                      "wont wouldnt shouldnt couldnt mustnt t".split())
+STOPWORDS = frozenset("a an the i me my we you your it its is are was be do does did can could should would will "
+                      "shall must may might to of in on at for from with about by and or if so what which who how "
+                      "there this that these those any some please tell".split()) - NEGATIONS
+
+def normalize(q: str) -> str:
+    return " ".join(_WORD.findall(q.casefold()))
+
+@functools.lru_cache(maxsize=4 * CACHE_SIZE)   # recomputed per cached key on every near lookup otherwise
+def signature(normalized: str) -> Tuple[frozenset, frozenset]:
+    """(negation words, content words) of a normalize()d question."""
+    words = set(normalized.split())
+    return frozenset(words & NEGATIONS), frozenset(words - NEGATIONS - STOPWORDS)
+
+def _covered(words: frozenset, other: frozenset, cutoff: float) -> bool:
+    # every word has a spelling-close counterpart in other
+    return all(process.extractOne(w, other, scorer=fuzz.ratio, score_cutoff=cutoff) for w in words)
+
+def same_words(a: frozenset, b: frozenset, cutoff: float = WORD_THRESHOLD) -> bool:
+    """Content words of two questions match both ways, allowing typos."""
+    return a == b or (_covered(a - b, b, cutoff) and _covered(b - a, a, cutoff))
+
+class AnswerCache:
+    def __init__(self, maxsize: int = CACHE_SIZE, ttl_s: float = CACHE_TTL_S, threshold: float = THRESHOLD,
+                 word_threshold: float = WORD_THRESHOLD):
+        self.threshold, self.word_threshold = threshold, word_threshold
+        self.cache = TTLCache(maxsize, ttl_s)
+        self._version: Optional[str] = None
+        self._lock = threading.Lock()
+        self.exact_hits = self.near_hits = self.misses = 0
+        self.backend_s = 0.0        # total time spent in the model on misses
+        self.stored = 0
+        self.lookup_s = 0.0
+
+    def _bucket(self, trek_id: Optional[int]) -> tuple:
+        version = data.catalog.version
+        if version != self._version:
+            self.cache.clear()
+            self._version = version
+        return version, trek_id
+
+    def get(self, question: str, trek_id: Optional[int]) -> Optional[Tuple[str, str]]:
+        """(answer, 'exact' | 'near') or None."""
+        t0 = time.perf_counter()
+        bucket, q = self._bucket(trek_id), normalize(question)
+        kind, text = "exact", self.cache.get((*bucket, q))
+        if text is None and self.threshold < 100:
+            neg, words = signature(q)
+            cands = [k[2] for k in self.cache.keys() if k[:2] == bucket and k[2] != q and signature(k[2])[0] == neg]
+            # best score first; the (costlier) word check only runs on questions that pass the cutoff
+            for c, _, _ in process.extract(q, cands, scorer=fuzz.token_sort_ratio, score_cutoff=self.threshold, limit=None):
+                if same_words(words, signature(c)[1], self.word_threshold):
+                    kind, text = "near", self.cache.get((*bucket, c))
+                    break
+        with self._lock:
+            self.lookup_s += time.perf_counter() - t0
+            if text is None: self.misses += 1
+            elif kind == "exact": self.exact_hits += 1
+            else: self.near_hits += 1
+        return (text, kind) if text is not None else None
+
+    def put(self, question: str, trek_id: Optional[int], answer: str, backend_s: float, ttl_s: Optional[float] = None):
+        self.cache.put((*self._bucket(trek_id), normalize(question)), answer, ttl_s)
+        with self._lock:
+            self.backend_s += backend_s; self.stored += 1
+
+    def clear(self):
+        self.cache.clear()
+
+    def stats(self) -> dict:
+        s = self.cache.stats()
+        with self._lock:
+            hits = self.exact_hits + self.near_hits
+            lookups = hits + self.misses
+            avg_backend = self.backend_s / self.stored if self.stored else 0.0
+            return {
+                "size": s["size"], "maxsize": s["maxsize"], "ttl_s": s["ttl_s"], "threshold": self.threshold, "word_threshold": self.word_threshold,
+                "exact_hits": self.exact_hits, "near_hits": self.near_hits, "misses": self.misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "evictions": s["evictions"], "expirations": s["expirations"],
+                "avg_backend_ms": round(avg_backend * 1000, 2),
+                "avg_lookup_ms": round(self.lookup_s / lookups * 1000, 3) if lookups else 0.0,
+                # each hit saved roughly one average model call
+                "saved_s": round(hits * avg_backend, 3),
+            }
+
+cache = AnswerCache()
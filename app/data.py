@@ -1,4 +1,12 @@
 # app/data.py
+import bisect, hashlib, json, os
+from dataclasses import asdict, dataclass
+from types import MappingProxyType
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+# Built-in seed catalog; TREKS_PATH (JSON: a list of treks, or {"treks": [...], "guides": {...},
+# "lodging": {...}}) replaces it at startup.
+TREKS_PATH = os.getenv("TREKS_PATH")
 
 TREKS = [
     {
@@ -69,3 +77,138 @@ LODGING = {
         {"type": "Campsites", "price_range": "$10-25/night"},
     ],
 }
+
+# ----- catalog -----
+@dataclass(frozen=True, slots=True)
+class TrekRecord:
+    id: int
+    name: str
+    difficulty: str
+    altitude: int
+    duration: int
+    location: str
+    bestSeason: str
+    highlights: Tuple[str, ...]
+    gear: Tuple[str, ...]
+    cost_min: int
+    cost_max: int
+    riskLevel: str
+    ai_base: int
+
+    @classmethod
+    def from_dict(cls, t: dict) -> "TrekRecord":
+        return cls(int(t["id"]), t["name"], t["difficulty"], int(t["altitude"]), int(t["duration"]), t["location"],
+                   t["bestSeason"], tuple(t.get("highlights", ())), tuple(t.get("gear", ())),
+                   int(t["cost_min"]), int(t["cost_max"]), t["riskLevel"], int(t.get("ai_base", 70)))
+
+    def as_dict(self) -> dict:
+        d = asdict(self)
+        d["highlights"], d["gear"] = list(self.highlights), list(self.gear)
+        return d
+
+def _key(location: str) -> str:
+    return location.strip().casefold()
+
+class Catalog:
+    """
+    Immutable, indexed view of the treks (ordered by id). Filters resolve through the id, location,
+    difficulty and altitude indexes instead of scanning, and every trek's TrekOut JSON is serialized
+    once up front, so /treks only joins byte strings.
+    """
+    def __init__(self, treks: Iterable[dict], guides: Mapping[str, list] = GUIDES, lodging: Mapping[str, list] = LODGING):
+        self.records: Tuple[TrekRecord, ...] = tuple(sorted((TrekRecord.from_dict(t) for t in treks), key=lambda r: r.id))
+        self._pos: Dict[int, int] = {r.id: i for i, r in enumerate(self.records)}
+        if len(self._pos) != len(self.records):
+            raise ValueError("duplicate trek ids")
+        self._by_location: Dict[str, Tuple[int, ...]] = self._group(lambda r: _key(r.location))
+        self._by_difficulty: Dict[str, Tuple[int, ...]] = self._group(lambda r: r.difficulty)
+        order = sorted(range(len(self.records)), key=lambda i: self.records[i].altitude)
+        self._alt_sorted = [self.records[i].altitude for i in order]
+        self._alt_pos = order
+        self.dicts: Tuple[dict, ...] = tuple(r.as_dict() for r in self.records)
+        self._json: Tuple[bytes, ...] = tuple(json.dumps({**d, "aiScore": None}, separators=(",", ":")).encode() for d in self.dicts)
+        self.body = b"[" + b",".join(self._json) + b"]"
+        self.version = hashlib.sha1(self.body).hexdigest()[:16]
+        self.guides = MappingProxyType({_key(k): tuple(v) for k, v in guides.items()})
+        self.lodging = MappingProxyType({_key(k): tuple(v) for k, v in lodging.items()})
+        self._plans: Dict[int, bytes] = {}   # filled on first request; the catalog never changes
+
+    def _group(self, key) -> Dict[str, Tuple[int, ...]]:
+        out: Dict[str, List[int]] = {}
+        for i, r in enumerate(self.records): out.setdefault(key(r), []).append(i)
+        return {k: tuple(v) for k, v in out.items()}
+
+    @classmethod
+    def load(cls, path: Optional[str] = None) -> "Catalog":
+        path = path or TREKS_PATH
+        if not path: return cls(TREKS)
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, list): return cls(data)
+        return cls(data["treks"], data.get("guides", GUIDES), data.get("lodging", LODGING))
+
+    def __len__(self):
+        return len(self.records)
+
+    def get(self, trek_id: int) -> Optional[TrekRecord]:
+        i = self._pos.get(trek_id)
+        return None if i is None else self.records[i]
+
+    def json(self, trek_id: int) -> Optional[bytes]:
+        i = self._pos.get(trek_id)
+        return None if i is None else self._json[i]
+
+    def filter(self, location: Optional[str] = None, difficulty: Optional[str] = None,
+               min_altitude: Optional[int] = None, max_altitude: Optional[int] = None) -> Sequence[int]:
+        """Positions (in id order) of the treks matching every given filter."""
+        sets = []
+        if location is not None: sets.append(self._by_location.get(_key(location), ()))
+        if difficulty is not None: sets.append(self._by_difficulty.get(difficulty, ()))
+        if min_altitude is not None or max_altitude is not None:
+            lo = bisect.bisect_left(self._alt_sorted, min_altitude) if min_altitude is not None else 0
+            hi = bisect.bisect_right(self._alt_sorted, max_altitude) if max_altitude is not None else len(self._alt_sorted)
+            sets.append(self._alt_pos[lo:hi])
+        if not sets: return range(len(self.records))
+        sets.sort(key=len)
+        hit = set(sets[0]).intersection(*sets[1:])
+        return sorted(hit)
+
+    def page_json(self, positions: Sequence[int], offset: int, limit: int) -> bytes:
+        if isinstance(positions, range) and offset == 0 and limit >= len(positions):
+            return self.body
+        return b"[" + b",".join(self._json[i] for i in positions[offset:offset + limit]) + b"]"
+
+    def guides_for(self, location: str) -> list:
+        return list(self.guides.get(_key(location), ()))
+
+    def lodging_for(self, location: str) -> list:
+        return list(self.lodging.get(_key(location), ()))
+
+    def plan(self, trek_id: int) -> Optional[dict]:
+        """Dashboard bundle: trek details + guides + lodging + safety notes."""
+        rec = self.get(trek_id)
+        if not rec: return None
+        return {
+            "trek": self.dicts[self._pos[trek_id]],
+            "guides": self.guides_for(rec.location),
+            "lodging": self.lodging_for(rec.location),
+            "safety_recs": [
+                "Altitude acclimatization required" if rec.altitude >= 3000 else "Standard acclimatization",
+                "Weather monitoring essential",
+                "Emergency evacuation insurance recommended"
+            ]
+        }
+
+    def plan_json(self, trek_id: int) -> Optional[bytes]:
+        body = self._plans.get(trek_id)
+        if body is None and trek_id in self._pos:
+            body = self._plans[trek_id] = json.dumps(self.plan(trek_id), separators=(",", ":")).encode()
+        return body
+
+catalog = Catalog(TREKS)
+
+def load_catalog(path: Optional[str] = None) -> Catalog:
+    """(Re)build the catalog, e.g. at startup; readers pick up the new one on their next lookup."""
+    global catalog
+    catalog = Catalog.load(path)
+    return catalog
@@ -1,12 +1,10 @@
-import sqlite3
-from typing import Any, Dict
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
-DB_PATH = "safety.db"
+from . import storage
 
 def _conn():
-    con = sqlite3.connect(DB_PATH)
-    con.row_factory = sqlite3.Row
-    return con
+    return storage.connect()
 
 def init_db():
     con = _conn(); cur = con.cursor()
@@ -25,39 +23,200 @@ def init_db():
         reason TEXT NOT NULL,
         source TEXT NOT NULL,
         features_json TEXT,
-        created_at TEXT NOT NULL
+        created_at TEXT NOT NULL,
+        hit_count INTEGER NOT NULL DEFAULT 1
     );
     """)
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_assess_date ON assessments(date);")
+    # databases created before hit_count existed
+    cols = {r["name"] for r in cur.execute("PRAGMA table_info(assessments);").fetchall()}
+    if "hit_count" not in cols:
+        cur.execute("ALTER TABLE assessments ADD COLUMN hit_count INTEGER NOT NULL DEFAULT 1;")
+    # history filters: date range (+ box, checked inside the index), label (+ keyset on created_at, id);
+    # ids come from reserved blocks and are not in time order, so history pages by (created_at, id)
+    cur.execute("DROP INDEX IF EXISTS idx_assess_date;")   # prefix of idx_assess_date_coords
+    cur.execute("DROP INDEX IF EXISTS idx_assess_label_id;")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_assess_date_coords ON assessments(date, lat, lon);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_assess_created ON assessments(created_at);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_assess_label_created ON assessments(label, created_at);")
     cur.execute("CREATE INDEX IF NOT EXISTS idx_assess_coords ON assessments(lat, lon);")
-    con.commit(); con.close()
+    con.commit()
 
-def insert_assessment(rec: Dict[str, Any]) -> int:
+_COLUMNS = ("id","lat","lon","date","elevation_m","avalanche_pct","blizzard_pct","landslide_pct",
+            "overall_pct","label","reason","source","features_json","hit_count","created_at")
+
+def as_row(rec: Dict[str, Any], rid: int | None = None, created_at: str | None = None) -> dict:
+    # flatten an assessment record ({lat, lon, date, elevation_m, risk: {...}, features_json}) into table columns
+    r = rec["risk"]
+    return {
+        "id": rid, "lat": rec["lat"], "lon": rec["lon"], "date": rec["date"], "elevation_m": rec.get("elevation_m"),
+        "avalanche_pct": r["avalanche_pct"], "blizzard_pct": r["blizzard_pct"], "landslide_pct": r["landslide_pct"],
+        "overall_pct": r["overall_pct"], "label": r["label"], "reason": r["reason"], "source": r["source"],
+        "features_json": rec.get("features_json"), "hit_count": 1, "created_at": created_at,
+    }
+
+# id NULL -> AUTOINCREMENT, created_at NULL -> now
+_INSERT_SQL = f"""
+    INSERT INTO assessments ({",".join(_COLUMNS)})
+    VALUES ({",".join("?" * (len(_COLUMNS) - 1))}, COALESCE(?, datetime('now')));
+"""
+
+def insert_assessment(rec: Dict[str, Any], durable: bool = False) -> int:
+    """Synchronous insert in its own transaction; durable=True also fsyncs before returning."""
     con = _conn(); cur = con.cursor()
-    cur.execute("""
-    INSERT INTO assessments
-    (lat,lon,date,elevation_m,avalanche_pct,blizzard_pct,landslide_pct,overall_pct,label,reason,source,features_json,created_at)
-    VALUES (?,?,?,?,?,?,?,?,?,?,?,?,datetime('now'));
-    """, (
-        rec["lat"], rec["lon"], rec["date"], rec.get("elevation_m"),
-        rec["risk"]["avalanche_pct"], rec["risk"]["blizzard_pct"], rec["risk"]["landslide_pct"],
-        rec["risk"]["overall_pct"], rec["risk"]["label"], rec["risk"]["reason"], rec["risk"]["source"],
-        rec.get("features_json"),
-    ))
-    rid = cur.lastrowid
-    con.commit(); con.close()
+    if durable: con.execute("PRAGMA synchronous=FULL;")
+    try:
+        row = as_row(rec)
+        cur.execute(_INSERT_SQL, tuple(row[c] for c in _COLUMNS))
+        rid = cur.lastrowid
+        con.commit()
+    finally:
+        if durable: con.execute("PRAGMA synchronous=NORMAL;")
     return rid
 
+def insert_rows(rows: List[dict]):
+    """Bulk insert of as_row() dicts (ids already allocated) in one transaction."""
+    con = _conn()
+    try:
+        con.executemany(_INSERT_SQL, [tuple(r[c] for c in _COLUMNS) for r in rows])
+        con.commit()
+    except Exception:
+        con.rollback()
+        raise
+
+def add_hits(hits: Dict[int, int]):
+    """hit_count += n for {id: n}; used when repeated identical assessments are folded into one row."""
+    if not hits: return
+    con = _conn()
+    try:
+        con.executemany("UPDATE assessments SET hit_count=hit_count+? WHERE id=?;", [(n, i) for i, n in hits.items()])
+        con.commit()
+    except Exception:
+        con.rollback()
+        raise
+
+def insert_batch(rows: List[dict]) -> List[int]:
+    """Give as_row() dicts fresh ids and store them with one bulk insert."""
+    if not rows: return []
+    ids = reserve_ids(len(rows))
+    for r, i in zip(rows, ids): r["id"] = i
+    insert_rows(rows)
+    return list(ids)
+
+def reserve_ids(n: int) -> range:
+    """
+    Claim n assessment ids by advancing the AUTOINCREMENT counter in sqlite_sequence.
+    Atomic across threads and processes; ids handed out later by AUTOINCREMENT never collide.
+    """
+    con = _conn()
+    con.execute("BEGIN IMMEDIATE;")
+    try:
+        row = con.execute("SELECT seq FROM sqlite_sequence WHERE name='assessments';").fetchone()
+        top = con.execute("SELECT COALESCE(MAX(id), 0) FROM assessments;").fetchone()[0]
+        start = max(row["seq"] if row else 0, top) + 1
+        if row:
+            con.execute("UPDATE sqlite_sequence SET seq=? WHERE name='assessments';", (start + n - 1,))
+        else:
+            con.execute("INSERT INTO sqlite_sequence(name, seq) VALUES ('assessments', ?);", (start + n - 1,))
+        con.commit()
+    except Exception:
+        con.rollback()
+        raise
+    return range(start, start + n)
+
 def get_assessment(assess_id: int) -> dict | None:
     con = _conn()
     row = con.execute("SELECT * FROM assessments WHERE id=?", (assess_id,)).fetchone()
-    con.close()
     return dict(row) if row else None
 
-def list_history(limit: int = 20) -> list[dict]:
-    con = _conn()
-    rows = con.execute(
-        "SELECT id,lat,lon,date,overall_pct,label,created_at FROM assessments ORDER BY id DESC LIMIT ?;", (limit,)
+# ----- history queries -----
+HISTORY_COLUMNS = ("id", "lat", "lon", "date", "elevation_m", "overall_pct", "label", "source", "hit_count", "created_at")
+
+Cursor = Tuple[str, int]   # (created_at, id) of the last row seen
+
+def cursor_of(row: dict) -> str:
+    return f"{row['created_at'].replace(' ', 'T')}~{row['id']}"
+
+def parse_cursor(s: str) -> Cursor:
+    """Inverse of cursor_of; ValueError if malformed."""
+    ts, _, rid = s.partition("~")
+    if len(ts) != 19 or ts[10] != "T": raise ValueError("bad cursor")
+    return ts.replace("T", " "), int(rid)
+
+def sort_key(row: dict) -> Cursor:
+    return row["created_at"], row["id"]
+
+@dataclass(frozen=True)
+class HistoryFilter:
+    date_from: Optional[str] = None
+    date_to: Optional[str] = None
+    bbox: Optional[Tuple[float, float, float, float]] = None   # south, west, north, east
+    label: Optional[str] = None
+
+    def where(self, before: Optional[Cursor] = None) -> Tuple[str, list]:
+        sql, args = [], []
+        if before is not None: sql.append("(created_at, id) < (?, ?)"); args += before
+        if self.date_from: sql.append("date >= ?"); args.append(self.date_from)
+        if self.date_to: sql.append("date <= ?"); args.append(self.date_to)
+        if self.bbox:
+            s, w, n, e = self.bbox
+            sql.append("lat BETWEEN ? AND ? AND lon BETWEEN ? AND ?"); args += [s, n, w, e]
+        if self.label: sql.append("label = ?"); args.append(self.label)
+        return (" WHERE " + " AND ".join(sql) if sql else ""), args
+
+    def matches(self, row: dict) -> bool:
+        # same test in Python, for rows still in the write-behind buffer
+        if self.date_from and row["date"] < self.date_from: return False
+        if self.date_to and row["date"] > self.date_to: return False
+        if self.bbox:
+            s, w, n, e = self.bbox
+            if not (s <= row["lat"] <= n and w <= row["lon"] <= e): return False
+        return not self.label or row["label"] == self.label
+
+def list_history(limit: int = 20, before: Optional[Cursor] = None, f: HistoryFilter = HistoryFilter()) -> list[dict]:
+    """Newest first; pass sort_key() of the last row seen as before for the next page (keyset, no OFFSET)."""
+    where, args = f.where(before)
+    rows = _conn().execute(
+        f"SELECT {','.join(HISTORY_COLUMNS)} FROM assessments{where} ORDER BY created_at DESC, id DESC LIMIT ?;",
+        (*args, limit)
     ).fetchall()
-    con.close()
     return [dict(r) for r in rows]
+
+def iter_history(f: HistoryFilter = HistoryFilter(), page: int = 1000) -> Iterator[List[dict]]:
+    """Every matching row, newest first, as pages of keyset queries (no cursor held open between pages)."""
+    before = None
+    while True:
+        rows = list_history(page, before, f)
+        if not rows: return
+        yield rows
+        before = sort_key(rows[-1])
+
+def _floor(expr: str) -> str:
+    # floor() without relying on SQLite's optional math functions
+    return f"(CAST({expr} AS INTEGER) - ({expr} < CAST({expr} AS INTEGER)))"
+
+def aggregate_history(group_by: str, f: HistoryFilter = HistoryFilter(), cell_deg: float = 0.1) -> list[dict]:
+    """Counts and mean risk per label, month ('YYYY-MM') or grid cell, computed in SQL."""
+    if group_by == "label":
+        keys = {"label": "label"}
+    elif group_by == "month":
+        keys = {"month": "substr(date, 1, 7)"}
+    elif group_by == "cell":
+        deg = float(cell_deg)   # a float literal, safe to inline
+        keys = {"cell_lat": _floor(f"lat / {deg!r}"), "cell_lon": _floor(f"lon / {deg!r}")}
+    else:
+        raise ValueError(f"cannot group by {group_by!r}")
+    where, args = f.where()
+    sql = f"""
+        SELECT {", ".join(f"{expr} AS {k}" for k, expr in keys.items())}, COUNT(*) AS rows, SUM(hit_count) AS assessments,
+               ROUND(AVG(overall_pct), 2) AS mean_overall_pct, MAX(overall_pct) AS max_overall_pct,
+               ROUND(AVG(avalanche_pct), 2) AS mean_avalanche_pct, ROUND(AVG(blizzard_pct), 2) AS mean_blizzard_pct,
+               ROUND(AVG(landslide_pct), 2) AS mean_landslide_pct
+        FROM assessments{where}
+        GROUP BY {", ".join(keys)}
+        ORDER BY {", ".join(keys)};
+    """
+    rows = [dict(r) for r in _conn().execute(sql, args).fetchall()]
+    if group_by == "cell":
+        for r in rows:   # cell index -> south-west corner
+            r["cell_lat"], r["cell_lon"] = round(r["cell_lat"] * cell_deg, 6), round(r["cell_lon"] * cell_deg, 6)
+    return rows
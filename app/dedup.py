@@ -0,0 +1,93 @@
+import math
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+import numpy as np
+from rapidfuzz import fuzz, process
+
+@dataclass(frozen=True)
+class DedupConfig:
+    radius_m: float = 200.0        # max distance between two copies of the same place
+    min_similarity: float = 90.0   # rapidfuzz ratio (0-100) on lower-cased names
+
+DEFAULT = DedupConfig()
+
+# a duplicate is either an existing places row or an earlier item of the same batch
+Ref = Tuple[str, int]   # ("db", place id) | ("batch", item index)
+
+def _haversine_np(lat, lon, lats, lons):
+    R = 6371000.0
+    p1, p2 = np.radians(lat), np.radians(lats)
+    a = np.sin((p2-p1)/2)**2 + np.cos(p1)*np.cos(p2)*np.sin(np.radians(lons-lon)/2)**2
+    return 2*R*np.arcsin(np.sqrt(a))
+
+class _Grid:
+    """Buckets points into cells at least radius_m wide, so matches are always in the 3x3 neighbourhood."""
+    def __init__(self, radius_m: float, max_abs_lat: float):
+        self.dlat = radius_m / 111320.0
+        self.dlon = radius_m / (111320.0 * max(math.cos(math.radians(min(max_abs_lat, 89.9))), 1e-6))
+
+    def cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return (math.floor(lat / self.dlat), math.floor(lon / self.dlon))
+
+    def bbox(self, c: Tuple[int, int]) -> Tuple[float, float, float, float]:
+        # cell extent grown by one cell on every side
+        return ((c[0]-1) * self.dlat, (c[0]+2) * self.dlat, (c[1]-1) * self.dlon, (c[1]+2) * self.dlon)
+
+    def around(self, c: Tuple[int, int]):
+        for dy in (-1, 0, 1):
+            for dx in (-1, 0, 1):
+                yield (c[0]+dy, c[1]+dx)
+
+def _existing(cur, box) -> List[tuple]:
+    rows = cur.execute("""
+        SELECT p.id, p.name, p.kind, p.lat, p.lon FROM places_rtree r CROSS JOIN places p ON p.id = r.id
+        WHERE r.max_lat >= ? AND r.min_lat <= ? AND r.max_lon >= ? AND r.min_lon <= ?;
+    """, box).fetchall()
+    return [tuple(r) for r in rows]
+
+def find_duplicates(cur, rows: List[Tuple[int, tuple]], cfg: DedupConfig = DEFAULT) -> Dict[int, Ref]:
+    """
+    rows: (item index, places row tuple as built by places_db._row) for items that are not
+    already known by (source, source_id). Returns {item index: Ref} for every near-duplicate.
+
+    Existing places are fetched once per occupied grid cell through the R*Tree and scored as a
+    block with rapidfuzz.process.cdist; items are also matched against earlier items of the batch.
+    """
+    if not rows: return {}
+    grid = _Grid(cfg.radius_m, max(abs(r[4]) for _, r in rows))
+    cells: Dict[Tuple[int, int], List[Tuple[int, tuple]]] = defaultdict(list)
+    for i, r in rows:
+        cells[grid.cell(r[4], r[5])].append((i, r))
+
+    out: Dict[int, Ref] = {}
+    for c, block in cells.items():
+        cand = _existing(cur, grid.bbox(c))
+        if not cand: continue
+        ids = np.array([x[0] for x in cand])
+        kinds = np.array([x[2] for x in cand], dtype=object)
+        lats = np.array([x[3] for x in cand], dtype=float)
+        lons = np.array([x[4] for x in cand], dtype=float)
+        sim = process.cdist([r[2] for _, r in block], [x[1] or "" for x in cand],
+                            scorer=fuzz.ratio, processor=str.lower, score_cutoff=cfg.min_similarity)
+        for k, (i, r) in enumerate(block):
+            ok = (sim[k] >= cfg.min_similarity) & (kinds == r[3])
+            if not ok.any(): continue
+            ok &= _haversine_np(r[4], r[5], lats, lons) <= cfg.radius_m
+            if ok.any():
+                out[i] = ("db", int(ids[np.argmax(np.where(ok, sim[k], -1))]))
+
+    # within the batch: first occurrence wins, later copies merge into it
+    kept: Dict[Tuple[int, int], List[Tuple[int, tuple]]] = defaultdict(list)
+    for i, r in rows:
+        c = grid.cell(r[4], r[5])
+        if i not in out:
+            near = [(j, q) for n in grid.around(c) for j, q in kept.get(n, ())
+                    if q[3] == r[3] and float(_haversine_np(r[4], r[5], q[4], q[5])) <= cfg.radius_m]
+            best = process.extractOne(r[2], [q[2] for _, q in near], scorer=fuzz.ratio,
+                                      processor=str.lower, score_cutoff=cfg.min_similarity) if near else None
+            if best:
+                out[i] = ("batch", near[best[2]][0]); continue
+            kept[c].append((i, r))
+    return out
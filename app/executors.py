@@ -0,0 +1,153 @@
+import asyncio, contextlib, functools, os, time
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Dict, Optional, Tuple, TypeVar
+
+# Where request work runs. Handlers are async; anything that blocks goes to a pool sized for it:
+#   db      SQLite work of request handlers (DB_WORKERS threads, at most DB_QUEUE calls waiting)
+#   ingest  bulk upserts of ingest jobs (INGEST_DB_WORKERS threads), so a big ingest can't take the
+#           threads /risk/* needs
+# Slow non-SQLite waits (LLM calls, tile rendering) stay on the default threadpool.
+# Routes also get a Limiter each (ROUTE_LIMITS); past its queue a request is shed with
+# 503 + Retry-After instead of piling up behind the others.
+
+DB_WORKERS = int(os.getenv("DB_WORKERS", "8"))
+DB_QUEUE = int(os.getenv("DB_QUEUE", "256"))
+INGEST_DB_WORKERS = int(os.getenv("INGEST_DB_WORKERS", "2"))
+RETRY_AFTER_S = int(os.getenv("RETRY_AFTER_S", "2"))
+
+# route -> (concurrency, queue); override with ROUTE_LIMITS="assess=64:256,ingest=1:2"
+ROUTE_LIMITS: Dict[str, Tuple[int, int]] = {
+    "assess": (256, 1024),
+    "assess_batch": (4, 16),
+    "history": (16, 64),
+    "export": (2, 4),
+    "places": (32, 128),
+    "chat": (16, 64),
+    "tiles": (8, 64),
+    "ingest": (2, 4),
+    "admin": (1, 0),
+}
+for part in filter(None, os.getenv("ROUTE_LIMITS", "").split(",")):
+    name, _, spec = part.partition("=")
+    conc, _, queue = spec.partition(":")
+    ROUTE_LIMITS[name.strip()] = (int(conc), int(queue or 0))
+
+T = TypeVar("T")
+
+class Overloaded(Exception):
+    def __init__(self, what: str, retry_after_s: int = RETRY_AFTER_S):
+        super().__init__(f"{what} is overloaded, retry later")
+        self.retry_after_s = retry_after_s
+
+class Limiter:
+    """At most `concurrency` holders and `queue` waiters; one more waiter raises Overloaded."""
+    def __init__(self, name: str, concurrency: int, queue: Optional[int], retry_after_s: int = RETRY_AFTER_S):
+        self.name, self.concurrency, self.queue, self.retry_after_s = name, concurrency, queue, retry_after_s
+        self._sem: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.active = self.waiting = 0
+        self.served = self.shed = 0
+        self.wait_s = 0.0
+
+    def _bind(self):
+        # asyncio primitives belong to one loop; a new loop (e.g. another test client) starts afresh
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop, self._sem = loop, asyncio.Semaphore(self.concurrency)
+            self.active = self.waiting = 0
+
+    def check(self):
+        """Raise Overloaded if an acquire() now would be shed; holds nothing."""
+        self._bind()
+        if self._sem.locked() and self.queue is not None and self.waiting >= self.queue:
+            self.shed += 1
+            raise Overloaded(self.name, self.retry_after_s)
+
+    async def acquire(self):
+        self.check()
+        self.waiting += 1
+        t0 = time.perf_counter()
+        try:
+            await self._sem.acquire()
+        finally:
+            self.waiting -= 1
+        self.wait_s += time.perf_counter() - t0
+        self.active += 1
+
+    def release(self):
+        self.active -= 1; self.served += 1
+        self._sem.release()
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+    def stats(self) -> dict:
+        return {"concurrency": self.concurrency, "queue": self.queue, "active": self.active, "waiting": self.waiting,
+                "served": self.served, "shed": self.shed,
+                "avg_wait_ms": round(self.wait_s / self.served * 1000, 3) if self.served else 0.0}
+
+class Pool:
+    """A ThreadPoolExecutor behind a Limiter: awaitable calls, bounded backlog."""
+    def __init__(self, name: str, workers: int, queue: Optional[int]):
+        self.name, self.workers = name, workers
+        self.limiter = Limiter(name, workers, queue)
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    async def run(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix=self.name)
+        async with self.limiter:
+            return await asyncio.get_running_loop().run_in_executor(self._pool, functools.partial(fn, *args, **kwargs))
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+db = Pool("db", DB_WORKERS, DB_QUEUE)
+ingest = Pool("ingest-db", INGEST_DB_WORKERS, None)   # background work waits, it is never shed
+routes = {name: Limiter(name, c, q) for name, (c, q) in ROUTE_LIMITS.items()}
+
+def limited(route: str):
+    """Decorator for async handlers: run under routes[route]."""
+    limiter = routes[route]
+    def deco(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            async with limiter:
+                return await fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+async def streaming(route: str, body: AsyncIterator[T]) -> AsyncIterator[T]:
+    """
+    A StreamingResponse body under routes[route]. The slot is taken here, before the response is
+    built, so an overloaded route answers 503 before any headers go out and two requests can't both
+    pass admission for one slot. It is released when the body ends or is closed - and, since the
+    wrapper is already started, also when a body that is never iterated is garbage collected (the
+    loop's async generator hooks aclose() it).
+    """
+    limiter = routes[route]
+    await limiter.acquire()
+    async def held():
+        try:
+            yield None   # primed below
+            async with contextlib.aclosing(body):
+                async for item in body:
+                    yield item
+        finally:
+            limiter.release()
+    gen = held()
+    await gen.__anext__()
+    return gen
+
+def stats() -> dict:
+    return {"db": db.limiter.stats(), "ingest_db": ingest.limiter.stats(),
+            "routes": {name: l.stats() for name, l in routes.items()}}
+
+def shutdown():
+    db.shutdown(); ingest.shutdown()
@@ -0,0 +1,258 @@
+import asyncio, json, math, os, uuid
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from . import executors, osm, places_db, scraper
+
+# Region ingest: a bbox or trek polyline is tiled into square cells, each fetched as one
+# Overpass "around" query (circle through the cell corners) and streamed into bulk_upsert
+# in BATCH_SIZE chunks, so memory stays flat however dense the tile is.
+# Tile state lives in SQLite, so an interrupted job resumes from its unfinished tiles.
+# Outcome counters are kept per tile and added to the job when the tile finishes, so a tile
+# that is re-run after a failure or crash is counted once.
+# A crawl (POST /ingest/scrape) runs as a job of a single tile whose spec has "type": "scrape".
+# Jobs are queued: at most MAX_RUNNING_JOBS run at once, the rest wait as 'queued', and past
+# MAX_QUEUED_JOBS new jobs are refused (executors.Overloaded -> 503). Their writes go to the
+# ingest executor, never to the threads request handlers use.
+
+TILE_M = 5000
+MAX_TILES = 5000
+MAX_SAMPLES = 4 * MAX_TILES   # polyline points after densifying every half tile
+MAX_CONCURRENCY = 8
+BATCH_SIZE = 500
+MAX_RUNNING_JOBS = int(os.getenv("INGEST_MAX_RUNNING_JOBS", "2"))
+MAX_QUEUED_JOBS = int(os.getenv("INGEST_MAX_QUEUED_JOBS", "32"))
+
+_COUNTERS = ("inserted", "updated", "merged", "failed")
+
+_tasks: Dict[str, "asyncio.Task[None]"] = {}
+_slots = executors.Limiter("ingest-jobs", MAX_RUNNING_JOBS, None)
+
+def init_db():
+    con = places_db._conn(); cur = con.cursor()
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS ingest_jobs(
+        id TEXT PRIMARY KEY,
+        status TEXT NOT NULL,          -- 'queued' | 'running' | 'done' | 'partial'
+        spec TEXT NOT NULL,            -- JSON request (bbox / polyline, kinds, tile_m)
+        kinds TEXT NOT NULL,           -- JSON list
+        concurrency INTEGER NOT NULL,
+        tiles_total INTEGER NOT NULL,
+        tiles_done INTEGER NOT NULL DEFAULT 0,
+        tiles_failed INTEGER NOT NULL DEFAULT 0,
+        fetched INTEGER NOT NULL DEFAULT 0,
+        inserted INTEGER NOT NULL DEFAULT 0,
+        updated INTEGER NOT NULL DEFAULT 0,
+        merged INTEGER NOT NULL DEFAULT 0,
+        failed INTEGER NOT NULL DEFAULT 0,
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL
+    );
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS ingest_tiles(
+        job_id TEXT NOT NULL,
+        idx INTEGER NOT NULL,
+        lat REAL NOT NULL,
+        lon REAL NOT NULL,
+        radius_m INTEGER NOT NULL,
+        status TEXT NOT NULL,          -- 'pending' | 'done' | 'failed'
+        fetched INTEGER NOT NULL DEFAULT 0,
+        error TEXT,
+        inserted INTEGER NOT NULL DEFAULT 0,
+        updated INTEGER NOT NULL DEFAULT 0,
+        merged INTEGER NOT NULL DEFAULT 0,
+        failed INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY(job_id, idx)
+    );
+    """)
+    # databases created before the per-tile counters existed
+    cols = {r["name"] for r in cur.execute("PRAGMA table_info(ingest_tiles);").fetchall()}
+    for c in _COUNTERS:
+        if c not in cols:
+            cur.execute(f"ALTER TABLE ingest_tiles ADD COLUMN {c} INTEGER NOT NULL DEFAULT 0;")
+    con.commit()
+
+# ----- tiling -----
+def _grid(tile_m: float, ref_lat: float) -> Tuple[float, float]:
+    dlat = tile_m / 111320.0
+    return dlat, tile_m / (111320.0 * max(math.cos(math.radians(ref_lat)), 1e-6))
+
+def _tile_radius(tile_m: float) -> int:
+    return int(math.ceil(tile_m * math.sqrt(2) / 2))
+
+def tiles_for_bbox(min_lat: float, min_lon: float, max_lat: float, max_lon: float, tile_m: float = TILE_M) -> List[Tuple[float, float]]:
+    dlat, dlon = _grid(tile_m, (min_lat + max_lat) / 2)
+    rows = max(1, math.ceil((max_lat - min_lat) / dlat))
+    cols = max(1, math.ceil((max_lon - min_lon) / dlon))
+    # checked before building anything: a continent at 1 km would be hundreds of millions of tuples
+    if rows * cols > MAX_TILES: raise ValueError(f"region needs {rows * cols} tiles (max {MAX_TILES}); use a larger tile_m")
+    return [(min_lat + (r + 0.5) * dlat, min_lon + (c + 0.5) * dlon) for r in range(rows) for c in range(cols)]
+
+def tiles_for_polyline(points: List[Tuple[float, float]], buffer_m: float = 2000, tile_m: float = TILE_M) -> List[Tuple[float, float]]:
+    """Cells of a global grid that come within buffer_m of the polyline (densified every half tile)."""
+    ref_lat = sum(p[0] for p in points) / len(points)
+    dlat, dlon = _grid(tile_m, ref_lat)
+    blat, blon = buffer_m / 111320.0, buffer_m / (111320.0 * max(math.cos(math.radians(ref_lat)), 1e-6))
+    segs = [(la1, lo1, la2, lo2, max(1, math.ceil(places_db._haversine(la1, lo1, la2, lo2) / (tile_m / 2))))
+            for (la1, lo1), (la2, lo2) in zip(points, points[1:])]
+    # every cell is reached by a sample; past this many samples the route can't fit in MAX_TILES
+    n_samples = 1 + sum(s[4] for s in segs)
+    if n_samples > MAX_SAMPLES: raise ValueError(f"polyline too long for tile_m={tile_m:g} ({n_samples} samples, max {MAX_SAMPLES}); use a larger tile_m")
+    samples = [points[0]]
+    for la1, lo1, la2, lo2, n in segs:
+        samples += [(la1 + (la2-la1) * k / n, lo1 + (lo2-lo1) * k / n) for k in range(1, n+1)]
+    cells = set()
+    for la, lo in samples:
+        for r in range(math.floor((la - blat) / dlat), math.floor((la + blat) / dlat) + 1):
+            for c in range(math.floor((lo - blon) / dlon), math.floor((lo + blon) / dlon) + 1):
+                cells.add((r, c))
+        if len(cells) > MAX_TILES: raise ValueError(f"region needs more than {MAX_TILES} tiles; use a larger tile_m or a smaller buffer_m")
+    return [((r + 0.5) * dlat, (c + 0.5) * dlon) for r, c in sorted(cells)]
+
+# ----- jobs -----
+def create_job(tiles: List[Tuple[float, float]], kinds: List[str], spec: Dict[str, Any],
+               tile_m: float = TILE_M, concurrency: int = 4, radius_m: Optional[int] = None) -> str:
+    """radius_m: fetch radius per tile (default: the circle through the tile corners)."""
+    if not tiles: raise ValueError("region produced no tiles")
+    if len(tiles) > MAX_TILES: raise ValueError(f"region needs {len(tiles)} tiles (max {MAX_TILES}); use a larger tile_m")
+    job_id = uuid.uuid4().hex
+    radius = radius_m or _tile_radius(tile_m)
+    con = places_db._conn(); cur = con.cursor()
+    cur.execute("""
+        INSERT INTO ingest_jobs(id,status,spec,kinds,concurrency,tiles_total,created_at,updated_at)
+        VALUES (?,'queued',?,?,?,?,datetime('now'),datetime('now'));
+    """, (job_id, json.dumps(spec), json.dumps(kinds), max(1, min(MAX_CONCURRENCY, concurrency)), len(tiles)))
+    cur.executemany("INSERT INTO ingest_tiles(job_id,idx,lat,lon,radius_m,status) VALUES (?,?,?,?,?,'pending');",
+                    [(job_id, i, la, lo, radius) for i, (la, lo) in enumerate(tiles)])
+    con.commit()
+    return job_id
+
+def create_scrape_job(spec: Dict[str, Any]) -> str:
+    """spec: urls, max_pages, max_depth, same_host, force (see scraper.Crawler)."""
+    return create_job([(0.0, 0.0)], [], {**spec, "type": "scrape"}, concurrency=1)
+
+def get_job(job_id: str) -> Optional[dict]:
+    con = places_db._conn()
+    row = con.execute("SELECT * FROM ingest_jobs WHERE id=?;", (job_id,)).fetchone()
+    if not row: return None
+    job = dict(row)
+    job["spec"] = json.loads(job["spec"]); job["kinds"] = json.loads(job["kinds"])
+    job["type"] = job["spec"].get("type", "osm")
+    job["progress"] = round(100.0 * (job["tiles_done"] + job["tiles_failed"]) / job["tiles_total"], 1)
+    return job
+
+def list_jobs(limit: int = 20) -> List[dict]:
+    con = places_db._conn()
+    rows = con.execute("SELECT id FROM ingest_jobs ORDER BY created_at DESC LIMIT ?;", (limit,)).fetchall()
+    return [j for j in (get_job(r["id"]) for r in rows) if j]
+
+def _set_status(job_id: str, status: str):
+    con = places_db._conn()
+    con.execute("UPDATE ingest_jobs SET status=?, updated_at=datetime('now') WHERE id=?;", (status, job_id))
+    con.commit()
+
+def _set_running(job_id: str):
+    con = places_db._conn()
+    # failed tiles from an earlier run are about to be retried
+    con.execute("UPDATE ingest_jobs SET status='running', tiles_failed=0, updated_at=datetime('now') WHERE id=?;", (job_id,))
+    con.commit()
+
+def _pending_tiles(job_id: str) -> List[dict]:
+    con = places_db._conn()
+    # failed tiles are retried on resume as well
+    rows = con.execute("SELECT * FROM ingest_tiles WHERE job_id=? AND status!='done' ORDER BY idx;", (job_id,)).fetchall()
+    return [dict(r) for r in rows]
+
+def _start_tile(job_id: str, idx: int):
+    # a retried tile (failed, or cut off by a crash) counts from zero again
+    con = places_db._conn()
+    con.execute(f"UPDATE ingest_tiles SET fetched=0, {', '.join(f'{c}=0' for c in _COUNTERS)} WHERE job_id=? AND idx=?;", (job_id, idx))
+    con.commit()
+
+def _store_batch(job_id: str, idx: int, items: List[dict]):
+    # upsert one streamed batch of a tile; its outcomes stay on the tile until the tile finishes
+    counts = dict.fromkeys(_COUNTERS, 0)
+    for o in places_db.bulk_upsert(items):
+        counts[o["status"]] += 1
+    con = places_db._conn()
+    con.execute("""
+        UPDATE ingest_tiles SET fetched=fetched+?, inserted=inserted+?, updated=updated+?, merged=merged+?, failed=failed+?
+        WHERE job_id=? AND idx=?;
+    """, (len(items), *counts.values(), job_id, idx))
+    con.commit()
+
+def _finish_tile(job_id: str, idx: int):
+    # one transaction: the tile is marked done and its counters are added to the job exactly once;
+    # a crash before this leaves the tile pending and the job counters untouched
+    con = places_db._conn(); cur = con.cursor()
+    cur.execute("UPDATE ingest_tiles SET status='done', error=NULL WHERE job_id=? AND idx=? AND status!='done';", (job_id, idx))
+    if cur.rowcount:
+        cur.execute("""
+            UPDATE ingest_jobs AS j SET tiles_done=j.tiles_done+1, fetched=j.fetched+t.fetched, inserted=j.inserted+t.inserted,
+                                        updated=j.updated+t.updated, merged=j.merged+t.merged, failed=j.failed+t.failed,
+                                        updated_at=datetime('now')
+            FROM (SELECT * FROM ingest_tiles WHERE job_id=? AND idx=?) AS t
+            WHERE j.id=?;
+        """, (job_id, idx, job_id))
+    con.commit()
+
+def _fail_tile(job_id: str, idx: int, error: str):
+    con = places_db._conn(); cur = con.cursor()
+    cur.execute("UPDATE ingest_tiles SET status='failed', error=? WHERE job_id=? AND idx=?;", (error, job_id, idx))
+    cur.execute("UPDATE ingest_jobs SET tiles_failed=tiles_failed+1, updated_at=datetime('now') WHERE id=?;", (job_id,))
+    con.commit()
+
+def _records(job: dict, t: dict) -> AsyncIterator[dict]:
+    spec = job["spec"]
+    if job["type"] == "scrape":
+        return scraper.Crawler(spec["urls"], spec["max_pages"], spec["max_depth"], spec["same_host"], spec["force"]).records()
+    return osm.aiter_osm(t["lat"], t["lon"], t["radius_m"], job["kinds"])
+
+async def run_job(job_id: str):
+    async with _slots:
+        await _run_job(job_id)
+
+async def _run_job(job_id: str):
+    job = await executors.ingest.run(get_job, job_id)
+    if not job: return
+    tiles = await executors.ingest.run(_pending_tiles, job_id)
+    await executors.ingest.run(_set_running, job_id)
+    sem = asyncio.Semaphore(job["concurrency"])
+
+    async def one(t):
+        async with sem:
+            await executors.ingest.run(_start_tile, job_id, t["idx"])
+            try:
+                async for batch in osm.abatched(_records(job, t), BATCH_SIZE):
+                    await executors.ingest.run(_store_batch, job_id, t["idx"], batch)
+            except Exception as e:
+                await executors.ingest.run(_fail_tile, job_id, t["idx"], f"{type(e).__name__}: {e}")
+                return
+            await executors.ingest.run(_finish_tile, job_id, t["idx"])
+
+    await asyncio.gather(*(one(t) for t in tiles))
+    job = await executors.ingest.run(get_job, job_id)
+    await executors.ingest.run(_set_status, job_id, "done" if job and job["tiles_done"] == job["tiles_total"] else "partial")
+
+def pending() -> int:
+    """Jobs started in this process and not finished (running or waiting for a slot)."""
+    return sum(1 for t in _tasks.values() if not t.done())
+
+def admit():
+    # called before creating a job, so a refused request leaves nothing behind
+    if pending() >= MAX_RUNNING_JOBS + MAX_QUEUED_JOBS:
+        raise executors.Overloaded("ingest job queue")
+
+def start(job_id: str):
+    # schedule on the running loop; keep a reference so the task is not garbage collected
+    if job_id in _tasks and not _tasks[job_id].done(): return
+    task = asyncio.get_running_loop().create_task(run_job(job_id))
+    _tasks[job_id] = task
+    task.add_done_callback(lambda _t: _tasks.pop(job_id, None))
+
+def resume_pending() -> List[str]:
+    """Restart jobs that were queued or running when the process stopped."""
+    con = places_db._conn()
+    ids = [r["id"] for r in con.execute("SELECT id FROM ingest_jobs WHERE status IN ('queued','running');").fetchall()]
+    for job_id in ids: start(job_id)
+    return ids
@@ -1,99 +1,243 @@
-import json
+import asyncio, csv, hashlib, hmac, io, itertools, json, logging, os, signal
 from . import places_db
-from .osm import fetch_osm
+from . import osm, ingest_jobs, scraper, search
+from . import chat as chat_engine
 
 
-from datetime import date as _date
-from fastapi import FastAPI, HTTPException, Query
+from datetime import date as _date, timedelta
+import numpy as np
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 
 from .schemas import (
-    AssessIn, AssessOut, RiskBreakdown, HistoryItem,
+    AssessIn, AssessOut, RiskBreakdown, HistoryItem, AssessBatchIn, AssessBatchOut,
     TrekOut, UserProfile, RecoResponse, ChatIn, ChatOut
 )
-from . import db
-from .risk import assess_stub
-from .data import TREKS, GUIDES, LODGING
-from .reco import get_recommendations
+from . import db, storage, write_behind, risk_cache, risk_tiles, maintenance, responses, executors
+from .executors import limited
+from .risk import label as risk_label
+from .risk_models import registry as risk_models
+from . import data
+from . import reco
 
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Any, List, Optional, Tuple
 
 app = FastAPI(title="Smart Trek Planner API", version="0.1")
+log = logging.getLogger(__name__)
 
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"], allow_methods=["*"], allow_headers=["*"],
 )
 
+# Handlers are async. SQLite work goes to executors.db, blocking non-DB work (LLM, tile rendering,
+# model reloads) to the default threadpool, and each busy route has a limiter that sheds with 503.
+@app.exception_handler(executors.Overloaded)
+async def overloaded(request: Request, exc: executors.Overloaded):
+    return JSONResponse({"detail": str(exc)}, status_code=503, headers={"Retry-After": str(exc.retry_after_s)})
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")   # unset: endpoints that require it are disabled
+
+def is_admin(authorization: str | None) -> bool:
+    # Authorization: Bearer <ADMIN_TOKEN>
+    scheme, _, token = (authorization or "").partition(" ")
+    return bool(ADMIN_TOKEN) and scheme.lower() == "bearer" and hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+def require_admin(authorization: str | None = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(403, "admin endpoint disabled (set ADMIN_TOKEN)")
+    if not is_admin(authorization):
+        raise HTTPException(401, "admin token required", headers={"WWW-Authenticate": "Bearer"})
+
 @app.on_event("startup")
 def startup():
+    data.load_catalog()
+    reco.warm()     # scoring columns + the 27 categorical profiles, before the first request
     db.init_db()
     places_db.init_db()
+    ingest_jobs.init_db()
+    scraper.init_db()
+    maintenance.init_db()
+    write_behind.writer.start()
+    maintenance.maintainer.start()
+    if hasattr(signal, "SIGHUP"):
+        # kill -HUP <pid>: rebuild the risk models from freshly imported code. The handler runs
+        # between bytecodes of whatever the main thread is doing, so it only schedules the reload
+        loop = asyncio.get_running_loop()
+        try:
+            signal.signal(signal.SIGHUP, lambda *_: loop.call_soon_threadsafe(_schedule_reload))
+        except ValueError:
+            pass   # not the main thread (e.g. under a test client)
+
+_reloads: set = set()   # running SIGHUP reloads, referenced so they are not garbage collected
+
+def _schedule_reload():
+    task = asyncio.get_running_loop().create_task(run_in_threadpool(_safe_reload))
+    _reloads.add(task)
+    task.add_done_callback(_reloads.discard)
+
+def _safe_reload():
+    try:
+        log.info("risk models reloaded: %s", risk_models.reload())
+    except Exception:
+        log.exception("risk model reload failed; keeping the current models")
+
+@app.on_event("startup")
+async def resume_ingest_jobs():
+    ingest_jobs.resume_pending()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await osm.aclose()
+    scraper.shutdown()
+    risk_models.shutdown()
+    maintenance.maintainer.stop()
+    write_behind.writer.stop()
+    executors.shutdown()
+    storage.close_all()
 
 @app.get("/")
-def root():
+async def root():
     return {"ok": True, "service": "smart-trek-planner"}
 
 # ----- TREKS -----
+# the trek reads below only touch the in-memory catalog, so they run on the event loop (no threadpool hop)
 @app.get("/treks", response_model=list[TrekOut])
-def list_treks():
+async def list_treks(
+    request: Request,
+    location: str | None = None,
+    difficulty: str | None = Query(None, pattern="^(easy|moderate|hard)$"),
+    min_altitude: int | None = None,
+    max_altitude: int | None = None,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+):
     # no scores here; just the catalog; frontend can show aiScore later
-    return [TrekOut(**t) for t in TREKS]
+    cat = data.catalog
+    hits = cat.filter(location, difficulty, min_altitude, max_altitude)
+    query = f"{location}|{difficulty}|{min_altitude}|{max_altitude}|{offset}|{limit}"
+    etag = f'"{cat.version}-{hashlib.sha1(query.encode()).hexdigest()[:8]}"'
+    extra = {"X-Total-Count": str(len(hits))}
+    if offset + limit < len(hits): extra["X-Next-Offset"] = str(offset + limit)
+    return responses.json_response(request, lambda: cat.page_json(hits, offset, limit), etag, immutable=True, **extra)
 
 @app.get("/treks/{trek_id}", response_model=TrekOut)
-def get_trek(trek_id: int):
-    for t in TREKS:
-        if t["id"] == trek_id:
-            return TrekOut(**t)
-    raise HTTPException(404, "trek not found")
+async def get_trek(trek_id: int, request: Request):
+    cat = data.catalog
+    body = cat.json(trek_id)
+    if body is None:
+        raise HTTPException(404, "trek not found")
+    return responses.json_response(request, body, f'"{cat.version}-{trek_id}"', immutable=True)
 
 # ----- RECOMMENDATIONS -----
 @app.post("/recommendations", response_model=RecoResponse)
-def recommendations(profile: UserProfile):
-    recs = get_recommendations(profile.model_dump())
-    return {"recommendations": recs}
+async def recommendations(profile: UserProfile, limit: int | None = Query(None, ge=1, le=500)):
+    return Response(reco.recommendations_json(profile.model_dump(), limit), media_type="application/json")
+
+@app.get("/recommendations/cache/stats")
+async def recommendations_cache_stats():
+    return reco.cache.stats()
 
 # ----- DASHBOARD BUNDLE (trek details + guides + lodging) -----
 @app.get("/treks/{trek_id}/plan")
-def plan_bundle(trek_id: int):
-    trek = next((t for t in TREKS if t["id"] == trek_id), None)
-    if not trek:
+async def plan_bundle(trek_id: int, request: Request):
+    cat = data.catalog
+    body = cat.plan_json(trek_id)
+    if body is None:
         raise HTTPException(404, "trek not found")
-    loc = trek["location"]
-    return {
-        "trek": trek,
-        "guides": GUIDES.get(loc, []),
-        "lodging": LODGING.get(loc, []),
-        "safety_recs": [
-            "Altitude acclimatization required" if trek["altitude"] >= 3000 else "Standard acclimatization",
-            "Weather monitoring essential",
-            "Emergency evacuation insurance recommended"
-        ]
-    }
+    return responses.json_response(request, body, f'"{cat.version}-plan-{trek_id}"', immutable=True)
 
 # ----- CHATBOT -----
 @app.post("/chat", response_model=ChatOut)
-def chat(payload: ChatIn):
-    reply, show_plan, trek_id = respond(payload.message, len(payload.history))
-    return ChatOut(reply=reply, showPlan=show_plan, selectedTrekId=trek_id)
+@limited("chat")
+async def chat(payload: ChatIn):
+    # threadpool: a model call can take seconds
+    reply, show_plan, trek_id, intent = await run_in_threadpool(chat_engine.respond, payload.message, payload.history)
+    return ChatOut(reply=reply, showPlan=show_plan, selectedTrekId=trek_id, intent=intent)
+
+@app.post("/chat/stream")
+async def chat_stream(payload: ChatIn, request: Request):
+    """
+    Server-Sent Events: `token` events ({"text"}) as the reply is produced, then one `done` event
+    carrying the ChatOut fields. The next piece is only pulled from the backend once the previous
+    one has been handed to the server, so a slow reader slows generation down instead of piling up
+    buffered tokens; when the client goes away the backend stream is closed.
+    """
+    events = chat_engine.stream(payload.message, payload.history)
+
+    async def sse():
+        try:
+            while True:
+                ev = await run_in_threadpool(next, events, None)
+                if ev is None or await request.is_disconnected(): break
+                kind, body = ev
+                yield f"event: {kind}\ndata: {json.dumps(body)}\n\n"
+        finally:
+            # sync close: after a cancellation an awaited call here would be cancelled too
+            events.close()
+
+    # the chat slot is held while the stream runs
+    return StreamingResponse(await executors.streaming("chat", sse()), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/chat/cache/stats")
+async def chat_cache_stats():
+    return chat_engine.answers.stats()
 
 # ----- SAFETY / RISK (coords) -----
 @app.post("/risk/assess", response_model=AssessOut)
-def assess(payload: AssessIn):
-    risk = assess_stub(
-        payload.lat, payload.lon, payload.date,
-        payload.elevation_m, payload.features or {}
-    )
+@limited("assess")
+async def assess(payload: AssessIn, durable: bool = False):
+    # Only a cache hit going into the write-behind buffer (memory, id block already reserved) stays on
+    # the loop. Scoring a miss (the model may be heavy) and anything that commits run on the db executor.
+    w = write_behind.writer
+    if durable or w.strict or not w.running or not w.ids_ready:
+        return await executors.db.run(_assess, payload, durable)
+    _, key = _risk_key(payload)
+    entry = risk_cache.cache.get(key) if key is not None else None
+    if entry is None:
+        return _assess(payload, durable, (await executors.db.run(_score, payload), None, False))
+    return _assess(payload, durable, (*entry, True))
+
+def _risk_key(payload: AssessIn) -> Tuple[str, Optional[tuple]]:
+    day = payload.date or _date.today().isoformat()
+    return day, None if payload.features else risk_cache.cache.key(payload.lat, payload.lon, day, payload.elevation_m,
+                                                                    risk_models.active.source)
+
+def _score(payload: AssessIn) -> dict:
+    return risk_models.assess(payload.lat, payload.lon, payload.date, payload.elevation_m, payload.features or {})
+
+def _assess(payload: AssessIn, durable: bool, scored: Optional[tuple] = None) -> AssessOut:
+    """scored: (risk, row_id, hit) when the caller has already looked the risk up or computed it."""
+    day, key = _risk_key(payload)
+    cache = risk_cache.cache
+    if scored is not None:
+        risk, row_id, hit = scored
+    elif key is None:
+        risk, row_id, hit = _score(payload), None, False
+    else:
+        risk, row_id, hit = cache.lookup(key, lambda: _score(payload))
     rec = {
         "lat": float(payload.lat),
         "lon": float(payload.lon),
-        "date": payload.date or _date.today().isoformat(),
+        "date": day,
         "elevation_m": float(payload.elevation_m) if payload.elevation_m is not None else None,
         "risk": risk,
         "features_json": None,
     }
-    new_id = db.insert_assessment(rec)
+    if hit and cache.dedup_rows and row_id is not None:
+        # RISK_DEDUP_ROWS=1: count the repeat on the row that holds this result
+        write_behind.writer.add_hit(row_id, durable=durable)
+        cache.deduped_rows += 1
+        new_id = row_id
+    else:
+        # buffered write-behind; durable=true (or ASSESS_WRITE_MODE=strict) commits before responding
+        new_id = write_behind.writer.submit(rec, durable=durable)
+        if key is not None and (not hit or row_id is None):
+            cache.store(key, risk, new_id)
     return AssessOut(
         id=int(new_id),
         lat=rec["lat"],
@@ -104,25 +248,269 @@ def assess(payload: AssessIn):
     )
 
 @app.get("/risk/assess", response_model=AssessOut)
-def assess_q(
+async def assess_q(
     lat: float = Query(..., ge=-90, le=90),
     lon: float = Query(..., ge=-180, le=180),
     date: str | None = None,
     elevation_m: float | None = None,
+    durable: bool = False,
 ):
     payload = AssessIn(lat=lat, lon=lon, date=date, elevation_m=elevation_m)
-    return assess(payload)
+    return await assess(payload, durable)
+
+MAX_BATCH_POINTS = 20000
+
+def _batch_inputs(payload: AssessBatchIn):
+    # -> (vertex lats, lons, elevations, dates); every vertex is scored for every date
+    if (payload.points is None) == (payload.polyline is None):
+        raise HTTPException(422, "give exactly one of points or polyline")
+    if payload.points is not None:
+        pts = payload.points
+        if not pts: raise HTTPException(422, "no points")
+        today = _date.today().isoformat()
+        # explicit points carry their own dates: a single "date row"
+        return ([p.lat for p in pts], [p.lon for p in pts], [p.elevation_m for p in pts],
+                [[p.date or payload.date or today for p in pts]])
+    line = payload.polyline or []
+    if len(line) < 1 or any(len(v) != 2 or not (-90 <= v[0] <= 90 and -180 <= v[1] <= 180) for v in line):
+        raise HTTPException(422, "polyline must be [[lat, lon], ...]")
+    elev = payload.elevations_m if payload.elevations_m is not None else [None] * len(line)
+    if len(elev) != len(line):
+        raise HTTPException(422, "elevations_m needs one value per polyline vertex")
+    if payload.date_from or payload.date_to:
+        d0 = _date.fromisoformat(payload.date_from or payload.date_to)
+        d1 = _date.fromisoformat(payload.date_to or payload.date_from)
+        if d1 < d0 or (d1 - d0).days > 366:
+            raise HTTPException(422, "date range must be ordered and at most a year")
+        days = [(d0 + timedelta(days=k)).isoformat() for k in range((d1 - d0).days + 1)]
+    else:
+        days = [payload.date or _date.today().isoformat()]
+    return [v[0] for v in line], [v[1] for v in line], list(elev), [[d] * len(line) for d in days]
+
+@app.post("/risk/assess/batch", response_model=AssessBatchOut)
+@limited("assess_batch")
+async def assess_batch(payload: AssessBatchIn):
+    return await executors.db.run(_assess_batch, payload)
+
+def _assess_batch(payload: AssessBatchIn) -> dict:
+    lats, lons, elev, date_rows = _batch_inputs(payload)
+    n, k = len(lats), len(date_rows)
+    if n * k > MAX_BATCH_POINTS:
+        raise HTTPException(422, f"batch too large ({n*k} points, max {MAX_BATCH_POINTS})")
+    dates = [d for row in date_rows for d in row]
+    r = risk_models.assess_batch(lats * k, lons * k, dates, elev * k)
+
+    rows = [{
+        "id": None, "lat": float(lats[i % n]), "lon": float(lons[i % n]), "date": dates[i],
+        "elevation_m": float(elev[i % n]) if elev[i % n] is not None else None,
+        "avalanche_pct": float(r["avalanche_pct"][i]), "blizzard_pct": float(r["blizzard_pct"][i]),
+        "landslide_pct": float(r["landslide_pct"][i]), "overall_pct": float(r["overall_pct"][i]),
+        "label": str(r["label"][i]), "reason": str(r["reason"][i]), "source": r["source"],
+        "features_json": None, "hit_count": 1, "created_at": None,
+    } for i in range(n * k)]
+    db.insert_batch(rows)
+    items = [_assess_out(row) for row in rows]
+
+    # segments between consecutive vertices: worst endpoint over all dates
+    overall = r["overall_pct"].reshape(k, n)
+    segments = []
+    if n > 1:
+        seg = np.maximum(overall[:, :-1], overall[:, 1:])            # (dates, segments)
+        worst_day = seg.argmax(axis=0)
+        seg_max = seg.max(axis=0)
+        seg_mean = np.round(((overall[:, :-1] + overall[:, 1:]) / 2).mean(axis=0), 1)
+        labels = risk_label(seg_max)
+        segments = [{
+            "index": j, "start": [lats[j], lons[j]], "end": [lats[j+1], lons[j+1]],
+            "max_overall_pct": float(seg_max[j]), "mean_overall_pct": float(seg_mean[j]),
+            "label": str(labels[j]), "worst_date": date_rows[worst_day[j]][j],
+        } for j in range(n - 1)]
+    worst = items[int(r["overall_pct"].argmax())]
+    return {"count": len(items), "items": items, "segments": segments, "worst": worst}
+
+MAX_HISTORY_LIMIT = 500
+_LABEL_RE = "^(LOW|MODERATE|ELEVATED|HIGH|EXTREME)$"
+
+def _history_filter(date_from: str | None, date_to: str | None, bbox: str | None, label: str | None) -> db.HistoryFilter:
+    try:
+        for d in (date_from, date_to):
+            if d: _date.fromisoformat(d)
+    except ValueError:
+        raise HTTPException(422, "dates must be YYYY-MM-DD")
+    box = None
+    if bbox:
+        try:
+            box = tuple(float(v) for v in bbox.split(","))
+        except ValueError:
+            box = ()
+        if len(box) != 4 or box[0] > box[2] or box[1] > box[3]:
+            raise HTTPException(422, "bbox must be south,west,north,east")
+    return db.HistoryFilter(date_from, date_to, box, label)
 
 @app.get("/risk/history", response_model=list[HistoryItem])
-def history(limit: int = 20):
-    rows = db.list_history(limit=limit)
-    return [HistoryItem(**r) for r in rows]
+@limited("history")
+async def history(
+    request: Request,
+    limit: int = Query(20, ge=1, le=MAX_HISTORY_LIMIT),
+    cursor: str | None = Query(None, description="X-Next-Cursor from the previous page"),
+    date_from: str | None = None,
+    date_to: str | None = None,
+    bbox: str | None = Query(None, description="south,west,north,east"),
+    label: str | None = Query(None, pattern=_LABEL_RE),
+):
+    f = _history_filter(date_from, date_to, bbox, label)
+    try:
+        before = db.parse_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(422, "bad cursor")
+    rows = {r["id"]: r for r in await executors.db.run(db.list_history, limit, before, f)}
+    rows.update({r["id"]: r for r in write_behind.writer.recent()   # not flushed yet
+                 if f.matches(r) and (before is None or db.sort_key(r) < before)})
+    ids = sorted(rows, key=lambda i: db.sort_key(rows[i]), reverse=True)[:limit]
+    extra = {"X-Next-Cursor": db.cursor_of(rows[ids[-1]])} if len(ids) == limit else {}
+    # db rows already have exactly the HistoryItem columns; buffered ones carry the full table row
+    body = responses.dumps([r if len(r) == len(db.HISTORY_COLUMNS) else {k: r.get(k) for k in db.HISTORY_COLUMNS}
+                            for r in (rows[i] for i in ids)])
+    return responses.json_response(request, body, cache_control="no-cache", **extra)
 
-@app.get("/risk/{assess_id}", response_model=AssessOut)
-def get_assessment(assess_id: int):
-    row = db.get_assessment(assess_id)
-    if not row:
-        raise HTTPException(status_code=404, detail="not found")
+async def _pages(it):
+    # a sync page iterator stepped on the db executor
+    while (page := await executors.db.run(next, it, None)) is not None:
+        yield page
+
+@app.get("/risk/history/export")
+async def history_export(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    date_from: str | None = None,
+    date_to: str | None = None,
+    bbox: str | None = None,
+    label: str | None = Query(None, pattern=_LABEL_RE),
+):
+    # streamed page by page, so memory stays flat however many rows match
+    # (rows still in the write-behind buffer show up once flushed, within ASSESS_FLUSH_INTERVAL_S)
+    f = _history_filter(date_from, date_to, bbox, label)
+    async def ndjson():
+        async for page in _pages(db.iter_history(f)):
+            yield "".join(json.dumps(r) + "\n" for r in page)
+    async def csv_rows():
+        buf = io.StringIO(); w = csv.DictWriter(buf, fieldnames=db.HISTORY_COLUMNS)
+        w.writeheader()
+        async for page in _pages(db.iter_history(f)):
+            w.writerows(page)
+            yield buf.getvalue()
+            buf.seek(0); buf.truncate()
+        if buf.tell(): yield buf.getvalue()
+    media = "application/x-ndjson" if format == "ndjson" else "text/csv"
+    # the export slot is held while rows stream, not just until the response object is returned
+    return StreamingResponse(await executors.streaming("export", ndjson() if format == "ndjson" else csv_rows()), media_type=media,
+                             headers={"Content-Disposition": f'attachment; filename="risk_history.{format}"'})
+
+@app.get("/risk/history/stats")
+@limited("history")
+async def history_stats(
+    group_by: str = Query("label", pattern="^(label|month|cell)$"),
+    cell_deg: float = Query(0.1, gt=0, le=10),
+    date_from: str | None = None,
+    date_to: str | None = None,
+    bbox: str | None = None,
+    label: str | None = Query(None, pattern=_LABEL_RE),
+):
+    f = _history_filter(date_from, date_to, bbox, label)
+    return {"group_by": group_by, "groups": await executors.db.run(db.aggregate_history, group_by, f, cell_deg)}
+
+@app.get("/risk/history/archive")
+async def history_archive(
+    date_from: str | None = None,
+    date_to: str | None = None,
+    bbox: str | None = None,
+    label: str | None = Query(None, pattern=_LABEL_RE),
+):
+    # NDJSON of assessments that retention moved out of the table
+    f = _history_filter(date_from, date_to, bbox, label)
+    async def ndjson():
+        rows = maintenance.query_archive(f)
+        # gzip reads, not SQLite: 1000-row chunks on the default threadpool
+        chunk = lambda: "".join(json.dumps(r) + "\n" for r in itertools.islice(rows, 1000))
+        try:
+            while text := await run_in_threadpool(chunk):
+                yield text
+        finally:
+            rows.close()
+    return StreamingResponse(await executors.streaming("export", ndjson()), media_type="application/x-ndjson")
+
+@app.get("/risk/history/summaries")
+@limited("history")
+async def history_summaries(month: str | None = Query(None, pattern=r"^\d{4}-\d{2}$"), limit: int = Query(1000, ge=1, le=10000)):
+    return await executors.db.run(maintenance.summaries, month, limit)
+
+@app.get("/admin/maintenance", dependencies=[Depends(require_admin)])
+async def maintenance_status():
+    return {"last_run": maintenance.maintainer.last_report, "size": await executors.db.run(maintenance.db_size),
+            "retention_days": maintenance.RETENTION_DAYS, "interval_s": maintenance.maintainer.interval_s}
+
+@app.post("/admin/maintenance/run", dependencies=[Depends(require_admin)])
+@limited("admin")
+async def maintenance_run():
+    # minutes of vacuuming must not hold a db executor thread
+    return await run_in_threadpool(maintenance.maintainer.run_once)
+
+@app.get("/admin/limits", dependencies=[Depends(require_admin)])
+async def limits_status():
+    return {**executors.stats(), "ingest_jobs": {"pending": ingest_jobs.pending(), "running_max": ingest_jobs.MAX_RUNNING_JOBS,
+                                                  "queued_max": ingest_jobs.MAX_QUEUED_JOBS}}
+
+@app.get("/risk/tiles/{z}/{x}/{y}")
+@limited("tiles")
+async def risk_tile(z: int, x: int, y: int, request: Request,
+              month: int = Query(default_factory=lambda: _date.today().month, ge=1, le=12),
+              band: str = Query("overall_pct", pattern="^(all|avalanche_pct|blizzard_pct|landslide_pct|overall_pct)$"),
+              authorization: Optional[str] = Header(None)):
+    # .npy body: uint8 percentages, (SIZE, SIZE) for one band or (4, SIZE, SIZE) for band=all
+    if not risk_tiles.valid(z, x, y):
+        raise HTTPException(404, "no such tile")
+    model = risk_models.active
+    build = z <= risk_tiles.PUBLIC_MAX_ZOOM or is_admin(authorization)
+    for attempt in range(2):
+        path, fp, _ = await run_in_threadpool(risk_tiles.ensure, z, x, y, month, model.assess_batch, model.source, build)
+        if path is None:
+            raise HTTPException(404, f"tile not rendered (zooms above {risk_tiles.PUBLIC_MAX_ZOOM} are served from precomputed tiles)")
+        etag = f'"{fp}-{band}"'
+        headers = {"ETag": etag, "Cache-Control": f"public, max-age={risk_tiles.MAX_AGE_S}"}
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers=headers)
+        try:
+            body = await run_in_threadpool(risk_tiles.read, path, band)
+        except FileNotFoundError:   # a rebuild for new inputs replaced it after ensure(); look again
+            if attempt: raise
+            continue
+        return Response(body, media_type="application/octet-stream", headers=headers)
+
+class RiskModelSwitch(BaseModel):
+    active: Optional[str] = None       # registered name or an allowed "package.module:factory" (RISK_MODELS)
+    shadow: Optional[str] = None       # "" turns shadowing off
+    shadow_rate: Optional[float] = Field(None, ge=0, le=1)
+    reimport: bool = False             # re-import module-based models (new code / weights)
+
+@app.get("/risk/models")
+async def risk_models_info():
+    return risk_models.describe()
+
+@app.post("/risk/models/reload", dependencies=[Depends(require_admin)])
+@limited("admin")
+async def risk_models_reload(payload: RiskModelSwitch):
+    try:
+        if payload.active is None and payload.shadow is None and payload.shadow_rate is None:
+            return await run_in_threadpool(risk_models.reload)
+        return await run_in_threadpool(risk_models.activate, payload.active, payload.shadow, payload.shadow_rate, payload.reimport)
+    except (KeyError, ImportError, AttributeError, TypeError) as e:
+        raise HTTPException(422, f"cannot load risk model: {e}")
+
+@app.get("/risk/cache/stats")
+async def risk_cache_stats():
+    return {**risk_cache.cache.stats(), "writer": write_behind.writer.stats()}
+
+def _assess_out(row: dict) -> dict:
+    # assessments table row -> AssessOut payload
     risk = {
         "avalanche_pct": float(row["avalanche_pct"]),
         "blizzard_pct": float(row["blizzard_pct"]),
@@ -141,21 +529,181 @@ def get_assessment(assess_id: int):
         "risk": risk,
     }
 
+@app.get("/risk/{assess_id}", response_model=AssessOut)
+@limited("history")
+async def get_assessment(assess_id: int):
+    row = write_behind.writer.get(assess_id) or await executors.db.run(db.get_assessment, assess_id)
+    if not row:
+        raise HTTPException(status_code=404, detail="not found")
+    return _assess_out(row)
+
 class OSMIngestIn(BaseModel):
     lat: float = Field(..., ge=-90, le=90)
     lon: float = Field(..., ge=-180, le=180)
     radius_m: int = Field(2000, ge=100, le=10000)
     kinds: List[str] = Field(default_factory=lambda: ["restaurant","cafe","lodging","resort"])
+    stream: bool = False   # sync only: parse the response incrementally and upsert in fixed-size batches
+    sync: bool = False     # ingest inside the request and answer with the report (default: 202 + a queued job)
+
+class IngestError(BaseModel):
+    source_id: Any = None
+    error: str
 
 class IngestReport(BaseModel):
     fetched: int
     inserted_or_updated: int
+    inserted: int = 0
+    updated: int = 0
+    merged: int = 0
+    failed: int = 0
+    errors: List[IngestError] = []
+
+def _ingest_report(items: list[dict], outcomes: list[dict]) -> dict:
+    counts = {"inserted": 0, "updated": 0, "merged": 0, "failed": 0}
+    errors = []
+    for it, o in zip(items, outcomes):
+        counts[o["status"]] += 1
+        if o["status"] == "failed":
+            errors.append({"source_id": it.get("source_id"), "error": o["error"]})
+    return {"fetched": len(items), "inserted_or_updated": len(items) - counts["failed"], **counts, "errors": errors}
+
+class IngestJob(BaseModel):
+    id: str
+    type: str = "osm"   # 'osm' (region or point) | 'scrape'
+    status: str
+    kinds: List[str]
+    tiles_total: int
+    tiles_done: int
+    tiles_failed: int
+    progress: float
+    fetched: int
+    inserted: int
+    updated: int
+    merged: int
+    failed: int
+    created_at: str
+    updated_at: str
+
+# --------- INGEST: scraped listings ----------
+class ScrapeIngestIn(BaseModel):
+    urls: List[str] = Field(..., min_length=1, max_length=100)
+    max_pages: int = Field(100, ge=1, le=scraper.MAX_PAGES)
+    max_depth: int = Field(1, ge=0, le=5)
+    same_host: bool = True
+    force: bool = False   # ignore stored ETag / Last-Modified / body hash and re-parse every page
+    sync: bool = False    # crawl inside the request and answer with the report (default: 202 + a queued job)
+
+class ScrapeReport(IngestReport):
+    pages: int
+    not_modified: int
+    unchanged: int
+    disallowed: int
+    page_errors: int
+
+# Both ingest endpoints queue an ingest job and answer 202 with it (poll /ingest/jobs/{id});
+# sync=true keeps the old inline mode, under the "ingest" route limiter.
+@app.post("/ingest/scrape", response_model=ScrapeReport | IngestJob, status_code=202)
+async def ingest_scrape(payload: ScrapeIngestIn, response: Response):
+    for u in payload.urls:
+        try:
+            await scraper.check_url(u)
+        except scraper.BlockedURL as e:
+            raise HTTPException(422, str(e))
+    if not payload.sync:
+        ingest_jobs.admit()
+        spec = payload.model_dump(include={"urls", "max_pages", "max_depth", "same_host", "force"})
+        job_id = await executors.db.run(ingest_jobs.create_scrape_job, spec)
+        ingest_jobs.start(job_id)
+        return await executors.db.run(ingest_jobs.get_job, job_id)
+    response.status_code = 200
+    async with executors.routes["ingest"]:
+        return await _ingest_scrape_now(payload)
+
+async def _ingest_scrape_now(payload: ScrapeIngestIn) -> dict:
+    crawler = scraper.Crawler(payload.urls, payload.max_pages, payload.max_depth, payload.same_host, payload.force)
+    report = {"fetched": 0, "inserted_or_updated": 0, "inserted": 0, "updated": 0, "merged": 0, "failed": 0, "errors": []}
+    async for batch in osm.abatched(crawler.records(), ingest_jobs.BATCH_SIZE):
+        part = _ingest_report(batch, await executors.ingest.run(places_db.bulk_upsert, batch))
+        for k, v in part.items(): report[k] += v
+    stats = {k: v for k, v in crawler.stats.items() if k != "records"}
+    return {**report, **stats}
+
+# --------- INGEST: region jobs ----------
+class BBox(BaseModel):
+    min_lat: float = Field(..., ge=-90, le=90)
+    min_lon: float = Field(..., ge=-180, le=180)
+    max_lat: float = Field(..., ge=-90, le=90)
+    max_lon: float = Field(..., ge=-180, le=180)
 
-@app.post("/ingest/osm", response_model=IngestReport)
-def ingest_osm(payload: OSMIngestIn):
-    items = fetch_osm(payload.lat, payload.lon, payload.radius_m, payload.kinds)
-    done = places_db.upsert_many(items)
-    return {"fetched": len(items), "inserted_or_updated": done}
+class RegionIngestIn(BaseModel):
+    bbox: Optional[BBox] = None
+    polyline: Optional[List[List[float]]] = Field(None, max_length=10000)   # [[lat, lon], ...] along the trek
+    buffer_m: int = Field(2000, ge=0, le=20000)
+    tile_m: int = Field(5000, ge=1000, le=20000)
+    concurrency: int = Field(4, ge=1, le=ingest_jobs.MAX_CONCURRENCY)
+    kinds: List[str] = Field(default_factory=lambda: ["restaurant","cafe","lodging","resort"])
+
+@app.post("/ingest/osm", response_model=IngestReport | IngestJob, status_code=202)
+async def ingest_osm(payload: OSMIngestIn, response: Response):
+    if not payload.sync:
+        ingest_jobs.admit()
+        job_id = await executors.db.run(ingest_jobs.create_job, [(payload.lat, payload.lon)], payload.kinds,
+                                        payload.model_dump(), radius_m=payload.radius_m)
+        ingest_jobs.start(job_id)
+        return await executors.db.run(ingest_jobs.get_job, job_id)
+    response.status_code = 200
+    async with executors.routes["ingest"]:
+        return await _ingest_osm_now(payload)
+
+async def _ingest_osm_now(payload: OSMIngestIn) -> dict:
+    if not payload.stream:
+        items = await osm.fetch_osm_async(payload.lat, payload.lon, payload.radius_m, payload.kinds)
+        outcomes = await executors.ingest.run(places_db.bulk_upsert, items)
+        return _ingest_report(items, outcomes)
+    report = {"fetched": 0, "inserted_or_updated": 0, "inserted": 0, "updated": 0, "merged": 0, "failed": 0, "errors": []}
+    places = osm.aiter_osm(payload.lat, payload.lon, payload.radius_m, payload.kinds)
+    async for batch in osm.abatched(places, ingest_jobs.BATCH_SIZE):
+        part = _ingest_report(batch, await executors.ingest.run(places_db.bulk_upsert, batch))
+        for k, v in part.items(): report[k] += v
+    return report
+
+@app.post("/ingest/region", response_model=IngestJob, status_code=202)
+async def ingest_region(payload: RegionIngestIn):
+    if (payload.bbox is None) == (payload.polyline is None):
+        raise HTTPException(422, "give exactly one of bbox or polyline")
+    try:
+        if payload.bbox:
+            b = payload.bbox
+            if b.min_lat >= b.max_lat or b.min_lon >= b.max_lon:
+                raise HTTPException(422, "empty bbox")
+            tiles = ingest_jobs.tiles_for_bbox(b.min_lat, b.min_lon, b.max_lat, b.max_lon, payload.tile_m)
+        else:
+            pts = payload.polyline or []
+            if len(pts) < 2 or any(len(p) != 2 or not (-90 <= p[0] <= 90 and -180 <= p[1] <= 180) for p in pts):
+                raise HTTPException(422, "polyline needs at least two [lat, lon] points")
+            tiles = ingest_jobs.tiles_for_polyline([(p[0], p[1]) for p in pts], payload.buffer_m, payload.tile_m)
+    except ValueError as e:
+        raise HTTPException(422, str(e))
+    ingest_jobs.admit()
+    try:
+        job_id = await executors.db.run(
+            ingest_jobs.create_job, tiles, payload.kinds, payload.model_dump(), payload.tile_m, payload.concurrency
+        )
+    except ValueError as e:
+        raise HTTPException(422, str(e))
+    ingest_jobs.start(job_id)
+    return await executors.db.run(ingest_jobs.get_job, job_id)
+
+@app.get("/ingest/jobs", response_model=List[IngestJob])
+async def ingest_job_list(limit: int = Query(20, ge=1, le=200)):
+    return await executors.db.run(ingest_jobs.list_jobs, limit)
+
+@app.get("/ingest/jobs/{job_id}", response_model=IngestJob)
+async def ingest_job_status(job_id: str):
+    job = await executors.db.run(ingest_jobs.get_job, job_id)
+    if not job:
+        raise HTTPException(404, "job not found")
+    return job
 
 # --------- PLACES: nearby search ----------
 class PlaceOut(BaseModel):
@@ -172,23 +720,23 @@ class PlaceOut(BaseModel):
     price: str | None = None
     tags: dict | None = None
 
+_PLACE_FIELDS = ("id", "name", "kind", "lat", "lon", "address", "phone", "website", "distance_m", "rating", "price")
+
 @app.get("/places/nearby", response_model=List[PlaceOut])
-def places_nearby(
+@limited("places")
+async def places_nearby(
+    request: Request,
     lat: float = Query(..., ge=-90, le=90),
     lon: float = Query(..., ge=-180, le=180),
     radius_m: int = Query(2000, ge=100, le=10000),
     kind: Optional[str] = None,
     limit: int = Query(50, ge=1, le=200),
 ):
-    out = places_db.search_nearby(lat, lon, radius_m, kind, limit)
-    return [
-        PlaceOut(
-            id=r["id"], name=r["name"], kind=r["kind"], lat=r["lat"], lon=r["lon"],
-            address=r.get("address"), phone=r.get("phone"), website=r.get("website"),
-            distance_m=r.get("distance_m"), rating=r.get("rating"), price=r.get("price"),
-            tags=json.loads(r.get("tags") or "{}")
-        ) for r in out
-    ]
+    out = await executors.db.run(places_db.search_nearby, lat, lon, radius_m, kind, limit)
+    # tags are stored as JSON text and spliced in as is
+    body = b"[" + b",".join(responses.with_raw({k: r.get(k) for k in _PLACE_FIELDS}, "tags", r.get("tags") or "{}")
+                            for r in out) + b"]"
+    return responses.json_response(request, body, cache_control="public, max-age=30")
 
 # --------- PLACES: text search (for RAG) ----------
 class PlaceSearchOut(BaseModel):
@@ -196,8 +744,21 @@ class PlaceSearchOut(BaseModel):
     name: str
     kind: str
     address: str | None = None
+    score: float
+    match: str                      # 'fts' | 'fuzzy'
+    distance_m: float | None = None
 
 @app.get("/places/search", response_model=List[PlaceSearchOut])
-def places_search(q: str, limit: int = 20):
-    rows = places_db.search_text(q, limit)
-    return [{"id": r["id"], "name": r["name"], "kind": r["kind"], "address": r.get("address")} for r in rows]
+@limited("places")
+async def places_search(
+    q: str = Query(..., max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    lat: float | None = Query(None, ge=-90, le=90),
+    lon: float | None = Query(None, ge=-180, le=180),
+    kind: str | None = None,
+):
+    if (lat is None) != (lon is None):
+        raise HTTPException(422, "give both lat and lon, or neither")
+    rows = await executors.db.run(search.search, q, limit, lat, lon, kind)
+    return [{"id": r["id"], "name": r["name"], "kind": r["kind"], "address": r.get("address"),
+             "score": round(r["score"], 4), "match": r["match"], "distance_m": r.get("distance_m")} for r in rows]
@@ -0,0 +1,224 @@
+import glob, gzip, json, logging, os, threading, time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Iterator, List, Optional
+
+from . import db, storage
+
+log = logging.getLogger(__name__)
+
+# Keeps safety.db from growing without bound on a long-running deployment:
+#  - assessments older than RETENTION_DAYS (by created_at) are rolled into per-cell/per-month rows
+#    in assessment_summaries, written to ARCHIVE_DIR as gzipped NDJSON partitions (one per
+#    assessed month, still queryable through query_archive), then deleted;
+#  - finished ingest jobs older than JOB_RETENTION_DAYS are dropped;
+#  - places_fts / places_trgm get an incremental 'merge' every run and a full 'optimize' every FTS_OPTIMIZE_S;
+#  - freed pages are handed back with incremental_vacuum and the WAL is truncated.
+# One background thread runs this every INTERVAL_S; run_once() can also be called directly.
+
+RETENTION_DAYS = float(os.getenv("ASSESS_RETENTION_DAYS", "90"))
+JOB_RETENTION_DAYS = float(os.getenv("INGEST_JOB_RETENTION_DAYS", "30"))
+SUMMARY_CELL_DEG = float(os.getenv("ASSESS_SUMMARY_CELL_DEG", "0.1"))
+ARCHIVE_DIR = os.getenv("ASSESS_ARCHIVE_DIR", ".archive")
+INTERVAL_S = float(os.getenv("MAINT_INTERVAL_S", "3600"))   # 0 disables the background thread
+FTS_MERGE_PAGES = 500
+FTS_OPTIMIZE_S = float(os.getenv("MAINT_FTS_OPTIMIZE_S", "86400"))
+VACUUM_PAGES = 4000          # per run; keeps each run short however much was freed
+ROLLUP_CHUNK = 5000          # rows per transaction, so the write-behind flusher isn't starved
+
+def init_db():
+    con = storage.connect()
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS assessment_summaries(
+        cell_lat INTEGER NOT NULL,     -- floor(lat / cell_deg)
+        cell_lon INTEGER NOT NULL,
+        cell_deg REAL NOT NULL,
+        month TEXT NOT NULL,           -- 'YYYY-MM' of the assessed date
+        source TEXT NOT NULL,
+        rows INTEGER NOT NULL,
+        assessments INTEGER NOT NULL,  -- SUM(hit_count)
+        sum_overall REAL NOT NULL,
+        max_overall REAL NOT NULL,
+        sum_avalanche REAL NOT NULL,
+        sum_blizzard REAL NOT NULL,
+        sum_landslide REAL NOT NULL,
+        PRIMARY KEY(cell_deg, cell_lat, cell_lon, month, source)
+    );
+    """)
+    con.execute("CREATE INDEX IF NOT EXISTS idx_assess_created ON assessments(created_at);")
+    con.commit()
+
+# ----- assessments: roll-up + archive -----
+_ROLLUP_SQL = f"""
+    INSERT INTO assessment_summaries
+    SELECT {db._floor('lat / :deg')}, {db._floor('lon / :deg')}, :deg, substr(date, 1, 7), source,
+           COUNT(*), SUM(hit_count), SUM(overall_pct), MAX(overall_pct),
+           SUM(avalanche_pct), SUM(blizzard_pct), SUM(landslide_pct)
+    FROM assessments WHERE id <= :last AND created_at < :cutoff
+    GROUP BY 1, 2, 4, 5
+    ON CONFLICT(cell_deg, cell_lat, cell_lon, month, source) DO UPDATE SET
+        rows = rows + excluded.rows, assessments = assessments + excluded.assessments,
+        sum_overall = sum_overall + excluded.sum_overall, max_overall = MAX(max_overall, excluded.max_overall),
+        sum_avalanche = sum_avalanche + excluded.sum_avalanche, sum_blizzard = sum_blizzard + excluded.sum_blizzard,
+        sum_landslide = sum_landslide + excluded.sum_landslide;
+"""
+
+def _archive_path(month: str) -> str:
+    return os.path.join(ARCHIVE_DIR, f"assessments-{month}.ndjson.gz")
+
+def _archive(rows: List[dict]):
+    # gzip members can be appended; readers see one stream per file
+    by_month = defaultdict(list)
+    for r in rows: by_month[r["date"][:7]].append(r)
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    for month, part in by_month.items():
+        with gzip.open(_archive_path(month), "at", encoding="utf-8") as f:
+            f.writelines(json.dumps(r) + "\n" for r in part)
+
+def roll_up(cutoff: str, chunk: int = ROLLUP_CHUNK) -> int:
+    """Archive, summarise and delete assessments created before cutoff ('YYYY-MM-DD HH:MM:SS'). Returns rows removed."""
+    con = storage.connect()
+    done = 0
+    while True:
+        rows = [dict(r) for r in con.execute(
+            "SELECT * FROM assessments WHERE created_at < ? ORDER BY id LIMIT ?;", (cutoff, chunk)).fetchall()]
+        if not rows: return done
+        # archived first: a crash before the delete commits re-archives the chunk, query_archive dedups by id
+        _archive(rows)
+        args = {"deg": SUMMARY_CELL_DEG, "last": rows[-1]["id"], "cutoff": cutoff}
+        try:
+            con.execute(_ROLLUP_SQL, args)
+            con.execute("DELETE FROM assessments WHERE id <= :last AND created_at < :cutoff;", args)
+            con.commit()
+        except Exception:
+            con.rollback()
+            raise
+        done += len(rows)
+
+def query_archive(f: "db.HistoryFilter" = db.HistoryFilter()) -> Iterator[dict]:
+    """Archived assessments matching f, partition by partition (only months inside f's date range are opened)."""
+    lo, hi = (f.date_from or "")[:7], (f.date_to or "9999-12")[:7]
+    for path in sorted(glob.glob(os.path.join(ARCHIVE_DIR, "assessments-*.ndjson.gz"))):
+        month = os.path.basename(path)[len("assessments-"):len("assessments-YYYY-MM")]
+        if not (lo <= month <= hi): continue
+        seen = set()
+        with gzip.open(path, "rt", encoding="utf-8") as fh:
+            for line in fh:
+                r = json.loads(line)
+                if r["id"] in seen or not f.matches(r): continue
+                seen.add(r["id"])
+                yield r
+
+def summaries(month: Optional[str] = None, limit: int = 1000) -> List[dict]:
+    sql = """SELECT cell_lat * cell_deg AS cell_lat, cell_lon * cell_deg AS cell_lon, cell_deg, month, source, rows, assessments,
+                    ROUND(sum_overall / rows, 2) AS mean_overall_pct, max_overall AS max_overall_pct,
+                    ROUND(sum_avalanche / rows, 2) AS mean_avalanche_pct, ROUND(sum_blizzard / rows, 2) AS mean_blizzard_pct,
+                    ROUND(sum_landslide / rows, 2) AS mean_landslide_pct
+             FROM assessment_summaries"""
+    args: list = []
+    if month: sql += " WHERE month = ?"; args.append(month)
+    sql += " ORDER BY month, cell_lat, cell_lon LIMIT ?;"
+    return [dict(r) for r in storage.connect().execute(sql, (*args, limit)).fetchall()]
+
+# ----- other tables / file -----
+def purge_jobs(cutoff: str) -> int:
+    con = storage.connect()
+    old = "SELECT id FROM ingest_jobs WHERE status IN ('done', 'partial') AND updated_at < ?"
+    try:
+        con.execute(f"DELETE FROM ingest_tiles WHERE job_id IN ({old});", (cutoff,))
+        n = con.execute(f"DELETE FROM ingest_jobs WHERE id IN ({old});", (cutoff,)).rowcount
+        con.commit()
+    except Exception:
+        con.rollback()
+        raise
+    return n
+
+def fts(optimize: bool) -> str:
+    con = storage.connect()
+    for t in ("places_fts", "places_trgm"):
+        if optimize:
+            con.execute(f"INSERT INTO {t}({t}) VALUES('optimize');")
+        else:   # bounded amount of b-tree merging per run
+            con.execute(f"INSERT INTO {t}({t}, rank) VALUES('merge', ?);", (FTS_MERGE_PAGES,))
+    con.commit()
+    return "optimize" if optimize else "merge"
+
+def enable_incremental_vacuum() -> bool:
+    """auto_vacuum can only change via a full VACUUM; done once, the first time maintenance runs."""
+    con = storage.connect()
+    if con.execute("PRAGMA auto_vacuum;").fetchone()[0] == 2: return False
+    log.info("switching %s to auto_vacuum=INCREMENTAL (one-time VACUUM)", storage.DB_PATH)
+    con.execute("PRAGMA auto_vacuum=INCREMENTAL;")
+    con.execute("VACUUM;")
+    return True
+
+def vacuum(pages: int = VACUUM_PAGES) -> int:
+    con = storage.connect()
+    free = con.execute("PRAGMA freelist_count;").fetchone()[0]
+    if free:
+        # executescript: execute() would step the pragma once and free a single page
+        con.executescript(f"PRAGMA incremental_vacuum({min(free, int(pages))});")
+    con.execute("PRAGMA wal_checkpoint(TRUNCATE);").fetchall()
+    con.execute("PRAGMA optimize;")
+    return min(free, pages)
+
+def db_size() -> dict:
+    con = storage.connect()
+    page = con.execute("PRAGMA page_size;").fetchone()[0]
+    pages = con.execute("PRAGMA page_count;").fetchone()[0]
+    free = con.execute("PRAGMA freelist_count;").fetchone()[0]
+    wal = storage.DB_PATH + "-wal"
+    return {"bytes": page * pages, "free_bytes": page * free,
+            "wal_bytes": os.path.getsize(wal) if os.path.exists(wal) else 0}
+
+def _ago(days: float) -> str:
+    return (datetime.now(timezone.utc) - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+
+# ----- scheduling -----
+class Maintainer:
+    def __init__(self, interval_s: float = INTERVAL_S):
+        self.interval_s = interval_s
+        self._stop = threading.Event()
+        self._lock = threading.Lock()          # one run at a time (timer vs. manual trigger)
+        self._thread: Optional[threading.Thread] = None
+        self._last_optimize = 0.0
+        self.last_report: Optional[dict] = None
+
+    def start(self):
+        if self.interval_s <= 0 or (self._thread and self._thread.is_alive()): return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="db-maintenance", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            try:
+                self.run_once()
+            except Exception:
+                log.exception("maintenance run failed")
+
+    def run_once(self) -> dict:
+        with self._lock:
+            t0 = time.perf_counter()
+            before = db_size()
+            optimize = time.time() - self._last_optimize >= FTS_OPTIMIZE_S
+            report = {
+                "vacuum_mode_changed": enable_incremental_vacuum(),
+                "assessments_rolled_up": roll_up(_ago(RETENTION_DAYS)),
+                "ingest_jobs_purged": purge_jobs(_ago(JOB_RETENTION_DAYS)),
+                "fts": fts(optimize),
+                "pages_vacuumed": vacuum(),
+            }
+            if optimize: self._last_optimize = time.time()
+            report.update(size_before=before, size_after=db_size(), seconds=round(time.perf_counter() - t0, 3),
+                          finished_at=datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"))
+            self.last_report = report
+            return report
+
+maintainer = Maintainer()
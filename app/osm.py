@@ -1,61 +1,444 @@
+import asyncio, functools, hashlib, json, os, re, time
 import httpx
-from typing import List, Dict
+from typing import AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .places_db import _haversine
+
+ANY = "*"   # tag value wildcard: any value of the key matches
 
 OSM_KINDS = {
     "restaurant": [('amenity','restaurant')],
     "cafe": [('amenity','cafe'), ('amenity','fast_food')],
     "lodging": [('tourism','hotel'), ('tourism','guest_house'), ('tourism','hostel'), ('tourism','motel'), ('tourism','alpine_hut')],
     "resort": [('tourism','resort')],
+    "hut": [('tourism','alpine_hut'), ('tourism','wilderness_hut'), ('amenity','shelter')],
+    "water": [('amenity','drinking_water'), ('amenity','water_point'), ('natural','spring')],
+    "health": [('amenity','clinic'), ('amenity','hospital'), ('amenity','doctors'), ('amenity','pharmacy'), ('healthcare', ANY)],
+    "police": [('amenity','police')],
+    "rescue": [('emergency','mountain_rescue'), ('emergency','ambulance_station'), ('aeroway','helipad')],
 }
 
+# compiled form of OSM_KINDS, rebuilt by register_kind():
+#   _TAG_INDEX[(key, value)] / _KEY_INDEX[key] (wildcards) -> kinds in definition order
+_TAG_INDEX: Dict[Tuple[str, str], Tuple[str, ...]] = {}
+_KEY_INDEX: Dict[str, Tuple[str, ...]] = {}
+
+def _compile():
+    tags: Dict[Tuple[str, str], List[str]] = {}
+    keys: Dict[str, List[str]] = {}
+    for kind, pairs in OSM_KINDS.items():
+        for k, v in pairs:
+            (keys.setdefault(k, []) if v == ANY else tags.setdefault((k, v), [])).append(kind)
+    _TAG_INDEX.clear(); _TAG_INDEX.update({kv: tuple(ks) for kv, ks in tags.items()})
+    _KEY_INDEX.clear(); _KEY_INDEX.update({k: tuple(ks) for k, ks in keys.items()})
+    classifier.cache_clear()
+
+@functools.lru_cache(maxsize=64)
+def classifier(kinds: Tuple[str, ...]) -> Callable[[Dict[str, str]], Optional[str]]:
+    """tags -> first of `kinds` (in request order) that any tag matches, or None."""
+    pos = {k: i for i, k in reversed(list(enumerate(kinds)))}
+    def narrow(index):
+        # tag / key -> best (lowest) position in `kinds`
+        out = {}
+        for t, ks in index.items():
+            r = min((pos[k] for k in ks if k in pos), default=None)
+            if r is not None: out[t] = r
+        return out
+    by_tag, by_key = narrow(_TAG_INDEX), narrow(_KEY_INDEX)
+    n = len(kinds)
+
+    def classify(tags: Dict[str, str]) -> Optional[str]:
+        best = n
+        for kv in tags.items():
+            r = by_tag.get(kv, n)
+            if r < best: best = r
+            if by_key:
+                r = by_key.get(kv[0], n)
+                if r < best: best = r
+        return kinds[best] if best < n else None
+    return classify
+
+def register_kind(kind: str, tags: List[Tuple[str, str]]):
+    """Add (or replace) a place kind; tags are (key, value) pairs, value may be ANY."""
+    OSM_KINDS[kind] = [(str(k), str(v)) for k, v in tags]
+    _compile()
+
+def classify(tags: Dict[str, str], kinds: List[str]) -> Optional[str]:
+    return classifier(tuple(kinds))(tags)
+
+def _load_extra_kinds(path: Optional[str]):
+    # optional JSON file {"kind": [["key", "value"], ...]} merged over the built-in kinds
+    if not path: return
+    with open(path, encoding="utf-8") as f:
+        for kind, tags in json.load(f).items():
+            OSM_KINDS[kind] = [(str(k), str(v)) for k, v in tags]
+
+_load_extra_kinds(os.getenv("OSM_KINDS_PATH"))
+_compile()
+
+_ERE_SPECIAL = re.compile(r"([\\.^$|?*+()\[\]{}])")
+
+def _ere(v: str) -> str:
+    # escape for a POSIX regex inside an Overpass QL string (the backslash itself needs escaping there)
+    return _ERE_SPECIAL.sub(r"\\\\\1", v)
+
 def _build_overpass(lat: float, lon: float, radius_m: int, kinds: list[str]) -> str:
-    # nodes/ways/relations with a center, around given point
-    clauses = []
+    # one nwr (node/way/relation, with center) clause per tag key; values merged into an anchored regex
+    values: Dict[str, set] = {}
     for kind in kinds:
-        for k,v in OSM_KINDS.get(kind, []):
-            for typ in ("node","way","relation"):
-                clauses.append(f'{typ}["{k}"="{v}"](around:{radius_m},{lat},{lon});')
+        for k, v in OSM_KINDS.get(kind, []):
+            values.setdefault(k, set()).add(v)
+    clauses = []
+    for k in sorted(values):
+        vs = values[k]
+        if ANY in vs:
+            f = f'["{k}"]'
+        elif len(vs) == 1:
+            f = f'["{k}"="{next(iter(vs))}"]'
+        else:
+            f = f'["{k}"~"^({"|".join(_ere(v) for v in sorted(vs))})$"]'
+        clauses.append(f'nwr{f}(around:{radius_m},{lat},{lon});')
     body = "\n".join(clauses)
     return f"[out:json][timeout:25];({body});out center;"
 
+OVERPASS_URL = os.getenv("OVERPASS_URL", "https://overpass-api.de/api/interpreter")
+CACHE_DIR = os.getenv("OVERPASS_CACHE_DIR", ".overpass_cache")
+CACHE_TTL_S = int(os.getenv("OVERPASS_CACHE_TTL_S", str(24*3600)))
+HEADERS = {"User-Agent": "smart-trek-planner/0.1 (hackathon)"}
+MAX_RETRIES = 4
+BACKOFF_S = 1.0
+_RETRY_STATUS = (429, 504)
+
+def _normalize_ql(ql: str) -> str:
+    return " ".join(ql.split())
+
+def _cache_path(ql: str) -> str:
+    return os.path.join(CACHE_DIR, hashlib.sha256(_normalize_ql(ql).encode()).hexdigest() + ".json")
+
+def _fresh(path: str) -> bool:
+    try:
+        return time.time() - os.path.getmtime(path) <= CACHE_TTL_S
+    except OSError:
+        return False
+
+def _cache_get(ql: str) -> Optional[dict]:
+    path = _cache_path(ql)
+    if not _fresh(path): return None
+    try:
+        with open(path, "rb") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _cache_put(ql: str, data: dict):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = _cache_path(ql)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+class _CacheWriter:
+    """Tees a streamed response body into the cache; the entry only appears if the body completes."""
+    def __init__(self, ql: str):
+        self.path = _cache_path(ql)
+        self.tmp = f"{self.path}.{os.getpid()}.{id(self)}.tmp"
+
+    def __enter__(self):
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        self.f = open(self.tmp, "w", encoding="utf-8")
+        return self
+
+    def write(self, chunk: str):
+        self.f.write(chunk)
+
+    def __exit__(self, exc_type, exc, tb):
+        self.f.close()
+        if exc_type is None:
+            os.replace(self.tmp, self.path)
+        else:
+            try: os.remove(self.tmp)
+            except OSError: pass
+        return False
+
+    # async variants for aiter_osm: the same file work, handed to a thread so the loop never blocks on disk
+    async def __aenter__(self):
+        return await asyncio.to_thread(self.__enter__)
+
+    async def awrite(self, chunk: str):
+        await asyncio.to_thread(self.f.write, chunk)
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return await asyncio.to_thread(self.__exit__, exc_type, exc, tb)
+
+def _read_chunks(path: str, size: int = 1 << 16) -> Iterator[str]:
+    with open(path, "r", encoding="utf-8") as f:
+        while True:
+            chunk = f.read(size)
+            if not chunk: return
+            yield chunk
+
+async def _aread_chunks(path: str, size: int = 1 << 16) -> AsyncIterator[str]:
+    f = await asyncio.to_thread(open, path, "r", encoding="utf-8")
+    try:
+        while chunk := await asyncio.to_thread(f.read, size):
+            yield chunk
+    finally:
+        await asyncio.to_thread(f.close)
+
+def _retry_after(r: httpx.Response, attempt: int) -> float:
+    try:
+        return max(0.0, float(r.headers["Retry-After"]))
+    except (KeyError, ValueError):
+        return BACKOFF_S * 2**attempt
+
+def _place(el: dict, classify: Callable[[Dict[str, str]], Optional[str]]) -> Optional[Dict]:
+    # one Overpass element -> normalized place dict (None if unnamed or without coordinates)
+    tags = el.get("tags", {}) or {}
+    name = tags.get("name")
+    if not name: return None
+    lat2, lon2 = None, None
+    if "lat" in el and "lon" in el:
+        lat2, lon2 = el["lat"], el["lon"]
+    elif "center" in el:
+        lat2, lon2 = el["center"]["lat"], el["center"]["lon"]
+    else:
+        return None
+    knd = classify(tags)
+    addr = ", ".join(filter(None, [tags.get("addr:street"), tags.get("addr:place"), tags.get("addr:city")]))
+    return {
+        "source": "osm",
+        "source_id": f'{el.get("type","node")}:{el.get("id")}',
+        "name": name,
+        "kind": knd or "poi",
+        "lat": float(lat2),
+        "lon": float(lon2),
+        "address": addr or None,
+        "phone": tags.get("phone") or tags.get("contact:phone"),
+        "website": tags.get("website") or tags.get("contact:website"),
+        "rating": None,
+        "price": None,
+        "tags": tags,
+    }
+
+def _elements(data: dict, kinds: list[str]) -> List[Dict]:
+    cls = classifier(tuple(kinds))
+    return [p for p in (_place(el, cls) for el in data.get("elements", [])) if p]
+
 def fetch_osm(lat: float, lon: float, radius_m: int = 2000, kinds: list[str] = ["restaurant","cafe","lodging","resort"]) -> List[Dict]:
     ql = _build_overpass(lat, lon, radius_m, kinds)
-    headers = {"User-Agent": "smart-trek-planner/0.1 (hackathon)"}
-    with httpx.Client(timeout=30) as client:
-        r = client.post("https://overpass-api.de/api/interpreter", data={"data": ql}, headers=headers)
-        r.raise_for_status()
-        data = r.json()
-    out = []
-    for el in data.get("elements", []):
-        tags = el.get("tags", {}) or {}
-        name = tags.get("name")
-        if not name: continue
-        lat2, lon2 = None, None
-        if "lat" in el and "lon" in el:
-            lat2, lon2 = el["lat"], el["lon"]
-        elif "center" in el:
-            lat2, lon2 = el["center"]["lat"], el["center"]["lon"]
-        else:
+    data = _cache_get(ql)
+    if data is None:
+        with httpx.Client(timeout=30) as client:
+            r = client.post(OVERPASS_URL, data={"data": _normalize_ql(ql)}, headers=HEADERS)
+            r.raise_for_status()
+            data = r.json()
+        _cache_put(ql, data)
+    return _elements(data, kinds)
+
+# ----- async client -----
+_client: Optional[httpx.AsyncClient] = None
+_inflight: Dict[str, "asyncio.Task[dict]"] = {}
+# areas being fetched right now: (lat, lon, radius_m, kinds, task); a request fully inside one of them reuses it
+_inflight_areas: List[Tuple[float, float, int, frozenset, "asyncio.Task[dict]"]] = []
+
+def _get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=30, headers=HEADERS,
+            limits=httpx.Limits(max_connections=8, max_keepalive_connections=4),
+        )
+    return _client
+
+async def aclose():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+async def _post(ql: str) -> dict:
+    client = _get_client()
+    for attempt in range(MAX_RETRIES + 1):
+        r = await client.post(OVERPASS_URL, data={"data": ql})
+        if r.status_code in _RETRY_STATUS and attempt < MAX_RETRIES:
+            await asyncio.sleep(_retry_after(r, attempt))
             continue
-        knd = None
-        for k in kinds:
-            for tk, tv in OSM_KINDS.get(k, []):
-                if tags.get(tk) == tv:
-                    knd = k; break
-            if knd: break
-        addr = ", ".join(filter(None, [tags.get("addr:street"), tags.get("addr:place"), tags.get("addr:city")]))
-        out.append({
-            "source": "osm",
-            "source_id": f'{el.get("type","node")}:{el.get("id")}',
-            "name": name,
-            "kind": knd or "poi",
-            "lat": float(lat2),
-            "lon": float(lon2),
-            "address": addr or None,
-            "phone": tags.get("phone") or tags.get("contact:phone"),
-            "website": tags.get("website") or tags.get("contact:website"),
-            "rating": None,
-            "price": None,
-            "tags": tags,
-        })
-    return out
+        r.raise_for_status()
+        return r.json()
+    raise RuntimeError("unreachable")
+
+async def fetch_overpass_async(ql: str) -> dict:
+    """
+    Raw Overpass response for `ql`: served from the on-disk cache when fresh, otherwise fetched
+    once even if several callers ask for the same (normalized) query concurrently.
+    """
+    # cache file I/O and JSON (de)coding of a big payload run in a thread, off the event loop
+    data = await asyncio.to_thread(_cache_get, ql)
+    if data is not None: return data
+    key = _normalize_ql(ql)
+    task = _inflight.get(key)
+    if task is None:
+        async def run():
+            data = await _post(key)
+            await asyncio.to_thread(_cache_put, ql, data)
+            return data
+        task = asyncio.ensure_future(run())
+        _inflight[key] = task
+        task.add_done_callback(lambda _t: _inflight.pop(key, None))
+    return await asyncio.shield(task)
+
+def _covering(lat: float, lon: float, radius_m: int, kinds: list[str]):
+    for lat2, lon2, r2, kinds2, task in _inflight_areas:
+        if set(kinds) <= kinds2 and _haversine(lat, lon, lat2, lon2) + radius_m <= r2:
+            return task
+    return None
+
+async def fetch_osm_async(lat: float, lon: float, radius_m: int = 2000, kinds: list[str] = ["restaurant","cafe","lodging","resort"]) -> List[Dict]:
+    task = _covering(lat, lon, radius_m, kinds)
+    if task is not None:
+        # an in-flight query already covers this circle: share it and cut out our area
+        data = await asyncio.shield(task)
+        return [p for p in _elements(data, kinds)
+                if p["kind"] in kinds and _haversine(lat, lon, p["lat"], p["lon"]) <= radius_m]
+    task = asyncio.ensure_future(fetch_overpass_async(_build_overpass(lat, lon, radius_m, kinds)))
+    area = (lat, lon, radius_m, frozenset(kinds), task)
+    _inflight_areas.append(area)
+    try:
+        data = await asyncio.shield(task)
+    finally:
+        if area in _inflight_areas: _inflight_areas.remove(area)
+    return _elements(data, kinds)
+
+# ----- streaming -----
+class _ElementStream:
+    """
+    Incremental parser for an Overpass JSON body. feed() takes text chunks as they arrive and returns
+    the members of the top-level "elements" array completed so far; other top-level keys are skipped.
+    Only the unparsed tail (at most one element plus one chunk) is kept in memory.
+    """
+    _SKIP = re.compile(r"[\s,]*")
+    _WS = re.compile(r"\s*")
+
+    def __init__(self):
+        self._dec = json.JSONDecoder()
+        self._buf, self._pos = "", 0
+        self._state = "start"   # start -> key <-> value | array -> end
+
+    def _decode(self):
+        # (value, end) for the JSON value at _pos, or None until the chunk holding its end has arrived;
+        # a following delimiter must be buffered too, so a number cut at a chunk edge is not misread
+        try:
+            val, end = self._dec.raw_decode(self._buf, self._pos)
+        except json.JSONDecodeError:
+            return None
+        if self._buf[end-1] not in "}]\"":
+            nxt = self._WS.match(self._buf, end).end()
+            if nxt >= len(self._buf) or self._buf[nxt] not in ",}]": return None
+        return val, end
+
+    def feed(self, text: str) -> List[dict]:
+        self._buf = self._buf[self._pos:] + text; self._pos = 0
+        out, buf = [], self._buf
+        while True:
+            pos = self._SKIP.match(buf, self._pos).end() if self._state != "start" else len(buf) - len(buf.lstrip())
+            if pos >= len(buf) or self._state == "end": break
+            ch = buf[pos]
+            if self._state == "start":
+                if ch != "{": raise ValueError("Overpass response is not a JSON object")
+                self._pos, self._state = pos + 1, "key"
+            elif self._state in ("key", "array") and ch in "}]":
+                self._pos, self._state = pos + 1, "end" if ch == "}" else "key"
+            elif self._state == "key":
+                self._pos = pos
+                got = self._decode()
+                if not got: break
+                key, end = got
+                colon = self._SKIP.match(buf, end).end()   # tolerant: also skips stray commas
+                if colon >= len(buf): break
+                if buf[colon] != ":": raise ValueError("malformed Overpass response")
+                self._pos = colon + 1
+                self._state = "array_open" if key == "elements" else "value"
+            elif self._state == "array_open":
+                if ch != "[": raise ValueError('"elements" is not an array')
+                self._pos, self._state = pos + 1, "array"
+            else:   # a skipped value, or one member of the elements array
+                self._pos = pos
+                got = self._decode()
+                if not got: break
+                val, self._pos = got
+                if self._state == "array":
+                    out.append(val)
+                else:
+                    self._state = "key"
+        return out
+
+    def close(self):
+        if self._state != "end":
+            raise ValueError("truncated Overpass response")
+
+def _iter_elements(chunks: Iterable[str]) -> Iterator[dict]:
+    s = _ElementStream()
+    for chunk in chunks:
+        yield from s.feed(chunk)
+    s.close()
+
+def iter_osm(lat: float, lon: float, radius_m: int = 2000, kinds: list[str] = ["restaurant","cafe","lodging","resort"]) -> Iterator[Dict]:
+    """Streaming fetch_osm: yields places while the response is still downloading."""
+    ql = _build_overpass(lat, lon, radius_m, kinds)
+    cls = classifier(tuple(kinds))
+    path = _cache_path(ql)
+    if _fresh(path):
+        els = _iter_elements(_read_chunks(path))
+        for el in els:
+            p = _place(el, cls)
+            if p: yield p
+        return
+    with httpx.Client(timeout=30, headers=HEADERS) as client:
+        with client.stream("POST", OVERPASS_URL, data={"data": _normalize_ql(ql)}) as r:
+            r.raise_for_status()
+            with _CacheWriter(ql) as w:
+                def tee():
+                    for chunk in r.iter_text():
+                        w.write(chunk); yield chunk
+                for el in _iter_elements(tee()):
+                    p = _place(el, cls)
+                    if p: yield p
+
+async def aiter_osm(lat: float, lon: float, radius_m: int = 2000, kinds: list[str] = ["restaurant","cafe","lodging","resort"]) -> AsyncIterator[Dict]:
+    """Async streaming variant on the shared client (cache + 429/504 backoff, no coalescing)."""
+    ql = _build_overpass(lat, lon, radius_m, kinds)
+    cls = classifier(tuple(kinds))
+    path = _cache_path(ql)
+    if await asyncio.to_thread(_fresh, path):
+        s = _ElementStream()
+        async for chunk in _aread_chunks(path):
+            for el in s.feed(chunk):
+                p = _place(el, cls)
+                if p: yield p
+        s.close()
+        return
+    client = _get_client()
+    for attempt in range(MAX_RETRIES + 1):
+        async with client.stream("POST", OVERPASS_URL, data={"data": _normalize_ql(ql)}) as r:
+            if r.status_code in _RETRY_STATUS and attempt < MAX_RETRIES:
+                await asyncio.sleep(_retry_after(r, attempt))
+                continue
+            r.raise_for_status()
+            s = _ElementStream()
+            async with _CacheWriter(ql) as w:
+                async for chunk in r.aiter_text():
+                    await w.awrite(chunk)
+                    for el in s.feed(chunk):
+                        p = _place(el, cls)
+                        if p: yield p
+                s.close()
+            return
+
+async def abatched(items: AsyncIterator[Dict], size: int) -> AsyncIterator[List[Dict]]:
+    batch: List[Dict] = []
+    async for it in items:
+        batch.append(it)
+        if len(batch) >= size:
+            yield batch; batch = []
+    if batch: yield batch
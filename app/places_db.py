@@ -1,13 +1,9 @@
-import sqlite3, json, math
+import sqlite3, json, math, heapq
 from typing import Any, Dict, List, Optional
-from rapidfuzz import fuzz
-
-DB_PATH = "safety.db"  # reuse your existing DB file
+from . import dedup, storage
 
 def _conn():
-    con = sqlite3.connect(DB_PATH)
-    con.row_factory = sqlite3.Row
-    return con
+    return storage.connect()  # shared with db.py: same file, per-thread pooled connection
 
 def init_db():
     con = _conn(); cur = con.cursor()
@@ -30,15 +26,56 @@ def init_db():
         UNIQUE(source, source_id)
     );
     """)
-    # simple full-text search table (manual sync)
+    _init_fts(cur)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_places_kind ON places(kind);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_places_latlon ON places(lat,lon);")
+    # spatial index (R*Tree, one degenerate box per place; kept in sync by bulk_upsert)
     cur.execute("""
-    CREATE VIRTUAL TABLE IF NOT EXISTS places_fts USING fts5(
-        name, address, tags, content=''
+    CREATE VIRTUAL TABLE IF NOT EXISTS places_rtree USING rtree(
+        id, min_lat, max_lat, min_lon, max_lon
     );
     """)
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_places_kind ON places(kind);")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_places_latlon ON places(lat,lon);")
-    con.commit(); con.close()
+    # backfill rows written before the index existed
+    cur.execute("""
+    INSERT INTO places_rtree(id,min_lat,max_lat,min_lon,max_lon)
+    SELECT id, lat, lat, lon, lon FROM places WHERE id NOT IN (SELECT id FROM places_rtree);
+    """)
+    con.commit()
+
+# Full-text indexes over places, both external-content (they store no text of their own) and kept
+# in sync by triggers, so every writer - bulk_upsert, merges, manual SQL - updates them:
+#   places_fts   word index on name / address / tags (JSON text), with prefix indexes for "as you type"
+#   places_trgm  trigram index on name, used to find candidates for typo-tolerant matching
+_FTS_TABLES = {
+    "places_fts": "CREATE VIRTUAL TABLE places_fts USING fts5(name, address, tags, content='places', content_rowid='id', prefix='2 3')",
+    "places_trgm": "CREATE VIRTUAL TABLE places_trgm USING fts5(name, content='places', content_rowid='id', tokenize='trigram')",
+}
+_FTS_TRIGGERS = """
+CREATE TRIGGER IF NOT EXISTS places_fts_ai AFTER INSERT ON places BEGIN
+    INSERT INTO places_fts(rowid, name, address, tags) VALUES (new.id, new.name, new.address, new.tags);
+    INSERT INTO places_trgm(rowid, name) VALUES (new.id, new.name);
+END;
+CREATE TRIGGER IF NOT EXISTS places_fts_ad AFTER DELETE ON places BEGIN
+    INSERT INTO places_fts(places_fts, rowid, name, address, tags) VALUES ('delete', old.id, old.name, old.address, old.tags);
+    INSERT INTO places_trgm(places_trgm, rowid, name) VALUES ('delete', old.id, old.name);
+END;
+CREATE TRIGGER IF NOT EXISTS places_fts_au AFTER UPDATE OF name, address, tags ON places BEGIN
+    INSERT INTO places_fts(places_fts, rowid, name, address, tags) VALUES ('delete', old.id, old.name, old.address, old.tags);
+    INSERT INTO places_trgm(places_trgm, rowid, name) VALUES ('delete', old.id, old.name);
+    INSERT INTO places_fts(rowid, name, address, tags) VALUES (new.id, new.name, new.address, new.tags);
+    INSERT INTO places_trgm(rowid, name) VALUES (new.id, new.name);
+END;
+"""
+
+def _init_fts(cur):
+    for name, ddl in _FTS_TABLES.items():
+        row = cur.execute("SELECT sql FROM sqlite_master WHERE name=?;", (name,)).fetchone()
+        if row and row["sql"] == ddl: continue
+        # missing, or the old contentless places_fts that was synced by hand: (re)build from places
+        if row: cur.execute(f"DROP TABLE {name};")
+        cur.execute(ddl + ";")
+        cur.execute(f"INSERT INTO {name}({name}) VALUES('rebuild');")
+    cur.connection.executescript(_FTS_TRIGGERS)
 
 def _haversine(lat1, lon1, lat2, lon2):
     R = 6371000.0
@@ -48,85 +85,175 @@ def _haversine(lat1, lon1, lat2, lon2):
     a = math.sin(dphi/2)**2 + math.cos(p1)*math.cos(p2)*math.sin(dl/2)**2
     return 2*R*math.asin(math.sqrt(a))
 
+def _bbox(lat, lon, radius_m):
+    # degrees spanned by radius_m around (lat, lon); clamped at the poles / antimeridian
+    dlat = radius_m / 111320.0
+    dlon = radius_m / (111320.0 * max(math.cos(math.radians(lat)), 1e-6))
+    return (max(-90.0, lat-dlat), min(90.0, lat+dlat),
+            max(-180.0, lon-dlon), min(180.0, lon+dlon))
+
+_UPSERT_SQL = """
+    INSERT INTO places(source,source_id,name,kind,lat,lon,address,phone,website,rating,price,tags,updated_at)
+    VALUES (?,?,?,?,?,?,?,?,?,?,?,?,datetime('now'))
+    ON CONFLICT(source, source_id) DO UPDATE SET
+        name=excluded.name, kind=excluded.kind, lat=excluded.lat, lon=excluded.lon,
+        address=excluded.address, phone=excluded.phone, website=excluded.website,
+        rating=excluded.rating, price=excluded.price, tags=excluded.tags, updated_at=excluded.updated_at;
+"""
+_MERGE_SQL = """
+    UPDATE places SET name=?, address=COALESCE(address, ?), phone=COALESCE(phone, ?),
+                      website=COALESCE(website, ?), updated_at=datetime('now')
+    WHERE id=?;
+"""
+_CHUNK = 400  # keys per IN (...) lookup, stays under SQLite's bound-parameter limit
+
+def _row(p: Dict[str, Any]) -> tuple:
+    # validates one incoming item; raises on anything the table would reject
+    name = (p.get("name") or "").strip()
+    if not name: raise ValueError("missing name")
+    if not p.get("kind"): raise ValueError("missing kind")
+    lat, lon = float(p["lat"]), float(p["lon"])
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180): raise ValueError(f"bad coordinates {lat},{lon}")
+    return (str(p["source"]), str(p["source_id"]), name, p["kind"], lat, lon,
+            p.get("address"), p.get("phone"), p.get("website"), p.get("rating"), p.get("price"),
+            json.dumps(p.get("tags") or {}, ensure_ascii=False, separators=(",", ":")))   # served verbatim by /places/nearby
+
+def _rows_by_key(cur, keys) -> Dict[tuple, sqlite3.Row]:
+    out = {}
+    keys = list(keys)
+    for i in range(0, len(keys), _CHUNK):
+        chunk = keys[i:i+_CHUNK]
+        q = f"SELECT * FROM places WHERE (source, source_id) IN (VALUES {','.join(['(?,?)']*len(chunk))});"
+        for r in cur.execute(q, [x for k in chunk for x in k]).fetchall():
+            out[(r["source"], r["source_id"])] = r
+    return out
+
+def _rows_by_id(cur, ids) -> Dict[int, sqlite3.Row]:
+    out = {}
+    ids = list(ids)
+    for i in range(0, len(ids), _CHUNK):
+        chunk = ids[i:i+_CHUNK]
+        for r in cur.execute(f"SELECT * FROM places WHERE id IN ({','.join(['?']*len(chunk))});", chunk).fetchall():
+            out[r["id"]] = r
+    return out
+
+def _executemany(cur, sql: str, batch: List[tuple], outcomes: List[dict]):
+    """
+    batch: (item index, params). Runs as one executemany; if SQLite rejects any row,
+    replays row by row so only the offending items are marked failed.
+    """
+    if not batch: return
+    try:
+        cur.executemany(sql, [params for _, params in batch])
+    except sqlite3.Error:
+        for i, params in batch:
+            try:
+                cur.execute(sql, params)
+            except sqlite3.Error as e:
+                outcomes[i] = {"status": "failed", "id": None, "error": str(e)}
+
+def bulk_upsert(items: List[Dict[str, Any]], dedup_config: dedup.DedupConfig = dedup.DEFAULT) -> List[dict]:
+    """
+    Ingest a batch of places on one connection in one transaction.
+    New items that are near-duplicates (see app.dedup) of an existing place or of an
+    earlier item in the batch are merged into it instead of inserted.
+    Returns one outcome per item, in order:
+    {"status": "inserted" | "updated" | "merged" | "failed", "id": int | None, "error": str | None}
+    """
+    outcomes: List[dict] = [None] * len(items)  # type: ignore[list-item]
+    rows: Dict[int, tuple] = {}
+    for i, p in enumerate(items):
+        try:
+            rows[i] = _row(p)
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            outcomes[i] = {"status": "failed", "id": None, "error": f"{type(e).__name__}: {e}"}
+    if not rows: return outcomes
+
+    con = _conn(); cur = con.cursor()
+    try:
+        existing = _rows_by_key(cur, {r[:2] for r in rows.values()})
+        # items with an unknown (source, source_id); later repeats of the key follow the first one
+        first: Dict[tuple, int] = {}
+        for i, row in rows.items():
+            if row[:2] not in existing: first.setdefault(row[:2], i)
+        dups = dedup.find_duplicates(cur, [(i, rows[i]) for i in first.values()], dedup_config)
+
+        upserts, merges = [], []
+        for i, row in rows.items():
+            j = first.get(row[:2])
+            ref = dups.get(j) if j is not None else None
+            if ref:
+                outcomes[i] = {"status": "merged", "id": None, "error": None}
+                merges.append((i, row, ref))
+            else:
+                outcomes[i] = {"status": "inserted" if i == j else "updated", "id": None, "error": None}
+                upserts.append((i, row))
+
+        _executemany(cur, _UPSERT_SQL, upserts, outcomes)
+        ids = {k: r["id"] for k, r in _rows_by_key(cur, {row[:2] for _, row in upserts}).items()}
+        for i, row in upserts:
+            if outcomes[i]["status"] != "failed": outcomes[i]["id"] = ids[row[:2]]
+        merge_rows = []
+        for i, row, ref in merges:
+            pid = ref[1] if ref[0] == "db" else outcomes[ref[1]]["id"]
+            if pid is None:
+                outcomes[i] = {"status": "failed", "id": None, "error": "duplicate of a failed item"}
+                continue
+            outcomes[i]["id"] = pid
+            merge_rows.append((i, (row[2], row[6], row[7], row[8], pid)))
+        _executemany(cur, _MERGE_SQL, merge_rows, outcomes)
+        touched = {o["id"] for o in outcomes if o and o["status"] != "failed"}
+        new = _rows_by_id(cur, touched)
+
+        cur.executemany("INSERT OR REPLACE INTO places_rtree(id,min_lat,max_lat,min_lon,max_lon) VALUES (?,?,?,?,?);",
+                        [(r["id"], r["lat"], r["lat"], r["lon"], r["lon"]) for r in new.values()])
+        # places_fts / places_trgm follow through the triggers
+        con.commit()
+    except Exception:
+        con.rollback()
+        raise
+    return outcomes
+
 def upsert_place(p: Dict[str, Any]) -> int:
     """
     p keys: source, source_id, name, kind, lat, lon, address, phone, website, rating, price, tags(dict)
     """
-    con = _conn(); cur = con.cursor()
-    # try strict upsert on (source, source_id)
-    cur.execute("SELECT id FROM places WHERE source=? AND source_id=?;", (p["source"], p["source_id"]))
-    row = cur.fetchone()
-    tags_json = json.dumps(p.get("tags") or {}, ensure_ascii=False)
-    if row:
-        cur.execute("""
-            UPDATE places SET name=?, kind=?, lat=?, lon=?, address=?, phone=?, website=?, rating=?,
-                              price=?, tags=?, updated_at=datetime('now') WHERE id=?;
-        """, (p["name"], p["kind"], p["lat"], p["lon"], p.get("address"), p.get("phone"),
-              p.get("website"), p.get("rating"), p.get("price"), tags_json, row["id"]))
-        pid = row["id"]
-    else:
-        # near-duplicate check (same kind, ~200m, similar name)
-        cur.execute("SELECT id,name,lat,lon FROM places WHERE kind=?;", (p["kind"],))
-        dup_id = None
-        for r in cur.fetchall():
-            if _haversine(p["lat"], p["lon"], r["lat"], r["lon"]) <= 200:
-                if fuzz.ratio((p["name"] or "").lower(), (r["name"] or "").lower()) >= 90:
-                    dup_id = r["id"]; break
-        if dup_id:
-            pid = dup_id
-            cur.execute("""
-                UPDATE places SET name=?, address=COALESCE(address, ?), phone=COALESCE(phone, ?),
-                                  website=COALESCE(website, ?), updated_at=datetime('now')
-                WHERE id=?;
-            """, (p["name"], p.get("address"), p.get("phone"), p.get("website"), pid))
-        else:
-            cur.execute("""
-                INSERT INTO places(source,source_id,name,kind,lat,lon,address,phone,website,rating,price,tags,updated_at)
-                VALUES (?,?,?,?,?,?,?,?,?,?,?,?,datetime('now'));
-            """, (p["source"], p["source_id"], p["name"], p["kind"], p["lat"], p["lon"],
-                  p.get("address"), p.get("phone"), p.get("website"), p.get("rating"),
-                  p.get("price"), tags_json))
-            pid = cur.lastrowid
-    # update FTS
-    content = " ".join(filter(None, [
-        p.get("name"), p.get("address"),
-        " ".join([f"{k}:{v}" for k,v in (p.get("tags") or {}).items()])
-    ]))
-    cur.execute("INSERT INTO places_fts(rowid,name,address,tags) VALUES(?,?,?,?) ON CONFLICT DO NOTHING;", (pid, p.get("name"), p.get("address"), content))
-    # If exists, refresh:
-    cur.execute("UPDATE places_fts SET name=?, address=?, tags=? WHERE rowid=?;", (p.get("name"), p.get("address"), content, pid))
-    con.commit(); con.close()
-    return int(pid)
+    o = bulk_upsert([p])[0]
+    if o["status"] == "failed":
+        raise ValueError(o["error"])
+    return int(o["id"])
 
 def upsert_many(items: List[Dict[str, Any]]) -> int:
-    n = 0
-    for it in items:
-        try:
-            upsert_place(it); n += 1
-        except Exception:
-            continue
-    return n
+    # number of items written (inserted, updated or merged); see bulk_upsert for per-item outcomes
+    return sum(1 for o in bulk_upsert(items) if o["status"] != "failed")
+
+# k-NN search: start with a small box and grow it until `limit` hits are inside the ring
+# (CROSS JOIN keeps the planner from preferring idx_places_kind over the R*Tree)
+_KNN_START_M = 250
+_KNN_GROWTH = 4
 
 def search_nearby(lat: float, lon: float, radius_m: int = 2000, kind: Optional[str] = None, limit: int = 50) -> List[dict]:
+    sql = """
+        SELECT p.* FROM places_rtree r CROSS JOIN places p ON p.id = r.id
+        WHERE r.max_lat >= ? AND r.min_lat <= ? AND r.max_lon >= ? AND r.min_lon <= ?
+    """
+    if kind: sql += " AND p.kind = ?"
     con = _conn()
-    rows = con.execute("SELECT * FROM places WHERE kind=?;" if kind else "SELECT * FROM places;", (kind,) if kind else ()).fetchall()
-    out = []
-    for r in rows:
-        d = _haversine(lat, lon, r["lat"], r["lon"])
-        if d <= radius_m:
-            o = dict(r); o["distance_m"] = round(d, 1); out.append(o)
-    out.sort(key=lambda x: x["distance_m"])
-    return out[:limit]
+    r_m = min(radius_m, _KNN_START_M)
+    while True:
+        min_lat, max_lat, min_lon, max_lon = _bbox(lat, lon, r_m)
+        args = (min_lat, max_lat, min_lon, max_lon) + ((kind,) if kind else ())
+        out = []
+        for r in con.execute(sql, args):
+            d = _haversine(lat, lon, r["lat"], r["lon"])
+            if d <= r_m:
+                o = dict(r); o["distance_m"] = round(d, 1); out.append(o)
+        # everything within r_m has been seen, so once we hold `limit` of them they are the nearest
+        if len(out) >= limit or r_m >= radius_m: break
+        r_m = min(radius_m, r_m * _KNN_GROWTH)
+    return heapq.nsmallest(limit, out, key=lambda x: x["distance_m"])
 
 def search_text(q: str, limit: int = 20) -> List[dict]:
-    con = _conn()
-    # FTS match; fallback to LIKE if needed
-    try:
-        ids = con.execute("SELECT rowid FROM places_fts WHERE places_fts MATCH ? LIMIT ?;", (q, limit)).fetchall()
-        id_list = [r[0] for r in ids]
-        if not id_list: return []
-        rows = con.execute(f"SELECT * FROM places WHERE id IN ({','.join(['?']*len(id_list))});", id_list).fetchall()
-        return [dict(r) for r in rows]
-    except Exception:
-        rows = con.execute("SELECT * FROM places WHERE name LIKE ? OR address LIKE ? LIMIT ?;", (f"%{q}%", f"%{q}%", limit)).fetchall()
-        return [dict(r) for r in rows]
+    # kept for callers of the old API; see app.search
+    from . import search
+    return search.search(q, limit)
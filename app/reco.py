@@ -1,7 +1,17 @@
-from typing import Tuple, Dict, Any
-from .data import TREKS
+import itertools, json, os, re
+from typing import Tuple, Dict, Any, List, Optional
+
+import numpy as np
+
+from . import data
+from .risk_cache import TTLCache
+
+DEFAULT_LIMIT = 20
+PREF_BONUS = 5       # per matched preference
+PREF_BONUS_MAX = 15
 
 def score_trek(user: Dict[str, Any], trek: Dict[str, Any]) -> Tuple[int, str]:
+    # reference implementation of the rules; Engine applies the same ones column-wise
     score = int(trek.get("ai_base", 70))
     reasons = []
 
@@ -27,13 +37,141 @@ def score_trek(user: Dict[str, Any], trek: Dict[str, Any]) -> Tuple[int, str]:
         reasons.append("good match based on profile")
     return score, "; ".join(reasons)
 
-def get_recommendations(user: Dict[str, Any]):
-    recs = []
-    for trek in TREKS:
-        s, why = score_trek(user, trek)
-        recs.append({
-            "trek": { **trek, "aiScore": s },
-            "reason": why
-        })
-    recs.sort(key=lambda r: r["trek"]["aiScore"], reverse=True)
-    return recs
+# ----- columnar engine -----
+_WORD = re.compile(r"[a-z0-9]+")
+_STOP = {"a", "an", "and", "the", "of", "in", "on", "to", "with", "for"}
+
+def _tokens(text: str) -> set:
+    return {w for w in _WORD.findall(text.casefold()) if w not in _STOP}
+
+class Engine:
+    """
+    One catalog's treks as NumPy columns. Profile rules become boolean masks over all treks at once,
+    preferences are matched through a token -> positions index, and only the top `limit` rows are
+    turned back into dicts with an explanation.
+    """
+    def __init__(self, catalog: "data.Catalog"):
+        self.catalog = catalog
+        recs = catalog.records
+        self.ai_base = np.array([r.ai_base for r in recs], dtype=np.int32)
+        diff = np.array([r.difficulty for r in recs], dtype=object)
+        self.easy, self.hard = diff == "easy", diff == "hard"
+        self.pricey = np.array([r.cost_min for r in recs], dtype=np.int32) > 1500
+        index: Dict[str, List[int]] = {}
+        for i, r in enumerate(recs):
+            words = _tokens(" ".join((r.name, r.location, r.difficulty, r.riskLevel, r.bestSeason, *r.highlights)))
+            for w in words: index.setdefault(w, []).append(i)
+        self._tags = {w: np.array(p, dtype=np.int32) for w, p in index.items()}
+
+    def _pref_hits(self, pref: str) -> np.ndarray:
+        # positions of treks carrying every word of the preference
+        words = _tokens(pref)
+        if not words: return np.empty(0, dtype=np.int32)
+        lists = sorted((self._tags.get(w, np.empty(0, dtype=np.int32)) for w in words), key=len)
+        hit = lists[0]
+        for other in lists[1:]: hit = np.intersect1d(hit, other, assume_unique=True)
+        return hit
+
+    def score(self, user: Dict[str, Any]) -> Tuple[np.ndarray, Dict[str, np.ndarray], List[Tuple[str, np.ndarray]]]:
+        """(scores, rule masks, [(preference, matching positions)])"""
+        exp, fit = user.get("experience"), user.get("fitness")
+        masks = {
+            "beginner_hard": self.hard & (exp == "beginner"),
+            "advanced_easy": self.easy & (exp == "advanced"),
+            "low_budget": self.pricey & (user.get("budget") == "low"),
+            "low_fitness": ~self.easy & (fit == "low"),
+            "high_fitness": self.easy & (fit == "high"),
+        }
+        s = self.ai_base.copy()
+        s -= 20 * masks["beginner_hard"] + 10 * masks["advanced_easy"] + 15 * masks["low_budget"] \
+             + 8 * masks["low_fitness"] + 5 * masks["high_fitness"]
+        prefs = [(p, self._pref_hits(p)) for p in dict.fromkeys(user.get("preferences") or [])]
+        if prefs:
+            bonus = np.zeros(len(s), dtype=np.int32)
+            for _, hit in prefs: bonus[hit] += PREF_BONUS
+            s += np.minimum(bonus, PREF_BONUS_MAX)
+        return np.clip(s, 0, 100), masks, prefs
+
+    def top(self, user: Dict[str, Any], limit: int = DEFAULT_LIMIT) -> List[dict]:
+        s, masks, prefs = self.score(user)
+        n = len(s)
+        if n == 0: return []
+        k = min(limit, n)
+        if k < n:
+            # k-th best score; ties at the cut go to the earlier treks, as a stable sort would
+            thr = np.partition(s, n - k)[n - k]
+            above = np.flatnonzero(s > thr)
+            idx = np.concatenate([above, np.flatnonzero(s == thr)[:k - len(above)]])
+        else:
+            idx = np.arange(n)
+        idx = idx[np.lexsort((idx, -s[idx]))]
+        return [self._item(int(i), int(s[i]), masks, prefs) for i in idx]
+
+    def _item(self, i: int, score: int, masks: Dict[str, np.ndarray], prefs) -> dict:
+        reasons = [text for key, text in _REASONS if masks[key][i]]
+        matched = [p for p, hit in prefs if _contains(hit, i)]
+        if matched:
+            bonus = min(PREF_BONUS * len(matched), PREF_BONUS_MAX)
+            reasons.append(f"boosted: matches {', '.join(matched)} (+{bonus})")
+        return {"trek": {**self.catalog.dicts[i], "aiScore": score},
+                "reason": "; ".join(reasons) or "good match based on profile"}
+
+def _contains(sorted_positions: np.ndarray, i: int) -> bool:
+    j = np.searchsorted(sorted_positions, i)
+    return j < sorted_positions.size and sorted_positions[j] == i
+
+_REASONS = (
+    ("beginner_hard", "reduced: beginner vs hard route (-20)"),
+    ("advanced_easy", "reduced: easy for advanced (-10)"),
+    ("low_budget", "reduced: above low budget (-15)"),
+    ("low_fitness", "reduced: low fitness vs non-easy (-8)"),
+    ("high_fitness", "reduced: easy vs high fitness (-5)"),
+)
+
+_engine: Optional[Engine] = None
+
+def engine() -> Engine:
+    # rebuilt whenever data.load_catalog() swaps the catalog
+    global _engine
+    if _engine is None or _engine.catalog is not data.catalog:
+        _engine = Engine(data.catalog)
+        cache.clear()
+    return _engine
+
+def get_recommendations(user: Dict[str, Any], limit: Optional[int] = None):
+    return engine().top(user, limit or user.get("limit") or DEFAULT_LIMIT)
+
+# ----- response cache -----
+# The categorical part of a profile has 27 combinations, so the same rankings come up over and
+# over. Responses are cached as ready-to-send JSON bytes, keyed by the normalized profile and the
+# catalog version (a catalog swap also clears the cache outright).
+CACHE_SIZE = int(os.getenv("RECO_CACHE_SIZE", "4096"))
+EXPERIENCE = ("beginner", "intermediate", "advanced")
+FITNESS = ("low", "moderate", "high")
+BUDGET = ("low", "medium", "high")
+
+cache = TTLCache(CACHE_SIZE, None)
+
+def normalize(user: Dict[str, Any], limit: Optional[int] = None) -> tuple:
+    prefs = sorted({" ".join(_WORD.findall(p.casefold())) for p in user.get("preferences") or []} - {""})
+    return (user.get("experience"), user.get("fitness"), user.get("budget"), tuple(prefs),
+            limit or user.get("limit") or DEFAULT_LIMIT)
+
+def recommendations_json(user: Dict[str, Any], limit: Optional[int] = None) -> bytes:
+    """{"recommendations": [...]} as bytes, from the cache when this profile was seen before."""
+    eng = engine()
+    key = (eng.catalog.version, *normalize(user, limit))
+    body = cache.get(key)
+    if body is None:
+        exp, fit, budget, prefs, k = key[1:]
+        recs = eng.top({"experience": exp, "fitness": fit, "budget": budget, "preferences": list(prefs)}, k)
+        body = json.dumps({"recommendations": recs}, separators=(",", ":")).encode()
+        cache.put(key, body)
+    return body
+
+def warm(limit: int = DEFAULT_LIMIT) -> int:
+    """Precompute every experience x fitness x budget profile (no preferences)."""
+    grid = list(itertools.product(EXPERIENCE, FITNESS, BUDGET))
+    for exp, fit, budget in grid:
+        recommendations_json({"experience": exp, "fitness": fit, "budget": budget}, limit)
+    return len(grid)
@@ -0,0 +1,94 @@
+import gzip, hashlib, json, os
+from typing import Callable, Optional, Union
+
+from fastapi import Request, Response
+
+from .risk_cache import TTLCache
+
+try:
+    import orjson   # optional: several times faster than json, same output for our payloads
+except ImportError:
+    orjson = None
+try:
+    import brotli   # optional: br when the client takes it, else gzip
+except ImportError:
+    brotli = None
+
+# Fast path for hot read endpoints: payloads are serialized straight from row dicts (no Pydantic
+# models), validated with a strong ETag (If-None-Match -> 304) and compressed above
+# COMPRESS_MIN_BYTES. Payloads marked immutable (catalog data, keyed by catalog version) keep their
+# compressed variants in an LRU, so a hot trek list is compressed once, not per request.
+
+COMPRESS_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+COMPRESSED_CACHE_SIZE = int(os.getenv("RESPONSE_COMPRESSED_CACHE_SIZE", "512"))
+
+_compressed = TTLCache(COMPRESSED_CACHE_SIZE, None)   # (etag, encoding) -> bytes
+
+def dumps(obj) -> bytes:
+    if orjson is not None: return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode()
+
+def with_raw(obj: dict, key: str, raw: Optional[Union[str, bytes]]) -> bytes:
+    """obj serialized with `key` set to an already-JSON value (e.g. a stored tags blob), passed through as is."""
+    if isinstance(raw, str): raw = raw.encode()
+    head = dumps(obj)
+    return head[:-1] + (b"," if len(head) > 2 else b"") + b'"' + key.encode() + b'":' + (raw or b"null") + b"}"
+
+def etag_of(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+
+def _fresh(request: Request, etag: str) -> bool:
+    inm = request.headers.get("if-none-match")
+    if not inm: return False
+    if inm.strip() == "*": return True
+    # If-None-Match uses the weak comparison
+    return etag.removeprefix("W/") in {t.strip().removeprefix("W/") for t in inm.split(",")}
+
+def _encoding(request: Request) -> Optional[str]:
+    offered = {}
+    for part in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try: q = float(params.strip()[2:])
+            except ValueError: q = 0.0
+        if name: offered[name.strip().lower()] = q
+    if brotli is not None and offered.get("br", 0) > 0: return "br"
+    if offered.get("gzip", 0) > 0: return "gzip"
+    return None
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br": return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, GZIP_LEVEL, mtime=0)
+
+def json_response(request: Request, body: Union[bytes, Callable[[], bytes]], etag: Optional[str] = None,
+                  immutable: bool = False, cache_control: str = "public, max-age=60", **headers) -> Response:
+    """
+    JSON bytes as a response. body may be a zero-arg callable, only called when a full response is
+    needed (then etag is required); without etag it's derived from the body. immutable: the bytes
+    behind this etag never change, so their compressed form can be cached.
+    """
+    if etag is None:
+        body = body() if callable(body) else body
+        etag = etag_of(body)
+    h = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding", **headers}
+    if _fresh(request, etag):
+        return Response(status_code=304, headers=h)
+    enc = _encoding(request)
+    key = (etag, enc)
+    out = _compressed.get(key) if immutable and enc else None
+    if out is None:
+        body = body() if callable(body) else body
+        if enc and len(body) >= COMPRESS_MIN_BYTES:
+            out = compress(body, enc)
+            if immutable: _compressed.put(key, out)
+        else:
+            out, enc = body, None
+    if enc: h["Content-Encoding"] = enc
+    return Response(out, media_type="application/json", headers=h)
+
+def stats() -> dict:
+    return {"orjson": orjson is not None, "brotli": brotli is not None, "compress_min_bytes": COMPRESS_MIN_BYTES,
+            "compressed_cache": _compressed.stats()}
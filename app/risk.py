@@ -1,10 +1,18 @@
+import numpy as np
 from datetime import date as _date
 
+SOURCE = "stub_v1"   # model version stamped on every result; bump when the rules change
+
 def _month(date_str: str | None) -> int:
     if date_str:
         return _date.fromisoformat(date_str).month
     return _date.today().month
 
+def elevation_band(elevation_m: float | None) -> int | None:
+    # the elevation classes assess_stub distinguishes (<=3000, between, >=5500)
+    if elevation_m is None: return None
+    return 0 if elevation_m <= 3000 else 2 if elevation_m >= 5500 else 1
+
 def assess_stub(lat: float, lon: float, date_str: str | None = None, elevation_m: float | None = None, features: dict | None = None):
     m = _month(date_str)
     blizzard = 45.0 if m in (12,1,2) else 15.0
@@ -36,5 +44,58 @@ def assess_stub(lat: float, lon: float, date_str: str | None = None, elevation_m
         "overall_pct": overall,
         "label": label,
         "reason": ", ".join(reasons),
-        "source": "stub_v1"
+        "source": SOURCE
+    }
+
+# ----- vectorized batch (same rules as assess_stub, one NumPy pass) -----
+_LABELS = np.array(["LOW", "MODERATE", "ELEVATED", "HIGH", "EXTREME"])
+_LABEL_EDGES = np.array([20, 40, 60, 80])
+# reason text by bitmask: 1 winter, 2 monsoon, 4 very high elevation
+_REASONS = np.array([", ".join([r for bit, r in ((1, "winter conditions"), (2, "monsoon period"), (4, "very high elevation")) if mask & bit])
+                     or "seasonal baseline" for mask in range(8)])
+
+def label(overall: np.ndarray) -> np.ndarray:
+    # vectorized label binning, same thresholds as assess_stub
+    return _LABELS[np.searchsorted(_LABEL_EDGES, overall, side="right")]
+
+def _round1(x: np.ndarray) -> np.ndarray:
+    # Python's round(v, 1) (correctly rounded, unlike np.round's x*10 trick), applied per distinct value
+    u, inv = np.unique(x, return_inverse=True)
+    return np.array([round(float(v), 1) for v in u])[inv].reshape(x.shape)
+
+def assess_batch(lats, lons, dates, elevations) -> dict:
+    """
+    assess_stub over many points at once. dates / elevations may contain None.
+    Returns column arrays: avalanche_pct, blizzard_pct, landslide_pct, overall_pct, label, reason, source.
+    """
+    months = {}
+    m = np.array([months.setdefault(d, _month(d)) for d in dates], dtype=np.int8)
+    elev = np.array([np.nan if e is None else e for e in elevations], dtype=float)
+
+    winter = np.isin(m, (12, 1, 2))
+    monsoon = np.isin(m, (6, 7, 8, 9))
+    blizzard = np.where(winter, 45.0, 15.0)
+    landslide = np.where(monsoon, 40.0, 12.0)
+    avalanche = np.where(np.isin(m, (12, 1, 2, 3)), 30.0, 18.0)
+
+    with np.errstate(invalid="ignore"):   # NaN (no elevation) compares False
+        high = elev >= 5500
+        low = ~high & (elev <= 3000)
+    avalanche += 10 * high; blizzard += 10 * high; landslide += 5 * low
+
+    avalanche = np.clip(_round1(avalanche), 0.0, 100.0)
+    blizzard = np.clip(_round1(blizzard), 0.0, 100.0)
+    landslide = np.clip(_round1(landslide), 0.0, 100.0)
+
+    overall = _round1(0.45*avalanche + 0.35*blizzard + 0.20*landslide)
+    reason = _REASONS[winter.astype(int) | monsoon.astype(int) << 1 | high.astype(int) << 2]
+
+    return {
+        "avalanche_pct": avalanche,
+        "blizzard_pct": blizzard,
+        "landslide_pct": landslide,
+        "overall_pct": overall,
+        "label": label(overall),
+        "reason": reason,
+        "source": SOURCE,
     }
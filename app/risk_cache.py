@@ -0,0 +1,103 @@
+import math, os, threading, time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+from .risk import elevation_band
+
+# Memo for risk model output. Results are keyed by a quantized grid cell, the date, an elevation
+# bucket and the model's `source` string, so bumping the model version (stub_v1 -> v2) misses
+# every old entry without an explicit flush.
+
+CACHE_SIZE = int(os.getenv("RISK_CACHE_SIZE", "50000"))
+CACHE_TTL_S = float(os.getenv("RISK_CACHE_TTL_S", "21600"))
+CELL_DEG = float(os.getenv("RISK_CACHE_CELL_DEG", "0.01"))          # ~1.1 km
+ELEV_BUCKET_M = float(os.getenv("RISK_CACHE_ELEV_BUCKET_M", "100"))
+DEDUP_ROWS = os.getenv("RISK_DEDUP_ROWS", "0") == "1"   # cache hits bump hit_count instead of adding a row
+
+class TTLCache:
+    """Thread-safe LRU with a per-entry time to live (ttl_s=None: entries only leave by eviction)."""
+    def __init__(self, maxsize: int, ttl_s: Optional[float]):
+        self.maxsize, self.ttl_s = maxsize, ttl_s
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            expires, value = item
+            if expires < now:
+                del self._data[key]
+                self.expirations += 1; self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any, ttl_s: Optional[float] = None):
+        """ttl_s overrides the cache-wide time to live for this entry."""
+        ttl_s = ttl_s or self.ttl_s
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl_s if ttl_s else math.inf, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def keys(self) -> list:
+        # snapshot, oldest use first; may include expired entries (get() drops those)
+        with self._lock:
+            return list(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data), "maxsize": self.maxsize, "ttl_s": self.ttl_s,
+                "hits": self.hits, "misses": self.misses, "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "evictions": self.evictions, "expirations": self.expirations,
+            }
+
+class RiskCache:
+    def __init__(self, maxsize: int = CACHE_SIZE, ttl_s: float = CACHE_TTL_S,
+                 cell_deg: float = CELL_DEG, elev_bucket_m: float = ELEV_BUCKET_M, dedup_rows: bool = DEDUP_ROWS):
+        self.cell_deg, self.elev_bucket_m, self.dedup_rows = cell_deg, elev_bucket_m, dedup_rows
+        self.cache = TTLCache(maxsize, ttl_s)
+        self.deduped_rows = 0
+
+    def key(self, lat: float, lon: float, date: str, elevation_m: Optional[float], source: str) -> tuple:
+        cell = (math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg))
+        # the model's own band rides along so a bucket straddling a threshold (e.g. 3000 m) can't mix results
+        band = None if elevation_m is None else (math.floor(elevation_m / self.elev_bucket_m), elevation_band(elevation_m))
+        return (source, cell, date, band)
+
+    def get(self, key: tuple) -> Optional[Tuple[dict, Optional[int]]]:
+        """(risk, id of the row stored for this key or None), or None on a miss."""
+        return self.cache.get(key)
+
+    def lookup(self, key: tuple, compute: Callable[[], dict]) -> Tuple[dict, Optional[int], bool]:
+        """(risk, id of the row stored for this key or None, hit)"""
+        entry = self.get(key)
+        if entry is not None:
+            return entry[0], entry[1], True
+        return compute(), None, False
+
+    def store(self, key: tuple, risk: dict, row_id: Optional[int]):
+        self.cache.put(key, (risk, row_id))
+
+    def stats(self) -> dict:
+        return {**self.cache.stats(), "deduped_rows": self.deduped_rows, "dedup_rows": self.dedup_rows,
+                "cell_deg": self.cell_deg, "elev_bucket_m": self.elev_bucket_m}
+
+cache = RiskCache()
@@ -0,0 +1,218 @@
+import importlib, logging, os, random, threading, time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Optional
+
+import numpy as np
+
+from . import risk
+
+log = logging.getLogger(__name__)
+
+# Risk model registry. A model is any object with a `source` version string and
+#   assess_batch(lats, lons, dates, elevations) -> {band: array, ..., "source": str}
+# (the same contract as risk.assess_batch); `assess` for a single point is optional.
+# Models are registered by name as factories and built on first use, so a heavy ML model costs
+# nothing until it is activated. RISK_MODEL picks the active one, RISK_SHADOW_MODEL an optional
+# candidate that is run on a RISK_SHADOW_RATE sample of traffic in a background pool purely for
+# comparison: its output never reaches a response.
+#
+# Names are either registered ones ("stub") or "package.module:factory", imported lazily. Module
+# names must be allowed server-side (RISK_MODELS="pkg.mod:factory,..." or RISK_MODEL /
+# RISK_SHADOW_MODEL): a name that arrives in a request is never imported unless listed there.
+
+ACTIVE = os.getenv("RISK_MODEL", "stub")
+SHADOW = os.getenv("RISK_SHADOW_MODEL") or None
+ALLOWED = {n.strip() for n in os.getenv("RISK_MODELS", "").split(",") if ":" in n} | {n for n in (ACTIVE, SHADOW) if n and ":" in n}
+SHADOW_RATE = float(os.getenv("RISK_SHADOW_RATE", "0.05"))
+SHADOW_WORKERS = int(os.getenv("RISK_SHADOW_WORKERS", "2"))
+SHADOW_MAX_PENDING = 256   # sampled calls beyond this backlog are dropped, not queued
+NUMERIC = ("avalanche_pct", "blizzard_pct", "landslide_pct", "overall_pct")
+_WINDOW = 1000             # latency samples kept per model
+
+class StubModel:
+    source = risk.SOURCE
+
+    def assess(self, lat, lon, date=None, elevation_m=None, features=None) -> dict:
+        return risk.assess_stub(lat, lon, date, elevation_m, features or {})
+
+    def assess_batch(self, lats, lons, dates, elevations) -> dict:
+        return risk.assess_batch(lats, lons, dates, elevations)
+
+def assess_one(model, lat, lon, date=None, elevation_m=None, features=None) -> dict:
+    # single point through a model that may only implement assess_batch
+    if hasattr(model, "assess"):
+        return model.assess(lat, lon, date, elevation_m, features)
+    r = model.assess_batch([lat], [lon], [date], [elevation_m])
+    out = {k: (v[0].item() if hasattr(v[0], "item") else v[0]) for k, v in r.items() if k != "source"}
+    out["source"] = r.get("source", model.source)
+    return out
+
+class _Timings:
+    def __init__(self):
+        self.calls = self.errors = 0
+        self.samples = deque(maxlen=_WINDOW)
+
+    def add(self, seconds: float, n: int = 1):
+        self.calls += 1
+        self.samples.append(seconds / max(n, 1))
+
+    def stats(self) -> dict:
+        ms = np.array(self.samples) * 1000 if self.samples else np.zeros(1)
+        return {"calls": self.calls, "errors": self.errors, "per_point_ms_p50": round(float(np.percentile(ms, 50)), 4),
+                "per_point_ms_p95": round(float(np.percentile(ms, 95)), 4)}
+
+class Registry:
+    def __init__(self, active: str = ACTIVE, shadow: Optional[str] = SHADOW, shadow_rate: float = SHADOW_RATE,
+                 allowed: Iterable[str] = ALLOWED):
+        self._factories: Dict[str, Callable[[], Any]] = {"stub": StubModel}
+        self.allowed = set(allowed)   # "module:factory" names _build may import
+        self._loaded: Dict[str, Any] = {}
+        self._lock = threading.RLock()
+        self.active_name, self.shadow_name, self.shadow_rate = active, shadow, shadow_rate
+        self._timings: Dict[str, _Timings] = {}
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pending = 0
+        self.shadow_stats = self._fresh_shadow_stats()
+
+    # ----- loading -----
+    def register(self, name: str, factory: Callable[[], Any]):
+        with self._lock:
+            self._factories[name] = factory
+            self._loaded.pop(name, None)
+
+    def _build(self, name: str, reimport: bool = False):
+        factory = self._factories.get(name)
+        if factory is None:
+            if name not in self.allowed:
+                raise KeyError(f"unknown risk model {name!r}" + ("; module models must be listed in RISK_MODELS" if ":" in name else ""))
+            mod_name, attr = name.split(":", 1)
+            mod = importlib.import_module(mod_name)
+            if reimport: mod = importlib.reload(mod)
+            factory = getattr(mod, attr)
+        model = factory()
+        if not getattr(model, "source", None) or not hasattr(model, "assess_batch"):
+            raise TypeError(f"risk model {name!r} needs a source and assess_batch()")
+        return model
+
+    def get(self, name: str):
+        model = self._loaded.get(name)
+        if model is None:
+            with self._lock:
+                model = self._loaded.get(name)
+                if model is None:
+                    model = self._loaded[name] = self._build(name)
+                    log.info("loaded risk model %s (%s)", name, model.source)
+        return model
+
+    @property
+    def active(self):
+        return self.get(self.active_name)
+
+    def activate(self, active: Optional[str] = None, shadow: Optional[str] = None,
+                 shadow_rate: Optional[float] = None, reimport: bool = False) -> dict:
+        """Switch models in place. New models are built before the swap, so a bad one leaves the old in service.
+        shadow="" turns shadowing off; reimport=True re-imports module-based models (picks up new code/weights)."""
+        with self._lock:
+            names = [n for n in (active, shadow or None) if n]
+            built = {n: self._build(n, reimport) for n in names}
+            if reimport:   # drop everything else too, so it's rebuilt from fresh code on next use
+                self._loaded.clear()
+            self._loaded.update(built)
+            if active: self.active_name = active
+            if shadow is not None:
+                if (shadow or None) != self.shadow_name: self.shadow_stats = self._fresh_shadow_stats()
+                self.shadow_name = shadow or None
+            if shadow_rate is not None: self.shadow_rate = shadow_rate
+            return self.describe()
+
+    def reload(self) -> dict:
+        """Rebuild the current models from freshly imported code (SIGHUP / POST /risk/models/reload)."""
+        return self.activate(self.active_name, self.shadow_name or "", reimport=True)
+
+    # ----- serving -----
+    def _timed(self, model, fn: Callable[[], dict], n: int) -> dict:
+        t = self._timings.setdefault(model.source, _Timings())
+        t0 = time.perf_counter()
+        try:
+            out = fn()
+        except Exception:
+            t.errors += 1
+            raise
+        t.add(time.perf_counter() - t0, n)
+        return out
+
+    def assess(self, lat, lon, date=None, elevation_m=None, features=None) -> dict:
+        model = self.active
+        out = self._timed(model, lambda: assess_one(model, lat, lon, date, elevation_m, features), 1)
+        self._maybe_shadow([lat], [lon], [date], [elevation_m], {k: [out[k]] for k in NUMERIC + ("label",)})
+        return out
+
+    def assess_batch(self, lats, lons, dates, elevations) -> dict:
+        model = self.active
+        out = self._timed(model, lambda: model.assess_batch(lats, lons, dates, elevations), len(lats))
+        self._maybe_shadow(lats, lons, dates, elevations, out)
+        return out
+
+    # ----- shadow -----
+    @staticmethod
+    def _fresh_shadow_stats() -> dict:
+        return {"runs": 0, "points": 0, "errors": 0, "dropped": 0, "label_mismatches": 0,
+                "abs_diff_sum": dict.fromkeys(NUMERIC, 0.0), "abs_diff_max": dict.fromkeys(NUMERIC, 0.0)}
+
+    def _maybe_shadow(self, lats, lons, dates, elevations, primary: dict):
+        name = self.shadow_name
+        if not name or random.random() >= self.shadow_rate: return
+        with self._lock:
+            if self._pending >= SHADOW_MAX_PENDING:
+                self.shadow_stats["dropped"] += 1
+                return
+            self._pending += 1
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(SHADOW_WORKERS, thread_name_prefix="risk-shadow")
+        self._pool.submit(self._run_shadow, name, list(lats), list(lons), list(dates), list(elevations), primary)
+
+    def _run_shadow(self, name, lats, lons, dates, elevations, primary):
+        st = self.shadow_stats
+        try:
+            model = self.get(name)
+            out = self._timed(model, lambda: model.assess_batch(lats, lons, dates, elevations), len(lats))
+            with self._lock:
+                st["runs"] += 1; st["points"] += len(lats)
+                for b in NUMERIC:
+                    d = np.abs(np.asarray(out[b], dtype=float) - np.asarray(primary[b], dtype=float))
+                    st["abs_diff_sum"][b] += float(d.sum())
+                    st["abs_diff_max"][b] = max(st["abs_diff_max"][b], float(d.max()))
+                st["label_mismatches"] += int((np.asarray(out["label"]) != np.asarray(primary["label"])).sum())
+        except Exception:
+            log.exception("shadow risk model %s failed", name)
+            with self._lock: st["errors"] += 1
+        finally:
+            with self._lock: self._pending -= 1
+
+    def shutdown(self):
+        if self._pool:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    # ----- introspection -----
+    def describe(self) -> dict:
+        with self._lock:
+            st = self.shadow_stats
+            shadow = None
+            if self.shadow_name:
+                n = max(st["points"], 1)
+                shadow = {"name": self.shadow_name, "rate": self.shadow_rate, "pending": self._pending,
+                          **{k: st[k] for k in ("runs", "points", "errors", "dropped", "label_mismatches")},
+                          "mean_abs_diff": {b: round(v / n, 4) for b, v in st["abs_diff_sum"].items()},
+                          "max_abs_diff": st["abs_diff_max"]}
+            return {
+                "active": {"name": self.active_name, "source": self.active.source},
+                "shadow": shadow,
+                "registered": sorted(self._factories),
+                "allowed": sorted(self.allowed),
+                "loaded": {n: m.source for n, m in self._loaded.items()},
+                "latency": {src: t.stats() for src, t in self._timings.items()},
+            }
+
+registry = Registry()
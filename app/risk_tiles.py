@@ -0,0 +1,171 @@
+import functools, glob, hashlib, io, math, os, sys, tempfile
+from datetime import date as _date
+from typing import Callable, Iterable, Optional, Tuple
+
+import numpy as np
+
+from . import risk
+
+# Risk heatmap tiles on the usual z/x/y web-mercator grid. Each tile is a (bands, SIZE, SIZE)
+# uint8 array of whole percentages, written once with np.save and served from a memory map.
+# A tile's file name carries a fingerprint of everything it was computed from (model source,
+# month, grid size, the DEM samples under the tile), so a rebuild only touches tiles whose inputs
+# actually changed - editing one valley in the DEM re-renders just the tiles over that valley.
+# Tiles of different models sit side by side (the name starts with a tag of the model source), so
+# switching models, or shadowing one, never deletes the other model's tiles.
+
+TILE_DIR = os.getenv("RISK_TILE_DIR", ".risk_tiles")
+TILE_SIZE = int(os.getenv("RISK_TILE_SIZE", "256"))
+MAX_ZOOM = int(os.getenv("RISK_TILE_MAX_ZOOM", "12"))
+# above this zoom anonymous requests are only served tiles that are already on disk (precompute,
+# or an admin request renders them): one z12 tile is a 256x256 model run, and there are 16M of them
+PUBLIC_MAX_ZOOM = int(os.getenv("RISK_TILE_PUBLIC_MAX_ZOOM", "10"))
+MAX_AGE_S = int(os.getenv("RISK_TILE_MAX_AGE_S", "86400"))
+BANDS = ("avalanche_pct", "blizzard_pct", "landslide_pct", "overall_pct")
+FORMAT = 1   # bump when the on-disk layout changes
+
+# Optional DEM: a 2-D .npy of elevations in metres on a plain lat/lon grid, row 0 = north edge.
+# RISK_DEM_BOUNDS is "south,west,north,east" (default: the whole globe). Values < -1000 are nodata.
+DEM_PATH = os.getenv("RISK_DEM_PATH")
+DEM_BOUNDS = tuple(float(v) for v in os.getenv("RISK_DEM_BOUNDS", "-90,-180,90,180").split(","))
+
+Model = Callable[..., dict]   # assess_batch(lats, lons, dates, elevations) -> column arrays
+
+# ----- grid -----
+def valid(z: int, x: int, y: int) -> bool:
+    return 0 <= z <= MAX_ZOOM and 0 <= x < 2**z and 0 <= y < 2**z
+
+def cell_centers(z: int, x: int, y: int, size: int = TILE_SIZE) -> Tuple[np.ndarray, np.ndarray]:
+    """(lats, lons) of the pixel centres of tile z/x/y, each (size, size)."""
+    n = 2.0**z
+    t = (np.arange(size) + 0.5) / size
+    lon = (x + t) / n * 360.0 - 180.0
+    lat = np.degrees(np.arctan(np.sinh(math.pi * (1 - 2 * (y + t) / n))))
+    return np.meshgrid(lat, lon, indexing="ij")
+
+@functools.lru_cache(maxsize=1)
+def _dem(path: Optional[str], stamp: Tuple[int, int]) -> Optional[np.ndarray]:
+    return np.load(path, mmap_mode="r") if path else None
+
+def _dem_stamp() -> Tuple[Optional[str], Tuple[int, int]]:
+    try:
+        st = os.stat(DEM_PATH) if DEM_PATH else None
+    except OSError:
+        st = None
+    return (DEM_PATH, (st.st_size, st.st_mtime_ns)) if st else (None, (0, 0))
+
+def elevations(lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Nearest DEM sample per point; NaN where there's no DEM or no data."""
+    dem = _dem(*_dem_stamp())
+    out = np.full(lats.shape, np.nan)
+    if dem is None: return out
+    s, w, n, e = DEM_BOUNDS
+    h, wd = dem.shape
+    r = np.floor((n - lats) / (n - s) * h).astype(int)
+    c = np.floor((lons - w) / (e - w) * wd).astype(int)
+    inside = (r >= 0) & (r < h) & (c >= 0) & (c < wd)
+    vals = np.asarray(dem[r[inside], c[inside]], dtype=float)
+    vals[vals < -1000] = np.nan
+    out[inside] = vals
+    return out
+
+# ----- build -----
+def fingerprint(z: int, x: int, y: int, month: int, elev: np.ndarray, source: str = risk.SOURCE) -> str:
+    h = hashlib.sha1(f"{FORMAT}|{source}|{month}|{TILE_SIZE}|{z}/{x}/{y}".encode())
+    h.update(elev.tobytes())
+    return h.hexdigest()[:16]
+
+@functools.lru_cache(maxsize=8192)
+def _fingerprint(z: int, x: int, y: int, month: int, source: str, dem: tuple) -> str:
+    # dem = _dem_stamp(): a changed DEM file is a new key, so a cached fingerprint is never stale
+    lats, lons = cell_centers(z, x, y)
+    return fingerprint(z, x, y, month, elevations(lats, lons).ravel(), source)
+
+def _dir(z: int, x: int, y: int) -> str:
+    return os.path.join(TILE_DIR, str(z), str(x), str(y))
+
+@functools.lru_cache(maxsize=64)
+def _source_tag(source: str) -> str:
+    return hashlib.sha1(source.encode()).hexdigest()[:8]
+
+def path(z: int, x: int, y: int, month: int, fp: str, source: str = risk.SOURCE) -> str:
+    return os.path.join(_dir(z, x, y), f"{month:02d}-{_source_tag(source)}-{fp}.npy")
+
+def render(lats: np.ndarray, lons: np.ndarray, elev: np.ndarray, month: int, model: Model = risk.assess_batch) -> np.ndarray:
+    day = _date(2000, month, 15).isoformat()   # the models only look at the month
+    r = model(lats.ravel(), lons.ravel(), [day] * elev.size, elev)
+    grid = np.stack([np.asarray(r[b], dtype=float) for b in BANDS])
+    return np.rint(np.clip(grid, 0, 100)).astype(np.uint8).reshape(len(BANDS), TILE_SIZE, TILE_SIZE)
+
+def ensure(z: int, x: int, y: int, month: int, model: Model = risk.assess_batch,
+           source: str = risk.SOURCE, build: bool = True) -> Tuple[Optional[str], str, bool]:
+    """
+    (path, fingerprint, built) for the current inputs; renders the tile only if it isn't on disk yet.
+    With build=False a missing tile is not rendered and path is None.
+    """
+    dem = _dem_stamp()
+    fp = _fingerprint(z, x, y, month, source, dem)   # a hit costs a stat and this lookup
+    p = path(z, x, y, month, fp, source)
+    if os.path.exists(p):
+        return p, fp, False
+    if not build:
+        return None, fp, False
+    lats, lons = cell_centers(z, x, y)
+    elev = elevations(lats, lons).ravel()
+    os.makedirs(_dir(z, x, y), exist_ok=True)
+    # a temp file of our own: threads rendering the same tile must not share one
+    with tempfile.NamedTemporaryFile(dir=_dir(z, x, y), suffix=".tmp", delete=False) as f:
+        np.save(f, render(lats, lons, elev, month, model))
+    os.replace(f.name, p)
+    # drop this model's tiles for superseded inputs - unless the DEM changed while we rendered,
+    # in which case ours is the superseded one and the newer tile must stay
+    if _dem_stamp() == dem:
+        for old in glob.glob(os.path.join(_dir(z, x, y), f"{month:02d}-{_source_tag(source)}-*.npy")):
+            if old != p:
+                try: os.remove(old)
+                except OSError: pass
+    return p, fp, True
+
+@functools.lru_cache(maxsize=512)
+def load(p: str) -> np.ndarray:
+    # safe to cache by path: a path never gets different contents
+    return np.load(p, mmap_mode="r")
+
+def read(p: str, band: str = "all") -> bytes:
+    """.npy bytes of the tile at p, all bands or one; FileNotFoundError if a rebuild removed it."""
+    if band == "all":
+        with open(p, "rb") as f: return f.read()
+    buf = io.BytesIO()
+    np.save(buf, load(p)[BANDS.index(band)])
+    return buf.getvalue()
+
+def precompute(zooms: Iterable[int], months: Iterable[int] = range(1, 13),
+               bbox: Optional[Tuple[float, float, float, float]] = None) -> dict:
+    """Build every tile for zooms x months (optionally only those touching bbox = south,west,north,east)."""
+    built = reused = 0
+    for z in zooms:
+        x0, y0, x1, y1 = 0, 0, 2**z - 1, 2**z - 1
+        if bbox:
+            s, w, n, e = bbox
+            x0, y1 = _tile_xy(z, s, w)
+            x1, y0 = _tile_xy(z, n, e)
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                for m in months:
+                    if ensure(z, x, y, m)[2]: built += 1
+                    else: reused += 1
+    return {"built": built, "reused": reused}
+
+def _tile_xy(z: int, lat: float, lon: float) -> Tuple[int, int]:
+    n = 2**z
+    lat = max(min(lat, 85.0511), -85.0511)
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+if __name__ == "__main__":
+    # python -m app.risk_tiles 5        -> precompute zooms 0..5 for all months
+    # python -m app.risk_tiles 6 8      -> zooms 6..8
+    args = [int(a) for a in sys.argv[1:3]] or [3]
+    lo, hi = (0, args[0]) if len(args) == 1 else args
+    print(precompute(range(lo, hi + 1)))
@@ -34,13 +34,56 @@ class AssessOut(BaseModel):
     elevation_m: float | None = None
     risk: RiskBreakdown
 
+class BatchPoint(BaseModel):
+    lat: float = Field(..., ge=-90, le=90)
+    lon: float = Field(..., ge=-180, le=180)
+    date: Optional[str] = None
+    elevation_m: Optional[float] = Field(None, ge=-500, le=9000)
+
+    @field_validator("date")
+    @classmethod
+    def _date_fmt(cls, v):
+        return AssessIn._date_fmt(v)
+
+class AssessBatchIn(BaseModel):
+    # either explicit points, or a polyline (+ optional elevation profile) scored for each date
+    points: Optional[List[BatchPoint]] = None
+    polyline: Optional[List[List[float]]] = None         # [[lat, lon], ...]
+    elevations_m: Optional[List[Optional[float]]] = None  # one per polyline vertex
+    date: Optional[str] = None                           # single date (default today)
+    date_from: Optional[str] = None                      # inclusive range, one pass per day
+    date_to: Optional[str] = None
+
+    @field_validator("date", "date_from", "date_to")
+    @classmethod
+    def _date_fmt(cls, v):
+        return AssessIn._date_fmt(v)
+
+class SegmentRisk(BaseModel):
+    index: int
+    start: list[float]
+    end: list[float]
+    max_overall_pct: float
+    mean_overall_pct: float
+    label: str
+    worst_date: str
+
+class AssessBatchOut(BaseModel):
+    count: int
+    items: list[AssessOut]
+    segments: list[SegmentRisk]
+    worst: AssessOut | None = None
+
 class HistoryItem(BaseModel):
     id: int
     lat: float
     lon: float
     date: str
+    elevation_m: float | None = None
     overall_pct: float
     label: str
+    source: str | None = None
+    hit_count: int = 1
     created_at: str
 
 # ----------- Treks / Recs -----------
@@ -69,7 +112,8 @@ class UserProfile(BaseModel):
     experience: Literal["beginner", "intermediate", "advanced"] = "beginner"
     fitness: Literal["low", "moderate", "high"] = "moderate"
     budget: Literal["low", "medium", "high"] = "medium"
-    preferences: list[str] = []
+    preferences: list[str] = []   # words/phrases matched against trek highlights, name, location, season
+    limit: int = Field(20, ge=1, le=500)
 
 class TrekReco(BaseModel):
     trek: TrekOut
@@ -87,3 +131,4 @@ class ChatOut(BaseModel):
     reply: str
     showPlan: bool = False
     selectedTrekId: int | None = None
+    intent: str | None = None   # router decision: altitude, season, places, ..., llm, stub (no model configured), or cache
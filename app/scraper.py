@@ -1,61 +1,351 @@
+import asyncio, hashlib, importlib.util, ipaddress, json, logging, os, re, socket, time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Set, Tuple
+from urllib import robotparser
+from urllib.parse import urldefrag, urljoin, urlsplit
+
 import httpx
-from typing import List, Dict
+from bs4 import BeautifulSoup
+
+from . import executors, osm, storage
+
+# optional: lxml parses several times faster than the stdlib parser
+PARSER = "lxml" if importlib.util.find_spec("lxml") else "html.parser"
+
+log = logging.getLogger(__name__)
+
+# HTML scraper feeding places (source='scrape'). Lodging / restaurant / guide listings are read
+# from schema.org markup (JSON-LD and microdata), which most listing sites carry for search engines.
+#  - asyncio crawler: CONCURRENCY fetches overall, HOST_CONCURRENCY per host, and per-host spacing of
+#    robots.txt's Crawl-delay (else DELAY_S); URLs robots.txt disallows are never fetched
+#  - conditional GETs: each page's ETag / Last-Modified / body hash is kept in scrape_pages, so a
+#    re-crawl skips pages that answer 304 or come back byte-identical
+#  - parsing runs in a process pool (PARSE_WORKERS; 0 = one thread), off the event loop
+#  - records come out of Crawler.records() as they are parsed; callers batch them into bulk_upsert
+#  - every request (seeds, followed links, redirects, robots.txt) goes through check_url: hosts must
+#    be in SCRAPE_ALLOWED_HOSTS when that is set, and must not resolve to loopback / private /
+#    link-local / reserved addresses unless SCRAPE_ALLOW_PRIVATE=1
+
+CONCURRENCY = int(os.getenv("SCRAPE_CONCURRENCY", "16"))
+HOST_CONCURRENCY = int(os.getenv("SCRAPE_HOST_CONCURRENCY", "2"))
+DELAY_S = float(os.getenv("SCRAPE_DELAY_S", "1.0"))          # between requests to one host, unless robots.txt says otherwise
+PARSE_WORKERS = int(os.getenv("SCRAPE_PARSE_WORKERS", str(min(4, os.cpu_count() or 1))))
+MAX_PAGES = int(os.getenv("SCRAPE_MAX_PAGES", "1000"))       # per crawl
+MAX_BYTES = int(os.getenv("SCRAPE_MAX_BYTES", str(2 << 20)))
+MAX_RETRIES = 2
+AGENT = "smart-trek-planner"                                  # robots.txt token; full UA in osm.HEADERS
+QUEUE_SIZE = 1000                                             # parsed records waiting for the consumer
+# "example.com" also allows its subdomains; empty = any public host
+ALLOWED_HOSTS = {h.strip().lower().lstrip(".") for h in os.getenv("SCRAPE_ALLOWED_HOSTS", "").split(",") if h.strip()}
+ALLOW_PRIVATE = os.getenv("SCRAPE_ALLOW_PRIVATE", "0") == "1"
+
+class BlockedURL(ValueError):
+    pass
+
+def _host_allowed(host: str) -> bool:
+    return not ALLOWED_HOSTS or any(host == h or host.endswith("." + h) for h in ALLOWED_HOSTS)
+
+async def check_url(url: str, allow_private: bool = ALLOW_PRIVATE):
+    """Raise BlockedURL unless url is http(s) on an allowed host with only public addresses."""
+    parts = urlsplit(url)
+    host = (parts.hostname or "").lower()
+    if parts.scheme not in ("http", "https") or not host:
+        raise BlockedURL(f"not an http(s) URL: {url}")
+    if not _host_allowed(host):
+        raise BlockedURL(f"{host} is not in SCRAPE_ALLOWED_HOSTS")
+    if allow_private: return
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(host, parts.port or 443, type=socket.SOCK_STREAM)
+    except socket.gaierror:
+        raise BlockedURL(f"cannot resolve {host}")
+    for *_, addr in infos:
+        ip = ipaddress.ip_address(addr[0].split("%")[0])
+        ip = getattr(ip, "ipv4_mapped", None) or ip
+        if not ip.is_global:
+            raise BlockedURL(f"{host} resolves to a non-public address ({ip})")
+
+def init_db():
+    con = storage.connect()
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS scrape_pages(
+        url TEXT PRIMARY KEY,
+        etag TEXT,
+        last_modified TEXT,
+        body_hash TEXT,                -- sha1 of the last parsed body
+        status INTEGER,
+        records INTEGER NOT NULL DEFAULT 0,
+        links TEXT,                    -- JSON list of outgoing links, so an unchanged page still leads on
+        fetched_at TEXT NOT NULL
+    );
+    """)
+    con.commit()
 
-OSM_KINDS = {
-    "restaurant": [('amenity','restaurant')],
-    "cafe": [('amenity','cafe'), ('amenity','fast_food')],
-    "lodging": [('tourism','hotel'), ('tourism','guest_house'), ('tourism','hostel'), ('tourism','motel'), ('tourism','alpine_hut')],
-    "resort": [('tourism','resort')],
+def _validators(url: str) -> Optional[dict]:
+    r = storage.connect().execute("SELECT * FROM scrape_pages WHERE url = ?;", (url,)).fetchone()
+    return dict(r) if r else None
+
+def _save_page(url: str, status: int, etag: Optional[str] = None, last_modified: Optional[str] = None,
+               body_hash: Optional[str] = None, records: Optional[int] = None, links: Optional[List[str]] = None):
+    # a 304 only refreshes status / fetched_at; otherwise validators are replaced (records / links only when parsed)
+    con = storage.connect()
+    links_json = json.dumps(links) if links is not None else None
+    con.execute("""
+        INSERT INTO scrape_pages(url, etag, last_modified, body_hash, status, records, links, fetched_at)
+        VALUES (?, ?, ?, ?, ?, COALESCE(?, 0), ?, datetime('now'))
+        ON CONFLICT(url) DO UPDATE SET status = excluded.status, fetched_at = excluded.fetched_at,
+            etag = CASE WHEN excluded.status = 304 THEN etag ELSE excluded.etag END,
+            last_modified = CASE WHEN excluded.status = 304 THEN last_modified ELSE excluded.last_modified END,
+            body_hash = CASE WHEN excluded.status = 304 THEN body_hash ELSE excluded.body_hash END,
+            records = COALESCE(?, records), links = COALESCE(excluded.links, links);
+    """, (url, etag, last_modified, body_hash, status, records, links_json, records))
+    con.commit()
+
+# ----- parsing (runs in the pool; module-level so it pickles) -----
+_KINDS = {
+    "Hotel": "lodging", "Hostel": "lodging", "Motel": "lodging", "BedAndBreakfast": "lodging",
+    "LodgingBusiness": "lodging", "Campground": "lodging", "Resort": "resort",
+    "Restaurant": "restaurant", "FoodEstablishment": "restaurant", "CafeOrCoffeeShop": "cafe",
+    "TravelAgency": "guide", "TouristInformationCenter": "guide",
 }
+_SPACE = re.compile(r"\s+")
 
-def _build_overpass(lat: float, lon: float, radius_m: int, kinds: list[str]) -> str:
-    # nodes/ways/relations with a center, around given point
-    clauses = []
-    for kind in kinds:
-        for k,v in OSM_KINDS.get(kind, []):
-            for typ in ("node","way","relation"):
-                clauses.append(f'{typ}["{k}"="{v}"](around:{radius_m},{lat},{lon});')
-    body = "\n".join(clauses)
-    return f"[out:json][timeout:25];({body});out center;"
-
-def fetch_osm(lat: float, lon: float, radius_m: int = 2000, kinds: list[str] = ["restaurant","cafe","lodging","resort"]) -> List[Dict]:
-    ql = _build_overpass(lat, lon, radius_m, kinds)
-    headers = {"User-Agent": "smart-trek-planner/0.1 (hackathon)"}
-    with httpx.Client(timeout=30) as client:
-        r = client.post("https://overpass-api.de/api/interpreter", data={"data": ql}, headers=headers)
-        r.raise_for_status()
-        data = r.json()
-    out = []
-    for el in data.get("elements", []):
-        tags = el.get("tags", {}) or {}
-        name = tags.get("name")
-        if not name: continue
-        lat2, lon2 = None, None
-        if "lat" in el and "lon" in el:
-            lat2, lon2 = el["lat"], el["lon"]
-        elif "center" in el:
-            lat2, lon2 = el["center"]["lat"], el["center"]["lon"]
-        else:
+def _text(v) -> Optional[str]:
+    if v is None: return None
+    if isinstance(v, dict): v = v.get("name") or v.get("@id")
+    if isinstance(v, list): v = v[0] if v else None
+    s = _SPACE.sub(" ", str(v)).strip() if v is not None else ""
+    return s or None
+
+def _float(v) -> Optional[float]:
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return None
+
+def _kind(types) -> Optional[Tuple[str, str]]:
+    for t in types if isinstance(types, list) else [types]:
+        t = str(t).rsplit("/", 1)[-1]
+        if t in _KINDS: return t, _KINDS[t]
+    return None
+
+def _address(v) -> Optional[str]:
+    if isinstance(v, dict):
+        parts = [v.get(k) for k in ("streetAddress", "addressLocality", "addressRegion", "addressCountry")]
+        return ", ".join(_text(p) for p in parts if _text(p)) or None
+    return _text(v)
+
+def _record(page: str, schema_type: str, kind: str, f: dict) -> Optional[dict]:
+    name, lat, lon = _text(f.get("name")), _float(f.get("latitude")), _float(f.get("longitude"))
+    if not name or lat is None or lon is None: return None   # places need a name and coordinates
+    return {
+        "source": "scrape",
+        "source_id": _text(f.get("id")) or f"{page}#{name}",
+        "name": name,
+        "kind": kind,
+        "lat": lat,
+        "lon": lon,
+        "address": _address(f.get("address")),
+        "phone": _text(f.get("telephone")),
+        "website": _text(f.get("url")) or page,
+        "rating": _float(f.get("rating")),
+        "price": _text(f.get("priceRange")),
+        "tags": {"page": page, "schema_type": schema_type},
+    }
+
+def _ld_nodes(doc) -> Iterable[dict]:
+    if isinstance(doc, list):
+        for d in doc: yield from _ld_nodes(d)
+    elif isinstance(doc, dict):
+        yield doc
+        if "@graph" in doc: yield from _ld_nodes(doc["@graph"])
+
+def _from_ld(node: dict, page: str) -> Optional[dict]:
+    k = _kind(node.get("@type"))
+    if not k: return None
+    geo = node.get("geo") if isinstance(node.get("geo"), dict) else {}
+    rating = node.get("aggregateRating") if isinstance(node.get("aggregateRating"), dict) else {}
+    return _record(page, *k, {**node, "id": node.get("@id"), "latitude": geo.get("latitude", node.get("latitude")),
+                              "longitude": geo.get("longitude", node.get("longitude")), "rating": rating.get("ratingValue")})
+
+def _from_microdata(el, page: str) -> Optional[dict]:
+    k = _kind(el.get("itemtype", "").split())
+    if not k: return None
+    f = {}
+    for prop in el.find_all(itemprop=True):
+        key = prop["itemprop"]
+        if key in f: continue   # first (outermost) value wins
+        f[key] = prop.get("content") or prop.get("href") or prop.get_text(" ", strip=True)
+    f["id"] = el.get("itemid")
+    f["rating"] = f.get("ratingValue")
+    return _record(page, *k, f)
+
+def parse_page(url: str, html: str) -> Tuple[List[dict], List[str]]:
+    """(place records, absolute links) of one page."""
+    soup = BeautifulSoup(html, PARSER)
+    records: List[dict] = []
+    for tag in soup.find_all("script", type="application/ld+json"):
+        try:
+            doc = json.loads(tag.string or "")
+        except ValueError:
             continue
-        knd = None
-        for k in kinds:
-            for tk, tv in OSM_KINDS.get(k, []):
-                if tags.get(tk) == tv:
-                    knd = k; break
-            if knd: break
-        addr = ", ".join(filter(None, [tags.get("addr:street"), tags.get("addr:place"), tags.get("addr:city")]))
-        out.append({
-            "source": "osm",
-            "source_id": f'{el.get("type","node")}:{el.get("id")}',
-            "name": name,
-            "kind": knd or "poi",
-            "lat": float(lat2),
-            "lon": float(lon2),
-            "address": addr or None,
-            "phone": tags.get("phone") or tags.get("contact:phone"),
-            "website": tags.get("website") or tags.get("contact:website"),
-            "rating": None,
-            "price": None,
-            "tags": tags,
-        })
-    return out
+        records += filter(None, (_from_ld(n, url) for n in _ld_nodes(doc)))
+    if not records:
+        records += filter(None, (_from_microdata(el, url) for el in soup.find_all(itemscope=True, itemtype=True)))
+    links = [urldefrag(urljoin(url, a["href"]))[0] for a in soup.find_all("a", href=True)]
+    return records, links
+
+_pool: Optional[Executor] = None
+
+def _executor() -> Executor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(PARSE_WORKERS) if PARSE_WORKERS > 0 else ThreadPoolExecutor(1, "scrape-parse")
+    return _pool
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+# ----- crawling -----
+class _Host:
+    def __init__(self, robots: robotparser.RobotFileParser, delay_s: float, concurrency: int):
+        self.robots, self.delay_s = robots, delay_s
+        self.sem = asyncio.Semaphore(concurrency)
+        self.lock = asyncio.Lock()
+        self.next_at = 0.0
+
+    async def turn(self):
+        # requests to one host start at least delay_s apart
+        async with self.lock:
+            now = time.monotonic()
+            wait = self.next_at - now
+            self.next_at = max(now, self.next_at) + self.delay_s
+        if wait > 0: await asyncio.sleep(wait)
+
+    def back_off(self, seconds: float):
+        self.next_at = max(self.next_at, time.monotonic() + seconds)
+
+class Crawler:
+    """
+    Breadth-first crawl from `seeds`, following links up to max_depth hops (on the seeds' hosts
+    unless same_host=False). Iterate records() for the places found; stats has the page counts.
+    """
+    def __init__(self, seeds: List[str], max_pages: int = MAX_PAGES, max_depth: int = 1, same_host: bool = True,
+                 force: bool = False, concurrency: int = CONCURRENCY, host_concurrency: int = HOST_CONCURRENCY,
+                 delay_s: float = DELAY_S, allow_private: bool = ALLOW_PRIVATE):
+        self.seeds, self.max_pages, self.max_depth = list(dict.fromkeys(seeds)), max_pages, max_depth
+        self.force, self.concurrency, self.host_concurrency, self.delay_s = force, concurrency, host_concurrency, delay_s
+        self.hosts_allowed = {urlsplit(u).netloc for u in self.seeds} if same_host else None
+        self.stats = {"pages": 0, "not_modified": 0, "unchanged": 0, "disallowed": 0, "page_errors": 0, "records": 0}
+        self._hosts: Dict[str, "asyncio.Task[_Host]"] = {}
+        self._seen: Set[str] = set()
+        self.allow_private = allow_private
+        self._checked: Dict[str, "asyncio.Task[None]"] = {}   # host -> its check_url, once per crawl
+
+    async def _check(self, request: httpx.Request):
+        # request hook: also sees redirects, so a public page can't bounce the crawler inward
+        host = request.url.host
+        if host not in self._checked:
+            self._checked[host] = asyncio.ensure_future(check_url(str(request.url), self.allow_private))
+        await self._checked[host]
+
+    async def records(self) -> AsyncIterator[dict]:
+        frontier: "asyncio.Queue[Tuple[str, int]]" = asyncio.Queue()
+        out: "asyncio.Queue[Optional[dict]]" = asyncio.Queue(QUEUE_SIZE)   # full queue pauses the workers
+        for u in self.seeds[:self.max_pages]:
+            self._seen.add(u); frontier.put_nowait((u, 0))
+        async with httpx.AsyncClient(timeout=30, headers=osm.HEADERS, follow_redirects=True,
+                                     event_hooks={"request": [self._check]}) as client:
+            async def worker():
+                while True:
+                    url, depth = await frontier.get()
+                    try:
+                        await self._visit(client, url, depth, frontier, out)
+                    except Exception as e:
+                        self.stats["page_errors"] += 1
+                        log.warning("scrape %s failed: %s", url, e)
+                    finally:
+                        frontier.task_done()
+
+            async def done():
+                await frontier.join()
+                await out.put(None)
+
+            tasks = [asyncio.create_task(worker()) for _ in range(self.concurrency)] + [asyncio.create_task(done())]
+            try:
+                while (rec := await out.get()) is not None:
+                    yield rec
+            finally:
+                for t in tasks: t.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _host(self, client: httpx.AsyncClient, url: str) -> _Host:
+        parts = urlsplit(url)
+        if parts.netloc not in self._hosts:   # one robots.txt fetch per host, shared by concurrent workers
+            self._hosts[parts.netloc] = asyncio.ensure_future(self._load_host(client, f"{parts.scheme}://{parts.netloc}"))
+        return await self._hosts[parts.netloc]
+
+    async def _load_host(self, client: httpx.AsyncClient, origin: str) -> _Host:
+        rp = robotparser.RobotFileParser(origin + "/robots.txt")
+        try:
+            r = await client.get(origin + "/robots.txt")
+            if r.status_code >= 500: rp.disallow_all = True     # server trouble: stay away (RFC 9309)
+            elif r.status_code >= 400: rp.allow_all = True      # no robots.txt
+            else: rp.parse(r.text.splitlines())
+        except httpx.HTTPError:
+            rp.disallow_all = True
+        delay = rp.crawl_delay(AGENT)
+        return _Host(rp, float(delay) if delay is not None else self.delay_s, self.host_concurrency)
+
+    async def _visit(self, client: httpx.AsyncClient, url: str, depth: int, frontier, out):
+        host = await self._host(client, url)
+        if not host.robots.can_fetch(AGENT, url):
+            self.stats["disallowed"] += 1
+            return
+        known = None if self.force else await executors.ingest.run(_validators, url)
+        headers = {}
+        if known and known["etag"]: headers["If-None-Match"] = known["etag"]
+        if known and known["last_modified"]: headers["If-Modified-Since"] = known["last_modified"]
+        async with host.sem:
+            for attempt in range(MAX_RETRIES + 1):
+                await host.turn()
+                r = await client.get(url, headers=headers)
+                if r.status_code in (429, 503) and attempt < MAX_RETRIES:
+                    host.back_off(osm._retry_after(r, attempt))
+                    continue
+                break
+        self.stats["pages"] += 1
+        if r.status_code == 304:
+            self.stats["not_modified"] += 1
+            await executors.ingest.run(_save_page, url, 304)
+            self._follow(json.loads(known["links"] or "[]"), depth, frontier)
+            return
+        r.raise_for_status()
+        if "html" not in r.headers.get("content-type", "text/html") or len(r.content) > MAX_BYTES:
+            return
+        body_hash = hashlib.sha1(r.content).hexdigest()
+        validators = (r.headers.get("etag"), r.headers.get("last-modified"), body_hash)
+        if known and known["body_hash"] == body_hash:
+            # server without validators (or ignoring them), page unchanged: nothing to parse
+            self.stats["unchanged"] += 1
+            await executors.ingest.run(_save_page, url, r.status_code, *validators)
+            self._follow(json.loads(known["links"] or "[]"), depth, frontier)
+            return
+        records, links = await asyncio.get_running_loop().run_in_executor(_executor(), parse_page, str(r.url), r.text)
+        for rec in records:
+            await out.put(rec)
+        self.stats["records"] += len(records)
+        await executors.ingest.run(_save_page, url, r.status_code, *validators, len(records), links)
+        self._follow(links, depth, frontier)
+
+    def _follow(self, links: List[str], depth: int, frontier):
+        if depth >= self.max_depth: return
+        for link in links:
+            if len(self._seen) >= self.max_pages: break
+            parts = urlsplit(link)
+            if parts.scheme not in ("http", "https") or link in self._seen: continue
+            if self.hosts_allowed is not None and parts.netloc not in self.hosts_allowed: continue
+            self._seen.add(link)
+            frontier.put_nowait((link, depth + 1))
@@ -0,0 +1,80 @@
+import re
+from typing import Dict, List, Optional
+
+from rapidfuzz import fuzz, utils
+
+from . import places_db
+
+# Place search over places_fts / places_trgm (see places_db).
+#  1. the query is reduced to word tokens, each quoted (no FTS syntax gets through) and
+#     prefix-matched, all required: "namche baz" -> "namche"* "baz"*
+#  2. hits are ranked by bm25 (name weighted over address over tags); with lat/lon the score is
+#     damped by distance, so a nearby decent match beats a far-away perfect one
+#  3. if that leaves the page short, names sharing trigrams with the query become candidates and
+#     rapidfuzz picks the close ones - typo tolerance without scanning the table
+
+MAX_TOKENS = 8
+BM25_WEIGHTS = (10.0, 3.0, 1.0)   # name, address, tags
+DIST_SCALE_KM = 10.0              # relevance halves at this distance
+FUZZY_CANDIDATES = 200
+FUZZY_MIN_SCORE = 75.0
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+def tokenize(q: str) -> List[str]:
+    return _TOKEN.findall(q.casefold())[:MAX_TOKENS]
+
+def fts_query(tokens: List[str]) -> str:
+    return " ".join(f'"{t}"*' for t in tokens)
+
+def _trigram_query(tokens: List[str]) -> str:
+    grams = {t[i:i+3] for t in tokens if len(t) >= 3 for i in range(len(t) - 2)}
+    return " OR ".join(f'"{g}"' for g in sorted(grams))
+
+def _boost(relevance: float, row: dict, lat: Optional[float], lon: Optional[float]) -> float:
+    if lat is None or lon is None: return relevance
+    d = places_db._haversine(lat, lon, row["lat"], row["lon"])
+    row["distance_m"] = round(d, 1)
+    return relevance / (1.0 + d / 1000.0 / DIST_SCALE_KM)
+
+def _fts(con, tokens, kind, n) -> List[dict]:
+    sql = f"""
+        SELECT p.*, -bm25(places_fts, {", ".join(map(str, BM25_WEIGHTS))}) AS relevance
+        FROM places_fts CROSS JOIN places p ON p.id = places_fts.rowid
+        WHERE places_fts MATCH ?{" AND p.kind = ?" if kind else ""}
+        ORDER BY bm25(places_fts, {", ".join(map(str, BM25_WEIGHTS))}) LIMIT ?;
+    """
+    return [dict(r) for r in con.execute(sql, (fts_query(tokens), *((kind,) if kind else ()), n))]
+
+def _fuzzy(con, q: str, tokens, kind, exclude) -> List[dict]:
+    tq = _trigram_query(tokens)
+    if not tq: return []
+    sql = f"""
+        SELECT p.* FROM places_trgm CROSS JOIN places p ON p.id = places_trgm.rowid
+        WHERE places_trgm MATCH ?{" AND p.kind = ?" if kind else ""}
+        ORDER BY rank LIMIT ?;
+    """
+    out = []
+    for r in con.execute(sql, (tq, *((kind,) if kind else ()), FUZZY_CANDIDATES)):
+        if r["id"] in exclude: continue
+        score = fuzz.WRatio(q, r["name"], processor=utils.default_process)
+        if score >= FUZZY_MIN_SCORE:
+            o = dict(r); o["relevance"] = score / 100.0; o["match"] = "fuzzy"; out.append(o)
+    return out
+
+def search(q: str, limit: int = 20, lat: Optional[float] = None, lon: Optional[float] = None,
+           kind: Optional[str] = None) -> List[dict]:
+    """Places rows plus relevance (higher is better), match ('fts' | 'fuzzy') and distance_m when lat/lon given."""
+    tokens = tokenize(q)
+    if not tokens: return []
+    con = places_db._conn()
+    # with a distance boost the bm25 order isn't final, so look a bit deeper than the page
+    hits = _fts(con, tokens, kind, limit if lat is None else max(limit * 5, 50))
+    for h in hits: h["match"] = "fts"
+    if len(hits) < limit:
+        hits += _fuzzy(con, " ".join(tokens), tokens, kind, {h["id"] for h in hits})
+    scored: Dict[int, dict] = {}
+    for h in hits:
+        h["score"] = _boost(h["relevance"], h, lat, lon)
+        scored.setdefault(h["id"], h)
+    # fts hits always rank above fuzzy ones; within each group by (boosted) score
+    return sorted(scored.values(), key=lambda h: (h["match"] != "fts", -h["score"]))[:limit]
@@ -0,0 +1,60 @@
+import os, sqlite3, threading
+from typing import List
+
+# Shared SQLite access for db.py / places_db.py / ingest_jobs.py.
+# Each thread keeps one long-lived connection per database file, so the per-connection
+# statement cache actually gets reused; WAL lets readers run alongside the single writer.
+
+DB_PATH = os.getenv("SAFETY_DB_PATH", "safety.db")
+BUSY_TIMEOUT_S = float(os.getenv("SAFETY_DB_BUSY_TIMEOUT_S", "10"))
+CACHED_STATEMENTS = 256
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL;",
+    "PRAGMA synchronous=NORMAL;",      # WAL + NORMAL: durable across app crashes, fsync only on checkpoint
+    "PRAGMA mmap_size=268435456;",     # 256 MiB
+    "PRAGMA cache_size=-32768;",       # 32 MiB page cache per connection
+    "PRAGMA temp_store=MEMORY;",
+)
+
+_local = threading.local()
+_all: List[sqlite3.Connection] = []
+_lock = threading.Lock()
+_generation = 0   # bumped by close_all(); pooled connections from an older generation are reopened
+
+def configure(path: str):
+    """Point the storage layer at another database file (existing pooled connections are closed)."""
+    global DB_PATH
+    close_all()
+    DB_PATH = path
+
+def _open(path: str) -> sqlite3.Connection:
+    # check_same_thread=False only so close_all() can close it at shutdown; it is never shared
+    con = sqlite3.connect(path, timeout=BUSY_TIMEOUT_S, cached_statements=CACHED_STATEMENTS, check_same_thread=False)
+    con.row_factory = sqlite3.Row
+    for p in PRAGMAS:
+        con.execute(p)
+    with _lock:
+        _all.append(con)
+    return con
+
+def connect() -> sqlite3.Connection:
+    """This thread's pooled connection to DB_PATH. Callers commit/rollback but never close it."""
+    pool = getattr(_local, "pool", None)
+    if pool is None or getattr(_local, "generation", None) != _generation:
+        pool = _local.pool = {}
+        _local.generation = _generation
+    con = pool.get(DB_PATH)
+    if con is None:
+        con = pool[DB_PATH] = _open(DB_PATH)
+    return con
+
+def close_all():
+    global _generation
+    with _lock:
+        cons, _all[:] = list(_all), []
+        _generation += 1
+    for con in cons:
+        try:
+            con.close()
+        except sqlite3.Error:
+            pass
@@ -0,0 +1,170 @@
+import logging, os, threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from . import db
+
+log = logging.getLogger(__name__)
+
+# Write-behind buffer for /risk/assess: rows get their id up front (from a block reserved in
+# sqlite_sequence), are readable immediately through get()/recent(), and reach SQLite in
+# batched transactions once FLUSH_SIZE rows are queued or FLUSH_INTERVAL_S has passed.
+# The flusher thread keeps a spare id block reserved, so submit() normally touches no SQLite at all.
+
+FLUSH_SIZE = int(os.getenv("ASSESS_FLUSH_SIZE", "200"))
+FLUSH_INTERVAL_S = float(os.getenv("ASSESS_FLUSH_INTERVAL_S", "0.5"))
+ID_BLOCK = 1000
+STRICT = os.getenv("ASSESS_WRITE_MODE", "behind") == "strict"   # every write durable before the response
+
+class AssessmentWriter:
+    def __init__(self, flush_size: int = FLUSH_SIZE, flush_interval_s: float = FLUSH_INTERVAL_S, strict: bool = STRICT):
+        self.flush_size = flush_size
+        self.flush_interval_s = flush_interval_s
+        self.strict = strict
+        self._cv = threading.Condition()
+        self._pending: Dict[int, dict] = {}    # id -> row, until committed
+        self._queue: List[int] = []
+        self._inflight: set = set()            # ids being written by the current flush
+        self._hits: Dict[int, int] = {}        # hit_count increments for rows already (being) written
+        self._block: range = range(0)          # ids being handed out, from _pos on
+        self._pos = 0
+        self._spare: Optional[range] = None    # next block, reserved ahead by the flusher
+        self.sync_reserves = 0                 # times submit() had to reserve a block itself
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self.flushed = 0
+        self.flushes = 0
+
+    # ----- lifecycle -----
+    def start(self):
+        if self._thread and self._thread.is_alive(): return
+        self._stopping = False
+        with self._cv:   # ids left from an earlier run are skipped (the database may have been swapped since)
+            self._block, self._pos, self._spare = range(0), 0, None
+        self._refill()
+        self._thread = threading.Thread(target=self._run, name="assessment-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Flush everything still buffered and stop the background thread."""
+        with self._cv:
+            self._stopping = True
+            self._cv.notify()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def ids_ready(self) -> bool:
+        """True if submit() can hand out an id without reserving a block (i.e. without SQLite)."""
+        return self._pos < len(self._block) or self._spare is not None
+
+    # ----- writes -----
+    def _take_id(self) -> Optional[int]:
+        # caller holds _cv; None when both blocks are used up
+        if self._pos >= len(self._block):
+            if self._spare is None: return None
+            self._block, self._pos, self._spare = self._spare, 0, None
+            self._cv.notify()   # the flusher reserves the next spare
+        self._pos += 1
+        return self._block[self._pos - 1]
+
+    def _refill(self):
+        # reserve the spare block (a SQLite write), never while holding _cv
+        with self._cv:
+            if self._spare is not None: return
+        block = db.reserve_ids(ID_BLOCK)
+        with self._cv:
+            if self._spare is None: self._spare = block   # else lost a race: the ids are just skipped
+
+    def submit(self, rec: Dict[str, Any], durable: bool = False) -> int:
+        """Queue one assessment and return its id. durable (or strict mode) writes it synchronously instead."""
+        if durable or self.strict or not self.running:
+            return db.insert_assessment(rec, durable=durable or self.strict)
+        created_at = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")   # as datetime('now')
+        while True:
+            with self._cv:
+                rid = self._take_id()
+                if rid is not None:
+                    self._pending[rid] = db.as_row(rec, rid, created_at)
+                    self._queue.append(rid)
+                    if len(self._queue) >= self.flush_size: self._cv.notify()
+                    return rid
+                self.sync_reserves += 1
+            self._refill()   # the flusher fell behind
+
+    def add_hit(self, rid: int, durable: bool = False):
+        """Count one more identical assessment against row rid."""
+        if durable or self.strict or not self.running:
+            db.add_hits({rid: 1}); return
+        with self._cv:
+            row = self._pending.get(rid)
+            if row is not None and rid not in self._inflight:
+                row["hit_count"] += 1
+            else:
+                self._hits[rid] = self._hits.get(rid, 0) + 1
+
+    def flush(self) -> int:
+        with self._cv:
+            ids, self._queue = self._queue, []
+            rows = [self._pending[i] for i in ids]
+            hits, self._hits = self._hits, {}
+            self._inflight = set(ids)
+        if not rows and not hits: return 0
+        try:
+            if rows: db.insert_rows(rows)
+        except Exception:
+            log.exception("assessment flush failed; %d rows kept for retry", len(rows))
+            with self._cv:
+                self._queue[:0] = ids
+                self._inflight = set()
+                for i, n in hits.items(): self._hits[i] = self._hits.get(i, 0) + n
+            return 0
+        try:
+            db.add_hits(hits)
+        except Exception:
+            log.exception("hit_count flush failed; %d updates kept for retry", len(hits))
+            with self._cv:
+                for i, n in hits.items(): self._hits[i] = self._hits.get(i, 0) + n
+        with self._cv:
+            for i in ids: self._pending.pop(i, None)
+            self._inflight = set()
+            self.flushed += len(rows); self.flushes += 1
+        return len(rows)
+
+    def _run(self):
+        while True:
+            with self._cv:
+                if not self._stopping and len(self._queue) < self.flush_size:
+                    self._cv.wait(self.flush_interval_s)
+                stopping = self._stopping
+            if stopping: return   # stop() does the final flush
+            self.flush()
+            if self._spare is None:
+                try:
+                    self._refill()
+                except Exception:
+                    log.exception("id block reservation failed; retrying after the next flush")
+
+    # ----- reads of not-yet-flushed rows -----
+    def get(self, rid: int) -> Optional[dict]:
+        with self._cv:
+            row = self._pending.get(rid)
+            return dict(row) if row else None
+
+    def recent(self, limit: Optional[int] = None) -> List[dict]:
+        with self._cv:
+            rows = sorted(self._pending.values(), key=db.sort_key, reverse=True)[:limit]
+            return [dict(r) for r in rows]
+
+    def stats(self) -> dict:
+        with self._cv:
+            return {"buffered": len(self._pending), "flushed": self.flushed, "flushes": self.flushes, "strict": self.strict,
+                    "ids_ready": self.ids_ready, "sync_reserves": self.sync_reserves}
+
+writer = AssessmentWriter()
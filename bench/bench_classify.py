@@ -0,0 +1,47 @@
+"""
+OSM tag -> kind classification: nested loops over kinds x OSM_KINDS vs the compiled index.
+
+    python -m bench.bench_classify            # 200k elements
+    python -m bench.bench_classify 1000000
+"""
+import random, sys, time
+
+from app import osm
+
+KINDS = ["restaurant", "cafe", "lodging", "resort", "hut", "water", "health", "police", "rescue"]
+
+def _legacy(tags, kinds):
+    for k in kinds:
+        for tk, tv in osm.OSM_KINDS.get(k, []):
+            if tv == osm.ANY and tk in tags or tags.get(tk) == tv:
+                return k
+    return None
+
+def _elements(n: int):
+    rnd = random.Random(n)
+    pairs = [kv for kind in KINDS for kv in osm.OSM_KINDS[kind] if kv[1] != osm.ANY] + [("shop", "bakery"), ("amenity", "bench")]
+    out = []
+    for i in range(n):
+        k, v = rnd.choice(pairs)
+        out.append({"name": f"poi {i}", k: v, "addr:city": "Pokhara", "opening_hours": "24/7", "source": "survey"})
+    return out
+
+def run(n: int):
+    els = _elements(n)
+    t0 = time.perf_counter()
+    a = [_legacy(t, KINDS) for t in els]
+    legacy = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    classify = osm.classifier(tuple(KINDS))
+    b = [classify(t) for t in els]
+    compiled = time.perf_counter() - t0
+    assert a == b
+    print(f"{n:>9,} elements  nested loops {n/legacy:12,.0f}/s   compiled {n/compiled:12,.0f}/s   x{legacy/compiled:.1f}")
+
+    per_clause = sum(len(osm.OSM_KINDS[k]) for k in KINDS) * 3
+    ql = osm._build_overpass(28.2, 84.0, 2000, KINDS)
+    print(f"{'':>9}  overpass QL: {per_clause} per-tag/per-type clauses before, {ql.count('nwr')} merged clauses now ({len(ql)} bytes)")
+
+if __name__ == "__main__":
+    sizes = [int(a) for a in sys.argv[1:]] or [200_000]
+    for n in sizes: run(n)
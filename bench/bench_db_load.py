@@ -0,0 +1,93 @@
+"""
+Mixed read/write load on the SQLite layer from many threads:
+fresh connection per call + rollback journal (the old db.py) vs the pooled WAL storage layer.
+
+    python -m bench.bench_db_load              # 16 threads, 2 s per mode, 20% writes
+    python -m bench.bench_db_load 32 5 0.5     # threads, seconds, write ratio
+"""
+import os, random, sqlite3, sys, tempfile, threading, time
+
+from app import db, places_db, storage
+
+def _rec(rnd):
+    return {"lat": rnd.uniform(27.5, 28.9), "lon": rnd.uniform(83.5, 87.2), "date": "2025-01-15", "elevation_m": 4000.0,
+            "risk": {"avalanche_pct": 30.0, "blizzard_pct": 45.0, "landslide_pct": 12.0, "overall_pct": 31.7,
+                     "label": "MODERATE", "reason": "winter conditions", "source": "stub_v1"}}
+
+class Legacy:
+    """The pre-storage-layer access pattern: connect / execute / commit / close on every call."""
+    def __init__(self, path):
+        self.path = path
+        con = sqlite3.connect(path); con.execute("PRAGMA journal_mode=DELETE;"); con.close()
+
+    def _conn(self):
+        con = sqlite3.connect(self.path, timeout=30)
+        con.row_factory = sqlite3.Row
+        return con
+
+    def insert(self, rec):
+        con = self._conn()
+        r = rec["risk"]
+        cur = con.execute("""
+            INSERT INTO assessments
+            (lat,lon,date,elevation_m,avalanche_pct,blizzard_pct,landslide_pct,overall_pct,label,reason,source,features_json,created_at)
+            VALUES (?,?,?,?,?,?,?,?,?,?,?,?,datetime('now'));
+        """, (rec["lat"], rec["lon"], rec["date"], rec["elevation_m"], r["avalanche_pct"], r["blizzard_pct"],
+              r["landslide_pct"], r["overall_pct"], r["label"], r["reason"], r["source"], None))
+        con.commit(); con.close()
+        return cur.lastrowid
+
+    def get(self, i):
+        con = self._conn()
+        row = con.execute("SELECT * FROM assessments WHERE id=?", (i,)).fetchone()
+        con.close()
+        return row
+
+    def history(self):
+        con = self._conn()
+        rows = con.execute("SELECT id,lat,lon,date,overall_pct,label,created_at FROM assessments ORDER BY id DESC LIMIT 20;").fetchall()
+        con.close()
+        return rows
+
+class Pooled:
+    def insert(self, rec): return db.insert_assessment(rec)
+    def get(self, i): return db.get_assessment(i)
+    def history(self): return db.list_history(20)
+
+def _load(impl, threads: int, seconds: float, write_ratio: float):
+    stop = time.perf_counter() + seconds
+    counts = [[0, 0, 0] for _ in range(threads)]   # reads, writes, errors
+
+    def worker(k):
+        rnd = random.Random(k)
+        c = counts[k]
+        while time.perf_counter() < stop:
+            try:
+                if rnd.random() < write_ratio:
+                    impl.insert(_rec(rnd)); c[1] += 1
+                else:
+                    (impl.get(rnd.randint(1, 1000)) if rnd.random() < .5 else impl.history()); c[0] += 1
+            except sqlite3.OperationalError:
+                c[2] += 1
+
+    ts = [threading.Thread(target=worker, args=(k,)) for k in range(threads)]
+    for t in ts: t.start()
+    for t in ts: t.join()
+    return [sum(c[i] for c in counts) for i in range(3)]
+
+def run(threads: int, seconds: float, write_ratio: float):
+    with tempfile.TemporaryDirectory() as d:
+        for name, make in (("legacy", lambda p: Legacy(p)), ("pooled WAL", lambda p: Pooled())):
+            path = os.path.join(d, name.replace(" ", "_") + ".db")
+            storage.configure(path)
+            db.init_db(); places_db.init_db()
+            storage.close_all()
+            impl = make(path)
+            for _ in range(1000): impl.insert(_rec(random.Random(0)))
+            reads, writes, errors = _load(impl, threads, seconds, write_ratio)
+            storage.close_all()
+            print(f"{name:>10}: {threads} threads  {reads/seconds:9,.0f} reads/s  {writes/seconds:8,.0f} writes/s  {errors} lock errors")
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    run(int(args[0]) if args else 16, float(args[1]) if len(args) > 1 else 2.0, float(args[2]) if len(args) > 2 else 0.2)
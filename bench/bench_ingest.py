@@ -0,0 +1,46 @@
+"""
+Place ingest throughput: one transaction per item vs places_db.bulk_upsert.
+
+    python -m bench.bench_ingest            # 1k, 5k items
+    python -m bench.bench_ingest 20000
+"""
+import os, random, sys, tempfile, time
+
+from app import places_db, storage
+
+KINDS = ["restaurant", "cafe", "lodging", "resort"]
+
+def _items(n: int, seed: int = 0):
+    rnd = random.Random(seed)
+    return [{
+        "source": "osm", "source_id": f"node:{i}", "name": f"Guest House {i}", "kind": KINDS[i % 4],
+        "lat": rnd.uniform(27.5, 28.9), "lon": rnd.uniform(83.5, 87.2),
+        "address": "Namche Bazaar", "phone": None, "website": None, "rating": None, "price": None,
+        "tags": {"tourism": "guest_house", "name": f"Guest House {i}"},
+    } for i in range(n)]
+
+def _fresh(d: str, name: str):
+    storage.configure(os.path.join(d, name))
+    places_db.init_db()
+
+def run(n: int):
+    items = _items(n)
+    with tempfile.TemporaryDirectory() as d:
+        _fresh(d, "per_item.db")
+        t0 = time.perf_counter()
+        for it in items: places_db.upsert_place(it)   # one transaction + commit per item
+        per_item = time.perf_counter() - t0
+
+        _fresh(d, "bulk.db")
+        t0 = time.perf_counter()
+        places_db.bulk_upsert(items)
+        bulk = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        places_db.bulk_upsert(items)                 # re-ingest: every item is an update
+        again = time.perf_counter() - t0
+    print(f"{n:>7,} items  per-item {n/per_item:9,.0f}/s   bulk insert {n/bulk:9,.0f}/s   bulk update {n/again:9,.0f}/s")
+
+if __name__ == "__main__":
+    sizes = [int(a) for a in sys.argv[1:]] or [1_000, 5_000]
+    for n in sizes: run(n)
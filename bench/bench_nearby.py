@@ -0,0 +1,66 @@
+"""
+/places/nearby benchmark: full-table haversine scan vs R*Tree k-NN.
+
+    python -m bench.bench_nearby            # 10k, 100k, 1M places
+    python -m bench.bench_nearby 10000      # custom sizes
+"""
+import os, random, sys, tempfile, time
+
+from app import places_db, storage
+
+# Annapurna / Khumbu-ish box
+LAT0, LAT1 = 27.5, 28.9
+LON0, LON1 = 83.5, 87.2
+KINDS = ["restaurant", "cafe", "lodging", "resort"]
+
+def _seed(n: int):
+    con = places_db._conn(); cur = con.cursor()
+    rnd = random.Random(n)
+    rows = []
+    for i in range(n):
+        rows.append(("bench", str(i), f"place {i}", KINDS[i % 4],
+                     rnd.uniform(LAT0, LAT1), rnd.uniform(LON0, LON1), "{}"))
+    cur.executemany("""
+        INSERT INTO places(source,source_id,name,kind,lat,lon,tags,updated_at)
+        VALUES (?,?,?,?,?,?,?,datetime('now'));
+    """, rows)
+    cur.execute("INSERT INTO places_rtree SELECT id, lat, lat, lon, lon FROM places;")
+    con.commit()
+
+def _legacy(lat, lon, radius_m, kind, limit):
+    # the pre-index implementation: scan every row, sort in Python
+    con = places_db._conn()
+    rows = con.execute("SELECT * FROM places WHERE kind=?;" if kind else "SELECT * FROM places;", (kind,) if kind else ()).fetchall()
+    out = []
+    for r in rows:
+        d = places_db._haversine(lat, lon, r["lat"], r["lon"])
+        if d <= radius_m:
+            o = dict(r); o["distance_m"] = round(d, 1); out.append(o)
+    out.sort(key=lambda x: x["distance_m"])
+    return out[:limit]
+
+def _time(fn, queries, reps):
+    t0 = time.perf_counter()
+    for _ in range(reps):
+        for q in queries: fn(*q)
+    return (time.perf_counter() - t0) / (reps * len(queries)) * 1000
+
+def run(n: int):
+    with tempfile.TemporaryDirectory() as d:
+        storage.configure(os.path.join(d, "bench.db"))
+        places_db.init_db()
+        _seed(n)
+        rnd = random.Random(0)
+        queries = [(rnd.uniform(LAT0, LAT1), rnd.uniform(LON0, LON1), 5000, rnd.choice([None, "lodging"]), 50)
+                   for _ in range(20)]
+        for q in queries[:3]:
+            a = [r["id"] for r in _legacy(*q)]
+            b = [r["id"] for r in places_db.search_nearby(*q)]
+            assert sorted(a) == sorted(b), "result mismatch"
+        legacy = _time(_legacy, queries[:5], 1)
+        indexed = _time(places_db.search_nearby, queries, 5)
+        print(f"{n:>9,} places  scan {legacy:9.2f} ms/q   rtree {indexed:7.2f} ms/q   x{legacy/indexed:,.0f}")
+
+if __name__ == "__main__":
+    sizes = [int(a) for a in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    for n in sizes: run(n)
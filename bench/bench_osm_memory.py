@@ -0,0 +1,62 @@
+"""
+Peak memory of Overpass parsing: whole-body json + list (fetch_osm) vs streaming (iter_osm).
+
+Both modes read the same synthetic response from the on-disk Overpass cache, and the
+streaming mode is consumed in ingest-sized batches.
+
+    python -m bench.bench_osm_memory              # 20k, 100k, 300k elements
+    python -m bench.bench_osm_memory 50000
+"""
+import json, os, random, sys, tempfile, time, tracemalloc
+
+from app import osm
+from app.ingest_jobs import BATCH_SIZE
+
+LAT, LON, RADIUS = 28.2, 84.0, 10000
+
+def _write_response(path: str, n: int):
+    rnd = random.Random(n)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"version":0.6,"generator":"bench","osm3s":{"timestamp_osm_base":"2024-01-01T00:00:00Z"},"elements":[')
+        for i in range(n):
+            el = {"type": "node", "id": i, "lat": LAT + rnd.uniform(-.1, .1), "lon": LON + rnd.uniform(-.1, .1),
+                  "tags": {"name": f"Tea House {i}", "tourism": "guest_house", "addr:city": "Pokhara",
+                           "phone": "+977 61 000000", "website": f"https://example.org/{i}"}}
+            f.write(("," if i else "") + json.dumps(el))
+        f.write("]}")
+
+def _measure(fn):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    n = fn()
+    dt = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return n, peak / 2**20, dt
+
+def _whole():
+    return len(osm.fetch_osm(LAT, LON, RADIUS))
+
+def _streaming():
+    n, batch = 0, []
+    for p in osm.iter_osm(LAT, LON, RADIUS):
+        batch.append(p)
+        if len(batch) >= BATCH_SIZE:
+            n += len(batch); batch = []   # an ingest would bulk_upsert here
+    return n + len(batch)
+
+def run(n: int):
+    with tempfile.TemporaryDirectory() as d:
+        osm.CACHE_DIR = d
+        ql = osm._build_overpass(LAT, LON, RADIUS, ["restaurant", "cafe", "lodging", "resort"])
+        _write_response(osm._cache_path(ql), n)
+        size = os.path.getsize(osm._cache_path(ql)) / 2**20
+        a, peak_a, t_a = _measure(_whole)
+        b, peak_b, t_b = _measure(_streaming)
+        assert a == b == n
+    print(f"{n:>8,} elements ({size:6.1f} MiB)  whole {peak_a:8.1f} MiB peak {t_a:6.2f}s   "
+          f"streaming {peak_b:6.1f} MiB peak {t_b:6.2f}s")
+
+if __name__ == "__main__":
+    sizes = [int(a) for a in sys.argv[1:]] or [20_000, 100_000, 300_000]
+    for n in sizes: run(n)
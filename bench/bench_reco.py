@@ -0,0 +1,51 @@
+"""
+Recommendations: score_trek over every trek + full sort vs the columnar top-k engine.
+
+    python -m bench.bench_reco            # 100k treks
+    python -m bench.bench_reco 1000000
+"""
+import random, sys, time
+
+from app import data, reco
+
+PROFILES = [
+    {"experience": "beginner", "fitness": "low", "budget": "low", "preferences": []},
+    {"experience": "advanced", "fitness": "high", "budget": "high", "preferences": ["glacial lakes", "culture"]},
+    {"experience": "intermediate", "fitness": "moderate", "budget": "medium", "preferences": ["wildlife"]},
+]
+
+def _catalog(n: int, seed: int = 0) -> data.Catalog:
+    rnd = random.Random(seed)
+    base = data.TREKS
+    return data.Catalog([{**base[i % len(base)], "id": i + 1, "name": f"Trek {i}",
+                          "difficulty": rnd.choice(["easy", "moderate", "hard"]),
+                          "cost_min": rnd.randint(300, 4000), "ai_base": rnd.randint(40, 99)} for i in range(n)])
+
+def _legacy(user, treks):
+    recs = []
+    for trek in treks:
+        s, why = reco.score_trek(user, trek)
+        recs.append({"trek": {**trek, "aiScore": s}, "reason": why})
+    recs.sort(key=lambda r: r["trek"]["aiScore"], reverse=True)
+    return recs
+
+def run(n: int, limit: int = 20):
+    cat = _catalog(n)
+    t0 = time.perf_counter()
+    eng = reco.Engine(cat)
+    build = time.perf_counter() - t0
+    for user in PROFILES:
+        t0 = time.perf_counter()
+        old = _legacy(user, cat.dicts)[:limit]
+        legacy = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        new = eng.top(user, limit)
+        engine = time.perf_counter() - t0
+        if not user["preferences"]:   # same rules, same order (preferences only exist in the engine)
+            assert [r["trek"]["id"] for r in old] == [r["trek"]["id"] for r in new]
+        print(f"{n:>9,} treks  {user['experience']:<12}  loop+sort {legacy*1000:8.1f} ms   top-{limit} {engine*1000:7.2f} ms   x{legacy/engine:.0f}")
+    print(f"{'':>9}  engine build (once per catalog) {build*1000:.0f} ms")
+
+if __name__ == "__main__":
+    sizes = [int(a) for a in sys.argv[1:]] or [100_000]
+    for n in sizes: run(n)
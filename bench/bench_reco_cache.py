@@ -0,0 +1,47 @@
+"""
+/recommendations throughput: engine + JSON encoding per request vs the normalized-profile cache.
+
+    python -m bench.bench_reco_cache            # 100k treks, 20k requests
+    python -m bench.bench_reco_cache 10000 50000
+"""
+import itertools, json, random, sys, time
+
+from app import data, reco
+from bench.bench_reco import _catalog
+
+PREFS = ["glacial lakes", "culture", "wildlife", "Sherpa culture", "views"]
+
+def _requests(n: int, seed: int = 0):
+    rnd = random.Random(seed)
+    grid = list(itertools.product(reco.EXPERIENCE, reco.FITNESS, reco.BUDGET))
+    out = []
+    for _ in range(n):
+        exp, fit, budget = rnd.choice(grid)
+        prefs = rnd.sample(PREFS, rnd.choice([0, 0, 0, 1, 2]))   # mostly no preferences
+        out.append({"experience": exp, "fitness": fit, "budget": budget, "preferences": prefs})
+    return out
+
+def run(treks: int, n: int):
+    data.catalog = _catalog(treks)
+    reqs = _requests(n)
+    t0 = time.perf_counter()
+    reco.warm()
+    warm = time.perf_counter() - t0
+    eng = reco.engine()
+
+    k = min(n, 2000)   # uncached is slow; time a slice
+    t0 = time.perf_counter()
+    for u in reqs[:k]: json.dumps({"recommendations": eng.top(u, reco.DEFAULT_LIMIT)}).encode()
+    uncached = (time.perf_counter() - t0) / k
+
+    t0 = time.perf_counter()
+    for u in reqs: reco.recommendations_json(u)
+    cached = (time.perf_counter() - t0) / n
+    st = reco.cache.stats()
+    print(f"{treks:>9,} treks  uncached {1/uncached:9,.0f} req/s   cached {1/cached:11,.0f} req/s   x{uncached/cached:.0f}"
+          f"   hit rate {st['hit_rate']:.3f} ({st['size']} entries, warm-up {warm*1000:.0f} ms)")
+
+if __name__ == "__main__":
+    treks = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    n = int(sys.argv[2]) if len(sys.argv) > 2 else 20_000
+    run(treks, n)
@@ -0,0 +1,115 @@
+"""
+Hot read endpoints, requests/sec: the previous handlers (Pydantic models per row, json.loads on
+place tags) vs the pre-serialized fast path, plain / gzip / If-None-Match revalidation.
+Both sides answer the same data; the bench checks the decoded bodies match. Requests are driven
+straight through ASGI (no sockets, no HTTP client), so the numbers are the server's own cost.
+
+    python -m bench.bench_responses            # 2000 requests per case
+    python -m bench.bench_responses 5000
+"""
+import asyncio, gzip, json, os, random, sys, tempfile, time
+from urllib.parse import urlencode
+from typing import List, Optional
+
+from fastapi import FastAPI, Query, Response
+
+from app import data, db, places_db, storage
+from app.main import app, PlaceOut
+from app.schemas import HistoryItem
+
+# ----- the handlers as they were -----
+legacy = FastAPI()
+
+@legacy.get("/treks")
+def _treks():
+    return [{**t, "aiScore": None} for t in data.catalog.dicts]
+
+@legacy.get("/treks/{trek_id}/plan")
+def _plan(trek_id: int):
+    rec = data.catalog.get(trek_id)
+    trek = rec.as_dict()
+    return {"trek": trek, "guides": data.catalog.guides_for(rec.location), "lodging": data.catalog.lodging_for(rec.location),
+            "safety_recs": ["Altitude acclimatization required" if trek["altitude"] >= 3000 else "Standard acclimatization",
+                            "Weather monitoring essential", "Emergency evacuation insurance recommended"]}
+
+@legacy.get("/places/nearby", response_model=List[PlaceOut])
+def _nearby(lat: float, lon: float, radius_m: int = 2000, kind: Optional[str] = None, limit: int = 50):
+    return [PlaceOut(id=r["id"], name=r["name"], kind=r["kind"], lat=r["lat"], lon=r["lon"], address=r.get("address"),
+                     phone=r.get("phone"), website=r.get("website"), distance_m=r.get("distance_m"), rating=r.get("rating"),
+                     price=r.get("price"), tags=json.loads(r.get("tags") or "{}"))
+            for r in places_db.search_nearby(lat, lon, radius_m, kind, limit)]
+
+@legacy.get("/risk/history", response_model=list[HistoryItem])
+def _history(response: Response, limit: int = Query(20)):
+    rows = db.list_history(limit)
+    if len(rows) == limit: response.headers["X-Next-Cursor"] = db.cursor_of(rows[-1])
+    return [HistoryItem(**r) for r in rows]
+
+CASES = [
+    ("/treks", {}),
+    ("/treks/1/plan", {}),
+    ("/places/nearby", {"lat": 27.8, "lon": 86.7, "radius_m": 5000, "limit": 100}),
+    ("/risk/history", {"limit": 200}),
+]
+
+def _seed(n_places: int = 5000, n_assess: int = 2000, seed: int = 0):
+    rnd = random.Random(seed)
+    places_db.bulk_upsert([{
+        "source": "osm", "source_id": f"node:{i}", "name": f"Lodge {i}", "kind": "lodging",
+        "lat": 27.8 + rnd.uniform(-0.05, 0.05), "lon": 86.7 + rnd.uniform(-0.05, 0.05), "address": "Namche Bazaar",
+        "tags": {"tourism": "guest_house", "name": f"Lodge {i}", "rooms": str(rnd.randint(4, 30)), "wifi": "yes",
+                 "addr:city": "Namche Bazaar", "opening_hours": "Mo-Su 06:00-21:00"},
+    } for i in range(n_places)])
+    db.insert_batch([db.as_row({"lat": 27.8, "lon": 86.7, "date": "2025-10-01", "elevation_m": 3400.0 + i,
+                                "risk": {"avalanche_pct": 10.0, "blizzard_pct": 5.0, "landslide_pct": 3.0, "overall_pct": 7.5,
+                                         "label": "low", "reason": "bench", "source": "stub_v1"}}) for i in range(n_assess)])
+
+async def _get(asgi, path: str, params: dict, headers: dict) -> tuple:
+    """(status, headers, body) of one GET, straight through the ASGI app."""
+    scope = {"type": "http", "asgi": {"version": "3.0", "spec_version": "2.4"}, "http_version": "1.1", "method": "GET",
+             "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": urlencode(params).encode(),
+             "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()], "client": ("127.0.0.1", 1),
+             "server": ("bench", 80), "root_path": ""}
+    out = {"status": 0, "headers": {}, "body": b""}
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+    async def send(msg):
+        if msg["type"] == "http.response.start":
+            out["status"] = msg["status"]; out["headers"] = {k.decode(): v.decode() for k, v in msg["headers"]}
+        elif msg["type"] == "http.response.body":
+            out["body"] += msg.get("body", b"")
+    await asgi(scope, receive, send)
+    return out["status"], out["headers"], out["body"]
+
+async def _rate(asgi, path: str, params: dict, n: int, headers: dict) -> float:
+    t0 = time.perf_counter()
+    for _ in range(n): await _get(asgi, path, params, headers)
+    return n / (time.perf_counter() - t0)
+
+async def _run(n: int):
+    plain, gz = {"accept-encoding": "identity"}, {"accept-encoding": "gzip"}
+    print(f"{'endpoint':<16} {'bytes':>8} {'old req/s':>10} {'new req/s':>10} {'gzip req/s':>11} {'gz bytes':>9} {'304 req/s':>10}")
+    for path, params in CASES:
+        _, _, a = await _get(legacy, path, params, plain)
+        _, h, b = await _get(app, path, params, plain)
+        assert json.loads(a) == json.loads(b), path
+        _, hz, z = await _get(app, path, params, gz)
+        assert json.loads(gzip.decompress(z) if hz.get("content-encoding") == "gzip" else z) == json.loads(b), path
+        inm = {"if-none-match": h["etag"]}
+        assert (await _get(app, path, params, inm))[0] == 304, path
+        r_old = await _rate(legacy, path, params, n, plain)
+        r_new = await _rate(app, path, params, n, plain)
+        r_gz = await _rate(app, path, params, n, gz)
+        r_304 = await _rate(app, path, params, n, inm)
+        print(f"{path:<16} {len(b):>8} {r_old:>10.0f} {r_new:>10.0f} {r_gz:>11.0f} {len(z):>9} {r_304:>10.0f}")
+
+def run(n: int):
+    with tempfile.TemporaryDirectory() as d:
+        storage.configure(os.path.join(d, "bench.db"))
+        db.init_db(); places_db.init_db()
+        _seed()
+        asyncio.run(_run(n))
+        storage.close_all()
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
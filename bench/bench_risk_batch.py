@@ -0,0 +1,54 @@
+"""
+Scoring a trek route: per-point assess_stub + insert_assessment (one HTTP call each today)
+vs one vectorized risk.assess_batch + db.insert_batch.
+
+    python -m bench.bench_risk_batch            # 1k, 10k points
+    python -m bench.bench_risk_batch 20000
+"""
+import os, random, sys, tempfile, time
+
+from app import db, risk, storage
+
+def _route(n: int):
+    rnd = random.Random(n)
+    lats = [27.7 + i * 1e-4 for i in range(n)]
+    lons = [86.7 + i * 1e-4 for i in range(n)]
+    elev = [rnd.choice([None, rnd.uniform(2000, 6000)]) for _ in range(n)]
+    dates = [f"2025-{rnd.randint(1, 12):02d}-15" for _ in range(n)]
+    return lats, lons, dates, elev
+
+def _per_point(lats, lons, dates, elev):
+    for la, lo, d, e in zip(lats, lons, dates, elev):
+        r = risk.assess_stub(la, lo, d, e)
+        db.insert_assessment({"lat": la, "lon": lo, "date": d, "elevation_m": e, "risk": r})
+
+def _batch(lats, lons, dates, elev):
+    r = risk.assess_batch(lats, lons, dates, elev)
+    db.insert_batch([{
+        "id": None, "lat": lats[i], "lon": lons[i], "date": dates[i], "elevation_m": elev[i],
+        "avalanche_pct": float(r["avalanche_pct"][i]), "blizzard_pct": float(r["blizzard_pct"][i]),
+        "landslide_pct": float(r["landslide_pct"][i]), "overall_pct": float(r["overall_pct"][i]),
+        "label": str(r["label"][i]), "reason": str(r["reason"][i]), "source": r["source"],
+        "features_json": None, "hit_count": 1, "created_at": None,
+    } for i in range(len(lats))])
+
+def run(n: int):
+    route = _route(n)
+    with tempfile.TemporaryDirectory() as d:
+        storage.configure(os.path.join(d, "bench.db"))
+        db.init_db()
+        t0 = time.perf_counter(); [risk.assess_stub(*p) for p in zip(route[0], route[1], route[2], route[3])]
+        score_loop = time.perf_counter() - t0
+        t0 = time.perf_counter(); risk.assess_batch(*route)
+        score_vec = time.perf_counter() - t0
+        t0 = time.perf_counter(); _per_point(*route)
+        loop = time.perf_counter() - t0
+        t0 = time.perf_counter(); _batch(*route)
+        batch = time.perf_counter() - t0
+        storage.close_all()
+    print(f"{n:>7,} points  scoring: loop {score_loop*1000:8.1f} ms  vectorized {score_vec*1000:7.1f} ms   "
+          f"score+store: loop {loop*1000:9.1f} ms  batch {batch*1000:8.1f} ms  x{loop/batch:.0f}")
+
+if __name__ == "__main__":
+    sizes = [int(a) for a in sys.argv[1:]] or [1_000, 10_000]
+    for n in sizes: run(n)
@@ -0,0 +1,93 @@
+"""
+Scraper against a local stub site: an index page linking to N listing pages (JSON-LD and microdata),
+served with ETags, a robots.txt that disallows /private/, and a fixed per-page latency.
+Crawls once (everything parsed and upserted), then again (every page answers 304).
+
+    python -m bench.bench_scraper              # 200 pages, 20 ms latency
+    python -m bench.bench_scraper 1000 50
+"""
+import asyncio, hashlib, os, sys, tempfile, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from app import osm, places_db, scraper, storage
+
+def _ld(i: int) -> str:
+    return f"""<html><head><script type="application/ld+json">
+    {{"@context": "https://schema.org", "@type": "Hotel", "@id": "lodge-{i}", "name": "Tea House {i}",
+      "geo": {{"@type": "GeoCoordinates", "latitude": {27.7 + i * 1e-3}, "longitude": {86.7 + i * 1e-3}}},
+      "address": {{"streetAddress": "Trail {i}", "addressLocality": "Namche Bazaar", "addressCountry": "NP"}},
+      "telephone": "+977-1-{i:05d}", "priceRange": "$", "aggregateRating": {{"ratingValue": 4.{i % 10}}}}}
+    </script></head><body><h1>Tea House {i}</h1><a href="/">home</a></body></html>"""
+
+def _microdata(i: int) -> str:
+    return f"""<html><body><div itemscope itemtype="https://schema.org/TravelAgency" itemid="guide-{i}">
+    <h1 itemprop="name">Sherpa Guides {i}</h1><span itemprop="telephone">+977-98-{i:05d}</span>
+    <div itemprop="geo" itemscope itemtype="https://schema.org/GeoCoordinates">
+      <meta itemprop="latitude" content="{28.2 + i * 1e-3}"><meta itemprop="longitude" content="{83.9 + i * 1e-3}">
+    </div></div><a href="/private/admin">admin</a></body></html>"""
+
+def _site(n: int) -> dict:
+    pages = {f"/p/{i}": (_ld(i) if i % 2 else _microdata(i)) for i in range(n)}
+    pages["/"] = "<html><body>" + "".join(f'<a href="/p/{i}">{i}</a>' for i in range(n)) + "</body></html>"
+    return pages
+
+def serve(pages: dict, latency_s: float):
+    hits = {"get": 0, "304": 0, "private": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *a): pass
+
+        def do_GET(self):
+            if self.path == "/robots.txt":
+                body, ctype = b"User-agent: *\nDisallow: /private/\nCrawl-delay: 0\n", "text/plain"
+            elif self.path.startswith("/private/"):
+                hits["private"] += 1
+                self.send_error(403); return
+            elif self.path in pages:
+                body, ctype = pages[self.path].encode(), "text/html; charset=utf-8"
+            else:
+                self.send_error(404); return
+            time.sleep(latency_s)
+            hits["get"] += 1
+            etag = '"%s"' % hashlib.sha1(body).hexdigest()[:16]
+            if self.headers.get("If-None-Match") == etag:
+                hits["304"] += 1
+                self.send_response(304); self.send_header("ETag", etag); self.end_headers(); return
+            self.send_response(200)
+            self.send_header("Content-Type", ctype); self.send_header("ETag", etag)
+            self.send_header("Content-Length", str(len(body))); self.end_headers()
+            self.wfile.write(body)
+
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv, hits
+
+async def crawl(url: str, n: int) -> tuple:
+    c = scraper.Crawler([url], max_pages=n + 10, max_depth=2, host_concurrency=8, allow_private=True)   # local stub
+    written = 0
+    async for batch in osm.abatched(c.records(), 500):
+        written += sum(o["status"] != "failed" for o in await asyncio.to_thread(places_db.bulk_upsert, batch))
+    return c.stats, written
+
+def run(n: int, latency_ms: float):
+    srv, hits = serve(_site(n), latency_ms / 1000)
+    url = f"http://127.0.0.1:{srv.server_address[1]}/"
+    with tempfile.TemporaryDirectory() as d:
+        storage.configure(os.path.join(d, "scrape.db"))
+        places_db.init_db(); scraper.init_db()
+        for label in ("first crawl", "re-crawl"):
+            t0 = time.perf_counter()
+            stats, written = asyncio.run(crawl(url, n))
+            dt = time.perf_counter() - t0
+            print(f"{label:<12} {n:>6} pages  {dt:6.2f} s  {stats['pages'] / dt:7.1f} pages/s  "
+                  f"records {stats['records']:>5}  upserted {written:>5}  304 {stats['not_modified']:>5}  "
+                  f"disallowed {stats['disallowed']}")
+        kinds = storage.connect().execute("SELECT kind, COUNT(*) FROM places GROUP BY kind;").fetchall()
+        print(f"places by kind: {dict(map(tuple, kinds))}   /private/ requests: {hits['private']}")
+    scraper.shutdown()
+    srv.shutdown()
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 20
+    run(n, latency)
@@ -0,0 +1,47 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app import storage
+
+@pytest.fixture
+def tmp_db(tmp_path):
+    storage.configure(str(tmp_path / "test.db"))
+    yield str(tmp_path / "test.db")
+    storage.close_all()
+
+@pytest.fixture
+def stub_server():
+    """
+    serve(handle) -> base url of a local HTTP server; handle(method, path, headers, body) returns
+    (status, headers, body) with body as bytes. Every request is recorded in .requests.
+    """
+    servers = []
+
+    def serve(handle):
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *a): pass
+
+            def _answer(self):
+                n = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(n) if n else b""
+                serve.requests.append((self.command, self.path))
+                status, headers, out = handle(self.command, self.path, self.headers, body)
+                self.send_response(status)
+                for k, v in headers.items(): self.send_header(k, v)
+                self.send_header("Content-Length", str(len(out)))
+                self.end_headers()
+                if out and self.command != "HEAD": self.wfile.write(out)
+
+            do_GET = do_POST = _answer
+
+        srv = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=srv.serve_forever, daemon=True).start()
+        servers.append(srv)
+        return f"http://127.0.0.1:{srv.server_address[1]}"
+
+    serve.requests = []
+    yield serve
+    for srv in servers:
+        srv.shutdown(); srv.server_close()
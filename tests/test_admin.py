@@ -0,0 +1,16 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main
+
+ROUTES = [("GET", "/admin/maintenance"), ("POST", "/admin/maintenance/run"), ("GET", "/admin/limits")]
+
+@pytest.mark.parametrize("method, url", ROUTES)
+def test_admin_routes_need_the_token(tmp_db, monkeypatch, method, url):
+    with TestClient(main.app) as c:
+        monkeypatch.setattr(main, "ADMIN_TOKEN", None)
+        assert c.request(method, url).status_code == 403
+        monkeypatch.setattr(main, "ADMIN_TOKEN", "s3cret")
+        assert c.request(method, url).status_code == 401
+        assert c.request(method, url, headers={"Authorization": "Bearer nope"}).status_code == 401
+        assert c.request(method, url, headers={"Authorization": "Bearer s3cret"}).status_code == 200
@@ -0,0 +1,37 @@
+import pytest
+
+from app import chat, data
+from app.chat_cache import AnswerCache
+
+@pytest.fixture(autouse=True)
+def catalog():
+    data.load_catalog()
+
+@pytest.mark.parametrize("text, name", [
+    ("how cold is EBC in may", "Everest Base Camp"),
+    ("how high is everst base camp", "Everest Base Camp"),
+    ("torres del paine gear", "Torres del Paine W Trek"),
+    ("plan the W trek for me", "Torres del Paine W Trek"),
+    ("annapurna weather in october", "Annapurna Circuit"),
+    ("what is the weather like", None),
+    ("which base camp trek is best", None),   # generic words alone name no trek
+])
+def test_trek_names_aliases_and_typos(text, name):
+    tid = chat.index().trek_in(text)
+    assert (chat.data.catalog.get(tid).name if tid is not None else None) == name
+
+def test_named_trek_is_answered_from_the_catalog():
+    text, _, tid, intent = chat.respond("torres del paine gear")
+    assert intent == "gear" and chat.data.catalog.get(tid).name == "Torres del Paine W Trek"
+    assert "Hiking boots" in text
+
+def test_stub_replies_are_marked_and_never_cached(monkeypatch):
+    monkeypatch.setattr(chat, "answers", AnswerCache())
+    chat.set_llm(chat.StubLLM())
+    try:
+        for _ in range(2):
+            assert chat.respond("tell me something about yaks")[3] == "stub"
+        assert [e for e in chat.stream("tell me something about yaks")][-1][1]["intent"] == "stub"
+        assert chat.answers.get("tell me something about yaks", None) is None
+    finally:
+        chat.set_llm(None)
@@ -0,0 +1,53 @@
+import pytest
+
+from app.chat_cache import AnswerCache, same_words
+
+@pytest.fixture
+def cache():
+    c = AnswerCache(maxsize=100, ttl_s=3600, threshold=90)
+    c.put("Can I drink the tap water?", None, "Only boiled or filtered.", 0.05)
+    return c
+
+def test_exact_hit_ignores_case_and_punctuation(cache):
+    assert cache.get("can i drink the TAP water", None) == ("Only boiled or filtered.", "exact")
+
+def test_near_hit_on_stopword_and_order_changes(cache):
+    assert cache.get("can I drink tap water", None) == ("Only boiled or filtered.", "near")
+    assert cache.get("the tap water, can i drink it", None) == ("Only boiled or filtered.", "near")
+
+@pytest.mark.parametrize("question", [
+    "can i not drink the tap water",
+    "can't i drink the tap water",
+    "can i never drink the tap water",
+    "can i drink the tap water without boiling",
+])
+def test_negated_or_extended_question_is_a_miss(cache, question):
+    assert cache.get(question, None) is None
+
+def test_negated_questions_keep_separate_answers(cache):
+    cache.put("can i not drink the tap water", None, "You can, once boiled.", 0.05)
+    assert cache.get("can i not drink the tap water?", None) == ("You can, once boiled.", "exact")
+    assert cache.get("can I drink the tap water", None)[0] == "Only boiled or filtered."
+
+def test_other_trek_is_a_miss(cache):
+    assert cache.get("can i drink the tap water", 3) is None
+
+@pytest.mark.parametrize("question", [
+    "can i drink the tap watr",
+    "Can I drnik the tap water?",
+    "the tap water, can i drink it",
+])
+def test_typo_paraphrase_is_a_near_hit(cache, question):
+    assert cache.get(question, None) == ("Only boiled or filtered.", "near")
+
+@pytest.mark.parametrize("question", [
+    "can i not drink the tap watr",      # typo does not hide the negation
+    "can i drink the lake water",        # a different word, not a misspelling
+])
+def test_typo_tolerance_keeps_meaning(cache, question):
+    assert cache.get(question, None) is None
+
+def test_same_words_is_symmetric():
+    a, b = frozenset({"drink", "tap", "water"}), frozenset({"drink", "tap", "water", "boiled"})
+    assert not same_words(a, b) and not same_words(b, a)
+    assert same_words(frozenset({"drnik", "tap", "watr"}), a)
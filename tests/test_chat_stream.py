@@ -0,0 +1,106 @@
+import asyncio, json, threading, time
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.requests import ClientDisconnect
+
+from app import chat, executors
+from app.chat_cache import AnswerCache
+from app.main import app
+
+QUESTION = "tell me something about yaks"   # no intent matches: goes to the model
+
+class FakeLLM:
+    """Local token generator: `tokens` pieces (forever if None), delay_s apart; records close()."""
+    def __init__(self, tokens=None, delay_s=0.0):
+        self.tokens, self.delay_s = tokens, delay_s
+        self.sent, self.closed = 0, threading.Event()
+
+    def complete(self, messages):
+        return "".join(self.tokens)
+
+    def stream(self, messages):
+        try:
+            while self.tokens is None or self.sent < len(self.tokens):
+                if self.delay_s: time.sleep(self.delay_s)
+                yield self.tokens[self.sent] if self.tokens else f"t{self.sent} "
+                self.sent += 1
+        finally:
+            self.closed.set()
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    monkeypatch.setattr(chat, "answers", AnswerCache())
+    def use(backend):
+        chat.set_llm(backend)
+        return backend
+    yield use
+    chat.set_llm(None)
+
+def _frames(text: str):
+    out = []
+    for frame in text.split("\n\n"):
+        if not frame: continue
+        lines = frame.split("\n")
+        assert lines[0].startswith("event: ") and lines[1].startswith("data: ") and len(lines) == 2, frame
+        out.append((lines[0][7:], json.loads(lines[1][6:])))
+    return out
+
+def test_stream_frames_tokens_then_done(tmp_db, fake_llm):
+    llm = fake_llm(FakeLLM(["Yaks ", "live ", "high."]))
+    with TestClient(app) as c:
+        r = c.post("/chat/stream", json={"message": QUESTION, "history": []})
+    assert r.status_code == 200 and r.headers["content-type"].startswith("text/event-stream")
+    assert r.headers["cache-control"] == "no-cache"
+    events = _frames(r.text)
+    assert [k for k, _ in events] == ["token"] * 3 + ["done"]
+    assert [b["text"] for _, b in events[:3]] == ["Yaks ", "live ", "high."]
+    assert events[-1][1] == {"reply": "Yaks live high.", "showPlan": False, "selectedTrekId": None, "intent": "llm"}
+    assert llm.closed.is_set()
+
+def test_router_answers_stream_the_same_way(tmp_db, fake_llm):
+    llm = fake_llm(FakeLLM(["unused"]))
+    with TestClient(app) as c:
+        events = _frames(c.post("/chat/stream", json={"message": "hello", "history": []}).text)
+    assert events[-1][0] == "done" and events[-1][1]["intent"] == "greeting"
+    assert "".join(b["text"] for k, b in events if k == "token") == events[-1][1]["reply"]
+    assert llm.sent == 0
+
+async def _post_and_disconnect(path: str, body: dict, after_chunks: int, spec_version: str) -> list:
+    """POST through the ASGI app; the client goes away once `after_chunks` body chunks have arrived."""
+    chunks, gone = [], asyncio.Event()
+    payload = json.dumps(body).encode()
+    scope = {"type": "http", "asgi": {"version": "3.0", "spec_version": spec_version}, "http_version": "1.1",
+             "method": "POST", "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+             "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode())],
+             "client": ("127.0.0.1", 1), "server": ("test", 80), "root_path": "", "app": app}
+    sent_body = False
+    async def receive():
+        nonlocal sent_body
+        if not sent_body:
+            sent_body = True
+            return {"type": "http.request", "body": payload, "more_body": False}
+        await gone.wait()
+        return {"type": "http.disconnect"}
+    async def send(msg):
+        if gone.is_set(): raise OSError("client went away")   # what a server does on a dead socket
+        if msg["type"] == "http.response.body" and msg.get("body"):
+            chunks.append(msg["body"])
+            if len(chunks) >= after_chunks: gone.set()
+    try:
+        await asyncio.wait_for(app(scope, receive, send), 5)
+    except ClientDisconnect:   # ASGI >= 2.4: raised back to the server, which drops it
+        pass
+    return chunks
+
+@pytest.mark.parametrize("spec_version", ["2.3", "2.4"])
+def test_disconnect_closes_the_backend_stream(tmp_db, fake_llm, spec_version):
+    llm = fake_llm(FakeLLM(None, delay_s=0.01))   # never ends by itself
+    with TestClient(app):   # startup / shutdown
+        chunks = asyncio.run(_post_and_disconnect("/chat/stream", {"message": QUESTION, "history": []}, 3, spec_version))
+    assert len(chunks) == 3
+    assert llm.closed.wait(2)
+    sent = llm.sent
+    time.sleep(0.05)
+    assert llm.sent == sent < 10   # stopped right after the client left
+    assert executors.routes["chat"].active == 0
@@ -0,0 +1,106 @@
+import asyncio, threading, time
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from app import db, executors, write_behind
+from app.executors import Limiter, Overloaded
+from app.main import app, risk_models
+
+def test_limiter_sheds_past_its_queue():
+    async def main():
+        lim = Limiter("t", 1, 1)
+        gate = asyncio.Event()
+        async def hold():
+            async with lim: await gate.wait()
+        tasks = [asyncio.create_task(hold()) for _ in range(2)]   # one running, one queued
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded):
+            await lim.acquire()
+        gate.set(); await asyncio.gather(*tasks)
+        return lim.stats()
+    st = asyncio.run(main())
+    assert st["served"] == 2 and st["shed"] == 1 and st["active"] == 0
+
+def test_streaming_takes_the_slot_up_front(monkeypatch):
+    monkeypatch.setitem(executors.routes, "export", Limiter("export", 1, 0))
+    async def main():
+        async def body():
+            yield b"x"
+        first = await executors.streaming("export", body())   # admitted, not iterated yet
+        with pytest.raises(Overloaded):
+            await executors.streaming("export", body())
+        out = [c async for c in first]
+        again = [c async for c in await executors.streaming("export", body())]
+        return out, again, executors.routes["export"].stats()
+    out, again, st = asyncio.run(main())
+    assert out == again == [b"x"] and st["active"] == 0 and st["shed"] == 1
+
+def test_unstarted_streaming_body_releases_its_slot(monkeypatch):
+    monkeypatch.setitem(executors.routes, "export", Limiter("export", 1, 0))
+    async def main():
+        async def body():
+            yield b"x"
+        first = await executors.streaming("export", body())   # never iterated, e.g. the client left first
+        del first
+        await asyncio.sleep(0.01)   # the loop aclose()s the dropped generator
+        return [c async for c in await executors.streaming("export", body())], executors.routes["export"].stats()
+    out, st = asyncio.run(main())
+    assert out == [b"x"] and st["active"] == 0 and st["shed"] == 0
+
+def test_export_slot_is_held_while_rows_stream(tmp_db, monkeypatch):
+    monkeypatch.setitem(executors.routes, "export", Limiter("export", 1, 0))
+    def slow_pages(f, page=1000):
+        for i in range(5):
+            time.sleep(0.1)
+            yield [dict.fromkeys(db.HISTORY_COLUMNS, i)]
+    monkeypatch.setattr(db, "iter_history", slow_pages)
+    async def main():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://t") as c:
+            first = asyncio.create_task(c.get("/risk/history/export"))
+            await asyncio.sleep(0.2)   # first is mid-stream by now
+            second = await c.get("/risk/history/export")
+            return await first, second
+    with TestClient(app):
+        first, second = asyncio.run(main())
+    assert first.status_code == 200 and len(first.text.splitlines()) == 5
+    assert second.status_code == 503 and second.headers["retry-after"] == str(executors.RETRY_AFTER_S)
+    assert executors.routes["export"].active == 0
+
+def test_assess_miss_is_scored_off_the_loop(tmp_db, monkeypatch):
+    threads = []
+    real = risk_models.assess
+    def assess(*a, **kw):
+        threads.append(threading.current_thread().name)
+        return real(*a, **kw)
+    monkeypatch.setattr(risk_models, "assess", assess)
+    with TestClient(app) as c:
+        body = {"lat": 27.91, "lon": 86.81, "elevation_m": 4200}
+        first, again = c.post("/risk/assess", json=body).json(), c.post("/risk/assess", json=body).json()
+    assert first["risk"] == again["risk"]
+    assert len(threads) == 1 and threads[0].startswith("db")   # the hit never reached the model
+
+def test_id_blocks_are_reserved_by_the_flusher(tmp_db, monkeypatch):
+    db.init_db()
+    reserved_on = []
+    real = db.reserve_ids
+    def reserve_ids(n):
+        reserved_on.append(threading.current_thread().name)
+        return real(n)
+    monkeypatch.setattr(db, "reserve_ids", reserve_ids)
+    w = write_behind.AssessmentWriter(flush_interval_s=0.05)
+    rec = {"lat": 27.9, "lon": 86.8, "date": "2026-01-01", "elevation_m": None,
+           "risk": {"avalanche_pct": 1.0, "blizzard_pct": 1.0, "landslide_pct": 1.0, "overall_pct": 1.0,
+                    "label": "LOW", "reason": "test", "source": "test"}}
+    w.start()   # reserves the first spare
+    try:
+        del reserved_on[:]
+        ids = []
+        for _ in range(3):
+            ids += [w.submit(rec) for _ in range(write_behind.ID_BLOCK)]
+            time.sleep(0.2)   # the flusher tops the spare up
+    finally:
+        w.stop()
+    assert len(set(ids)) == len(ids) and w.sync_reserves == 0
+    assert reserved_on and all(name == "assessment-writer" for name in reserved_on)
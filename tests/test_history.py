@@ -0,0 +1,41 @@
+import time
+
+from fastapi.testclient import TestClient
+
+from app import write_behind
+from app.main import app
+
+def _assess(c, i):
+    return c.post("/risk/assess", json={"lat": 27.0 + i / 100, "lon": 86.0, "elevation_m": 3000 + i}).json()["id"]
+
+def _batch(c, start, n):
+    pts = [{"lat": 28.0 + (start + k) / 100, "lon": 86.0} for k in range(n)]
+    return [it["id"] for it in c.post("/risk/assess/batch", json={"points": pts}).json()["items"]]
+
+def test_history_is_newest_first_across_id_blocks(tmp_db):
+    with TestClient(app) as c:
+        early = [_assess(c, i) for i in range(2)]
+        time.sleep(1.1)   # created_at has one-second resolution
+        batch = _batch(c, 0, 3)
+        time.sleep(1.1)
+        late = [_assess(c, i) for i in range(2, 4)]
+        assert min(batch) > max(late)   # the batch reserved a later id block
+        expected = late[::-1] + batch[::-1] + early[::-1]
+
+        got = [r["id"] for r in c.get("/risk/history", params={"limit": 50}).json()]
+        assert got == expected
+
+        # the same order page by page, from the write-behind buffer and after a flush
+        for flushed in (False, True):
+            if flushed: write_behind.writer.flush()
+            pages, cursor = [], None
+            while True:
+                r = c.get("/risk/history", params={"limit": 3, **({"cursor": cursor} if cursor else {})})
+                pages += [row["id"] for row in r.json()]
+                cursor = r.headers.get("x-next-cursor")
+                if not cursor: break
+            assert pages == expected
+
+def test_bad_cursor_is_rejected(tmp_db):
+    with TestClient(app) as c:
+        assert c.get("/risk/history", params={"cursor": "17"}).status_code == 422
@@ -0,0 +1,114 @@
+import asyncio, functools, os, time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import ingest_jobs, places_db
+
+def test_bbox_tiles_cover_the_box():
+    tiles = ingest_jobs.tiles_for_bbox(27.0, 86.0, 27.5, 86.5, 5000)
+    assert len(tiles) == len(set(tiles)) > 1
+    assert all(27.0 < la < 27.5 + 0.05 and 86.0 < lo < 86.5 + 0.06 for la, lo in tiles)
+
+def test_huge_bbox_is_refused_before_tiling():
+    t0 = time.perf_counter()
+    with pytest.raises(ValueError, match="tiles"):
+        ingest_jobs.tiles_for_bbox(-89, -179, 89, 179, 1000)
+    assert time.perf_counter() - t0 < 0.1
+
+def test_polyline_tiles_follow_the_route():
+    tiles = ingest_jobs.tiles_for_polyline([(27.8, 86.7), (27.9, 86.8)], 2000, 5000)
+    assert 1 < len(tiles) <= ingest_jobs.MAX_TILES
+
+@pytest.mark.parametrize("points, buffer_m", [
+    ([(-80.0, -170.0), (80.0, 170.0)], 0),        # too many samples
+    ([(27.0, 86.0), (27.5, 86.5)], 20000),        # short route, too many cells
+])
+def test_oversized_polyline_is_refused(points, buffer_m):
+    t0 = time.perf_counter()
+    with pytest.raises(ValueError):
+        ingest_jobs.tiles_for_polyline(points, buffer_m, 1000)
+    assert time.perf_counter() - t0 < 0.5
+
+def _places(n, lat):
+    return [{"source": "osm", "source_id": f"{lat}-{i}", "name": f"Lodge {lat} {i}", "kind": "lodging",
+             "lat": lat + i / 100, "lon": 86.0} for i in range(n)]
+
+def test_retried_tile_is_counted_once(tmp_db, monkeypatch):
+    places_db.init_db(); ingest_jobs.init_db()
+    monkeypatch.setattr(ingest_jobs, "BATCH_SIZE", 2)
+    runs = []
+
+    async def fake_osm(lat, lon, radius_m, kinds):
+        runs.append(lat)
+        for i, p in enumerate(_places(4, lat)):
+            if lat == 27.0 and len(runs) == 1 and i == 2: raise RuntimeError("overpass went away")
+            yield p
+
+    monkeypatch.setattr(ingest_jobs.osm, "aiter_osm", fake_osm)
+    job_id = ingest_jobs.create_job([(27.0, 86.0), (28.0, 86.0)], ["lodging"], {}, concurrency=1)
+    asyncio.run(ingest_jobs.run_job(job_id))
+    job = ingest_jobs.get_job(job_id)
+    assert (job["status"], job["tiles_done"], job["tiles_failed"]) == ("partial", 1, 1)
+    assert (job["fetched"], job["inserted"]) == (4, 4)   # the failed tile's first batch is not counted
+
+    asyncio.run(ingest_jobs.run_job(job_id))   # resume: only the failed tile runs again
+    job = ingest_jobs.get_job(job_id)
+    assert (job["status"], job["tiles_done"], job["tiles_failed"]) == ("done", 2, 0)
+    assert job["fetched"] == 8 and job["inserted"] + job["updated"] == 8
+    assert runs == [27.0, 28.0, 27.0]
+
+    ingest_jobs._finish_tile(job_id, 0)   # finishing twice adds nothing
+    assert ingest_jobs.get_job(job_id)["fetched"] == 8
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "scrape")
+
+@pytest.fixture
+def fixture_site(stub_server):
+    def handle(method, path, headers, body):
+        name = {"/": "index.html", "/lodge.html": "lodge.html", "/guides.html": "guides.html"}.get(path)
+        if not name: return 404, {}, b""
+        with open(os.path.join(FIXTURES, name), "rb") as f:
+            return 200, {"Content-Type": "text/html; charset=utf-8"}, f.read()
+    return stub_server(handle)
+
+@pytest.fixture
+def client(tmp_db, monkeypatch):
+    from app import scraper
+    from app.main import app
+    monkeypatch.setattr(scraper, "PARSE_WORKERS", 0)
+    monkeypatch.setattr(scraper, "Crawler", functools.partial(scraper.Crawler, delay_s=0, allow_private=True))
+    async def allow(url, allow_private=False): pass
+    monkeypatch.setattr(scraper, "check_url", allow)
+    async def fake_osm(lat, lon, radius_m, kinds):
+        for p in _places(3, lat): yield p
+    monkeypatch.setattr(ingest_jobs.osm, "aiter_osm", fake_osm)
+    with TestClient(app) as c:
+        yield c
+
+def _wait(c, job_id):
+    for _ in range(200):
+        job = c.get(f"/ingest/jobs/{job_id}").json()
+        if job["status"] in ("done", "partial"): return job
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} did not finish")
+
+def test_osm_ingest_is_queued_by_default(client):
+    r = client.post("/ingest/osm", json={"lat": 27.0, "lon": 86.0})
+    assert r.status_code == 202 and r.json()["type"] == "osm"
+    job = _wait(client, r.json()["id"])
+    assert (job["status"], job["fetched"], job["inserted"]) == ("done", 3, 3)
+
+def test_osm_ingest_sync_is_opt_in(client, monkeypatch):
+    async def fake_fetch(lat, lon, radius_m, kinds): return _places(2, lat)
+    monkeypatch.setattr(ingest_jobs.osm, "fetch_osm_async", fake_fetch)
+    r = client.post("/ingest/osm", json={"lat": 28.0, "lon": 86.0, "sync": True})
+    assert r.status_code == 200 and r.json()["inserted"] == 2 and "id" not in r.json()
+
+def test_scrape_is_queued_as_a_job(client, fixture_site):
+    r = client.post("/ingest/scrape", json={"urls": [fixture_site + "/"], "max_depth": 1})
+    assert r.status_code == 202 and r.json()["type"] == "scrape"
+    job = _wait(client, r.json()["id"])
+    assert job["status"] == "done" and job["fetched"] == job["inserted"] > 0
+    sync = client.post("/ingest/scrape", json={"urls": [fixture_site + "/"], "max_depth": 1, "sync": True, "force": True})
+    assert sync.status_code == 200 and sync.json()["pages"] > 0 and sync.json()["updated"] == job["inserted"]
@@ -0,0 +1,101 @@
+import asyncio, json, threading, time
+
+import httpx
+import pytest
+
+from app import osm
+
+PAYLOAD = {"version": 0.6, "elements": [
+    {"type": "node", "id": 1, "lat": 27.80, "lon": 86.71, "tags": {"name": "Namche Lodge", "tourism": "guest_house"}},
+    {"type": "way", "id": 2, "center": {"lat": 27.81, "lon": 86.72}, "tags": {"name": "Bakery", "amenity": "cafe"}},
+    {"type": "node", "id": 3, "lat": 27.82, "lon": 86.73, "tags": {"amenity": "cafe"}},   # unnamed: dropped
+]}
+
+@pytest.fixture(autouse=True)
+def _cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(osm, "CACHE_DIR", str(tmp_path / "overpass"))
+    monkeypatch.setattr(osm, "BACKOFF_S", 0.01)
+
+def _overpass(stub_server, monkeypatch, answers, delay_s=0.0):
+    """Stub Overpass answering with `answers` in turn (the last one repeats)."""
+    lock, seen = threading.Lock(), []
+    def handle(method, path, headers, body):
+        time.sleep(delay_s)
+        with lock:
+            seen.append(body)
+            status, out = answers[min(len(seen), len(answers)) - 1]
+        return status, {"Content-Type": "application/json", "Retry-After": "0"}, json.dumps(out).encode()
+    monkeypatch.setattr(osm, "OVERPASS_URL", stub_server(handle) + "/api/interpreter")
+    return seen
+
+def _run(make):
+    """Run make() (an awaitable) on a fresh loop, closing the shared client afterwards."""
+    async def main():
+        try:
+            return await make()
+        finally:
+            await osm.aclose()
+    return asyncio.run(main())
+
+def test_concurrent_identical_queries_share_one_request(stub_server, monkeypatch):
+    seen = _overpass(stub_server, monkeypatch, [(200, PAYLOAD)], delay_s=0.2)
+    ql = osm._build_overpass(27.8, 86.7, 2000, ["lodging", "cafe"])
+    # same query modulo whitespace
+    results = _run(lambda: asyncio.gather(*(osm.fetch_overpass_async(q) for q in [ql, ql, ql.replace("\n", "\n   ")])))
+    assert len(seen) == 1
+    assert results[0] == results[1] == results[2] == PAYLOAD
+
+def test_request_inside_inflight_area_reuses_it(stub_server, monkeypatch):
+    seen = _overpass(stub_server, monkeypatch, [(200, PAYLOAD)], delay_s=0.2)
+    big, small = _run(lambda: asyncio.gather(osm.fetch_osm_async(27.8, 86.7, 10000, ["lodging", "cafe"]),
+                                     osm.fetch_osm_async(27.8, 86.71, 500, ["lodging"])))
+    assert len(seen) == 1
+    assert {p["name"] for p in big} == {"Namche Lodge", "Bakery"}
+    assert [p["name"] for p in small] == ["Namche Lodge"]
+
+def test_fresh_cache_skips_network(stub_server, monkeypatch):
+    seen = _overpass(stub_server, monkeypatch, [(200, PAYLOAD)])
+    first = _run(lambda: osm.fetch_osm_async(27.8, 86.7, 2000, ["lodging"]))
+    again = _run(lambda: osm.fetch_osm_async(27.8, 86.7, 2000, ["lodging"]))
+    assert len(seen) == 1
+    assert first == again and first[0]["source_id"] == "node:1"
+
+def test_stale_cache_is_refetched(stub_server, monkeypatch):
+    seen = _overpass(stub_server, monkeypatch, [(200, PAYLOAD)])
+    _run(lambda: osm.fetch_osm_async(27.8, 86.7, 2000, ["lodging"]))
+    monkeypatch.setattr(osm, "CACHE_TTL_S", -1)
+    _run(lambda: osm.fetch_osm_async(27.8, 86.7, 2000, ["lodging"]))
+    assert len(seen) == 2
+
+def test_rate_limited_then_ok_is_retried(stub_server, monkeypatch):
+    seen = _overpass(stub_server, monkeypatch, [(429, {}), (504, {}), (200, PAYLOAD)])
+    places = _run(lambda: osm.fetch_osm_async(27.8, 86.7, 2000, ["lodging"]))
+    assert len(seen) == 3 and places == osm._elements(PAYLOAD, ["lodging"])
+
+def test_error_is_raised_to_every_waiter_and_not_cached(stub_server, monkeypatch):
+    seen = _overpass(stub_server, monkeypatch, [(500, {"error": "boom"})], delay_s=0.1)
+    ql = osm._build_overpass(27.8, 86.7, 2000, ["lodging"])
+    results = _run(lambda: asyncio.gather(*(osm.fetch_overpass_async(ql) for _ in range(3)), return_exceptions=True))
+    assert len(seen) == 1
+    assert all(isinstance(r, httpx.HTTPStatusError) for r in results)
+    assert osm._cache_get(ql) is None and not osm._inflight
+
+def test_streaming_matches_buffered(stub_server, monkeypatch):
+    _overpass(stub_server, monkeypatch, [(200, PAYLOAD)])
+    async def collect():
+        return [p async for p in osm.aiter_osm(27.8, 86.7, 2000, ["lodging", "cafe"])]
+    streamed = _run(lambda: collect())
+    cached = _run(lambda: collect())   # second pass reads the tee'd cache file
+    assert streamed == cached == osm._elements(PAYLOAD, ["lodging", "cafe"])
+
+def test_streaming_cache_io_stays_off_the_loop(stub_server, monkeypatch):
+    _overpass(stub_server, monkeypatch, [(200, PAYLOAD)])
+    opened = []
+    def spy_open(*a, **kw):
+        opened.append(threading.get_ident())
+        return open(*a, **kw)
+    monkeypatch.setattr(osm, "open", spy_open, raising=False)
+    async def collect():
+        return [p async for p in osm.aiter_osm(27.8, 86.7, 2000, ["lodging"])]
+    assert _run(collect) == _run(collect) != []   # writes the cache, then reads it
+    assert len(opened) == 2 and threading.get_ident() not in opened
@@ -0,0 +1,69 @@
+import pytest
+
+from app import dedup, places_db
+
+def _place(sid, name="Namche Lodge", lat=27.8050, lon=86.7140, kind="lodging", source="osm", **kw):
+    return {"source": source, "source_id": sid, "name": name, "kind": kind, "lat": lat, "lon": lon, **kw}
+
+@pytest.fixture
+def places(tmp_db):
+    places_db.init_db()
+    return places_db
+
+def test_bulk_upsert_reports_one_outcome_per_item(places):
+    first = places.bulk_upsert([_place("n1")])
+    assert [o["status"] for o in first] == ["inserted"]
+
+    out = places.bulk_upsert([
+        _place("n1", name="Namche Lodge & Bakery"),               # known key
+        _place("n2", name="Everest View Cafe", lat=27.81, lon=86.72, kind="cafe"),
+        _place("n3", name=""),                                    # rejected before SQL
+        _place("n4", lat=123.0),
+        _place("n2", name="Everest View Cafe", lat=27.81, lon=86.72, kind="cafe"),  # repeat in batch
+    ])
+    assert [o["status"] for o in out] == ["updated", "inserted", "failed", "failed", "updated"]
+    assert out[0]["id"] == first[0]["id"]
+    assert out[1]["id"] == out[4]["id"] is not None
+    assert "missing name" in out[2]["error"] and "bad coordinates" in out[3]["error"]
+    assert all(o["id"] is None for o in out[2:4])
+
+    row = places._conn().execute("SELECT name FROM places WHERE id=?;", (first[0]["id"],)).fetchone()
+    assert row["name"] == "Namche Lodge & Bakery"
+
+def test_bulk_upsert_keeps_rtree_in_sync(places):
+    out = places.bulk_upsert([_place("n1"), _place("n2", name="Khumbu Cafe", lat=27.9, lon=86.8, kind="cafe")])
+    got = places.search_nearby(27.8050, 86.7140, radius_m=500)
+    assert [p["id"] for p in got] == [out[0]["id"]]
+
+def test_upsert_place_raises_on_failure(places):
+    with pytest.raises(ValueError, match="missing kind"):
+        places.upsert_place(_place("n1", kind=None))
+
+@pytest.mark.parametrize("dup, status", [
+    (dict(name="Namche Lodge"), "merged"),                    # same name, same spot
+    (dict(name="namche lodge.", lat=27.8059), "merged"),      # ~100 m away, ratio >= 90
+    (dict(name="Namche Lodge", lat=27.8080), "inserted"),     # ~330 m away
+    (dict(name="Namche Guest House"), "inserted"),            # name too different
+    (dict(name="Namche Lodge", kind="cafe"), "inserted"),     # other kind
+])
+def test_dedup_thresholds(places, dup, status):
+    orig = places.bulk_upsert([_place("n1", address="Main trail")])[0]
+    out = places.bulk_upsert([_place("s1", source="scrape", website="https://example.org", **dup)])[0]
+    assert out["status"] == status
+    assert (out["id"] == orig["id"]) == (status == "merged")
+    if status == "merged":
+        row = places._conn().execute("SELECT * FROM places WHERE id=?;", (orig["id"],)).fetchone()
+        assert (row["address"], row["website"]) == ("Main trail", "https://example.org")   # fills gaps only
+
+def test_dedup_within_batch_merges_into_first(places):
+    out = places.bulk_upsert([_place("n1"), _place("s1", source="scrape", lon=86.7141), _place("n2", name="Khumbu Cafe")])
+    assert [o["status"] for o in out] == ["inserted", "merged", "inserted"]
+    assert out[1]["id"] == out[0]["id"] != out[2]["id"]
+
+def test_find_duplicates_respects_config(places):
+    places.bulk_upsert([_place("n1")])
+    row = places_db._row(_place("s1", name="Namche Lodge.", source="scrape", lat=27.8059))
+    cur = places._conn().cursor()
+    assert dedup.find_duplicates(cur, [(0, row)]) == {0: ("db", 1)}
+    assert dedup.find_duplicates(cur, [(0, row)], dedup.DedupConfig(radius_m=50)) == {}
+    assert dedup.find_duplicates(cur, [(0, row)], dedup.DedupConfig(min_similarity=99)) == {}
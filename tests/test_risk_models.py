@@ -0,0 +1,67 @@
+import signal, sys, threading, time, types
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main
+from app.risk_models import Registry, StubModel
+
+@pytest.fixture
+def calls(monkeypatch):
+    # a module whose factory records being called
+    mod = types.ModuleType("fake_risk_model")
+    mod.called = []
+    def make():
+        mod.called.append(1)
+        return StubModel()
+    mod.make = make
+    monkeypatch.setitem(sys.modules, "fake_risk_model", mod)
+    return mod.called
+
+def test_unlisted_module_name_is_never_imported(calls, monkeypatch):
+    imported = []
+    monkeypatch.setattr("importlib.import_module", lambda name: imported.append(name))
+    reg = Registry(allowed=())
+    for name in ("fake_risk_model:make", "os:getcwd", "os:abort"):
+        with pytest.raises(KeyError):
+            reg.activate(name)
+    assert not imported and not calls and reg.active_name == "stub"
+
+def test_allowed_module_name_is_built(calls):
+    reg = Registry(allowed={"fake_risk_model:make"})
+    assert reg.activate("fake_risk_model:make")["active"]["name"] == "fake_risk_model:make"
+    assert calls == [1]
+
+def test_reload_endpoint_needs_admin_token(tmp_db, calls, monkeypatch):
+    monkeypatch.setattr(main.risk_models, "allowed", {"fake_risk_model:make"})
+    with TestClient(main.app) as c:
+        body = {"active": "fake_risk_model:make"}
+        monkeypatch.setattr(main, "ADMIN_TOKEN", None)
+        assert c.post("/risk/models/reload", json=body).status_code == 403
+        monkeypatch.setattr(main, "ADMIN_TOKEN", "s3cret")
+        assert c.post("/risk/models/reload", json=body).status_code == 401
+        assert c.post("/risk/models/reload", json=body, headers={"Authorization": "Bearer nope"}).status_code == 401
+        assert not calls
+        ok = {"Authorization": "Bearer s3cret"}
+        assert c.post("/risk/models/reload", json={"active": "os:getcwd"}, headers=ok).status_code == 422
+        r = c.post("/risk/models/reload", json=body, headers=ok)
+        assert r.status_code == 200 and r.json()["active"]["name"] == "fake_risk_model:make" and calls == [1]
+        c.post("/risk/models/reload", json={"active": "stub"}, headers=ok)
+
+@pytest.mark.skipif(not hasattr(signal, "SIGHUP"), reason="no SIGHUP")
+def test_sighup_only_schedules_the_reload(tmp_db, monkeypatch, caplog):
+    handlers, ran = {}, []
+    monkeypatch.setattr(main.signal, "signal", lambda sig, h: handlers.setdefault(sig, h))
+    def reload():
+        ran.append(threading.current_thread().name)
+        raise ImportError("broken model module")
+    monkeypatch.setattr(main.risk_models, "reload", reload)
+    with TestClient(main.app) as c:
+        handlers[signal.SIGHUP](signal.SIGHUP, None)   # returns at once, from any thread
+        assert not ran
+        for _ in range(100):
+            if ran and not main._reloads: break
+            time.sleep(0.02)
+        assert len(ran) == 1 and ran[0].startswith("AnyIO worker")   # a threadpool thread, not the loop
+        assert c.get("/risk/models").status_code == 200   # the app is still serving
+    assert "reload failed" in caplog.text
@@ -0,0 +1,66 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main, risk_tiles
+
+@pytest.fixture(autouse=True)
+def _tile_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(risk_tiles, "TILE_DIR", str(tmp_path / "tiles"))
+    risk_tiles._fingerprint.cache_clear()
+
+def test_concurrent_renders_of_one_tile_all_succeed():
+    jobs = [(6, 47, 26, m) for m in range(1, 13) for _ in range(8)]
+    with ThreadPoolExecutor(8) as pool:
+        out = list(pool.map(lambda a: risk_tiles.ensure(*a), jobs))
+    paths = {p for p, _, _ in out}
+    assert len(paths) == 12 and all(os.path.exists(p) for p in paths)
+    tile_dir = risk_tiles._dir(6, 47, 26)
+    assert not [f for f in os.listdir(tile_dir) if f.endswith(".tmp")]
+    assert risk_tiles.load(out[0][0]).shape == (len(risk_tiles.BANDS), risk_tiles.TILE_SIZE, risk_tiles.TILE_SIZE)
+
+def test_cache_hit_skips_grid_and_dem(monkeypatch):
+    p, fp, built = risk_tiles.ensure(6, 47, 26, 3)
+    assert built
+    def boom(*a, **kw): raise AssertionError("recomputed on a hit")
+    monkeypatch.setattr(risk_tiles, "cell_centers", boom)
+    monkeypatch.setattr(risk_tiles, "elevations", boom)
+    assert risk_tiles.ensure(6, 47, 26, 3) == (p, fp, False)
+
+def test_new_dem_changes_fingerprint(tmp_path, monkeypatch):
+    p0, fp0, _ = risk_tiles.ensure(6, 47, 26, 3)
+    dem = tmp_path / "dem.npy"
+    np.save(dem, np.full((180, 360), 4000, dtype=np.int16))
+    monkeypatch.setattr(risk_tiles, "DEM_PATH", str(dem))
+    p1, fp1, built = risk_tiles.ensure(6, 47, 26, 3)
+    assert built and fp1 != fp0 and not os.path.exists(p0)
+
+def test_models_keep_their_own_tiles():
+    a, _, _ = risk_tiles.ensure(6, 47, 26, 3, source="model-a")
+    b, _, built = risk_tiles.ensure(6, 47, 26, 3, source="model-b")
+    assert built and a != b and os.path.exists(a) and os.path.exists(b)
+
+def test_deep_zoom_needs_precompute_or_admin(tmp_db, monkeypatch):
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "s3cret")
+    z, x, y = risk_tiles.PUBLIC_MAX_ZOOM + 1, 1500, 850
+    with TestClient(main.app) as c:
+        assert c.get(f"/risk/tiles/{z}/{x}/{y}", params={"month": 3}).status_code == 404
+        assert not os.path.exists(risk_tiles._dir(z, x, y))
+        r = c.get(f"/risk/tiles/{z}/{x}/{y}", params={"month": 3}, headers={"Authorization": "Bearer s3cret"})
+        assert r.status_code == 200
+        assert c.get(f"/risk/tiles/{z}/{x}/{y}", params={"month": 3}).content == r.content   # now on disk
+        assert c.get(f"/risk/tiles/3/2/3", params={"month": 3}).status_code == 200
+
+def test_tile_removed_after_ensure_is_looked_up_again(tmp_db, monkeypatch):
+    read, calls = risk_tiles.read, []
+    def flaky(p, band):
+        calls.append(p)
+        if len(calls) == 1: raise FileNotFoundError(p)
+        return read(p, band)
+    monkeypatch.setattr(risk_tiles, "read", flaky)
+    with TestClient(main.app) as c:
+        assert c.get("/risk/tiles/3/2/3", params={"month": 3}).status_code == 200
+    assert len(calls) == 2
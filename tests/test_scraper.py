@@ -0,0 +1,114 @@
+import asyncio, hashlib, os, threading, time
+
+import pytest
+
+from app import scraper
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "scrape")
+
+def _page(name: str) -> str:
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return f.read()
+
+SITE = {"/": _page("index.html"), "/lodge.html": _page("lodge.html"), "/guides.html": _page("guides.html"),
+        "/private/admin.html": "<html>secret</html>"}
+
+@pytest.fixture
+def db(tmp_db, monkeypatch):
+    monkeypatch.setattr(scraper, "PARSE_WORKERS", 0)   # parse in a thread, no process pool start-up
+    scraper.init_db()
+    yield
+    scraper.shutdown()
+
+@pytest.fixture
+def site(stub_server):
+    """Fixture site with ETags and a robots.txt (Crawl-delay, /private/ disallowed); logs every GET."""
+    log, lock = [], threading.Lock()
+    robots = {"txt": "User-agent: *\nDisallow: /private/\n"}
+    def handle(method, path, headers, body):
+        with lock: log.append((time.monotonic(), path, headers.get("If-None-Match")))
+        if path == "/robots.txt":
+            return 200, {"Content-Type": "text/plain"}, robots["txt"].encode()
+        if path not in SITE:
+            return 404, {}, b""
+        out = SITE[path].encode()
+        etag = '"%s"' % hashlib.sha1(out).hexdigest()[:16]
+        if headers.get("If-None-Match") == etag:
+            return 304, {"ETag": etag}, b""
+        return 200, {"Content-Type": "text/html; charset=utf-8", "ETag": etag}, out
+    base = stub_server(handle)
+    return base, log, robots
+
+def _crawl(base: str, **kw):
+    kw = {"max_depth": 2, "delay_s": 0, "allow_private": True, **kw}
+    c = scraper.Crawler([base + "/"], **kw)
+    async def collect():
+        return [r async for r in c.records()]
+    return asyncio.run(collect()), c.stats
+
+def _pages(log):
+    return [p for _, p, _ in log if p != "/robots.txt"]
+
+# ----- parse -----
+def test_parse_json_ld():
+    records, links = scraper.parse_page("https://example.com/lodge.html", _page("lodge.html"))
+    assert records == [{
+        "source": "scrape", "source_id": "lodge-1", "name": "Tea House Namche", "kind": "lodging",
+        "lat": 27.8036, "lon": 86.7139, "address": "Main trail, Namche Bazaar, NP", "phone": "+977-1-00001",
+        "website": "https://example.com/lodge", "rating": 4.5, "price": "$",
+        "tags": {"page": "https://example.com/lodge.html", "schema_type": "Hotel"},
+    }]
+    assert links == ["https://example.com/"]
+
+def test_parse_microdata_and_links():
+    records, links = scraper.parse_page("https://example.com/guides.html", _page("guides.html"))
+    assert [(r["source_id"], r["name"], r["kind"], r["lat"], r["lon"], r["phone"]) for r in records] == [
+        ("guide-1", "Sherpa Guides Lukla", "guide", 27.6869, 86.7314, "+977-98-00002")]
+    _, links = scraper.parse_page("https://example.com/", _page("index.html"))
+    assert links[:2] == ["https://example.com/lodge.html", "https://example.com/guides.html"]   # fragment dropped
+
+# ----- crawl -----
+def test_robots_disallow_is_never_fetched(db, site):
+    base, log, _ = site
+    records, stats = _crawl(base)
+    assert sorted(r["name"] for r in records) == ["Sherpa Guides Lukla", "Tea House Namche"]
+    assert stats["disallowed"] == 1 and stats["pages"] == 3
+    assert "/private/admin.html" not in _pages(log)
+    assert [p for p in (x[1] for x in log) if p == "/robots.txt"] == ["/robots.txt"]   # once per host
+
+def test_crawl_delay_spaces_requests(db, site):
+    base, log, robots = site
+    robots["txt"] += "Crawl-delay: 1\n"   # whole seconds: urllib.robotparser ignores fractions
+    _crawl(base, host_concurrency=4)
+    times = [t for t, p, _ in log if p != "/robots.txt"]
+    assert len(times) == 3
+    assert all(b - a >= 0.95 for a, b in zip(times, times[1:]))
+
+def test_recrawl_uses_conditional_get(db, site):
+    base, log, _ = site
+    first, _ = _crawl(base)
+    del log[:]
+    again, stats = _crawl(base)
+    assert len(first) == 2 and again == []
+    assert stats["not_modified"] == stats["pages"] == 3   # links still followed from the stored page
+    assert all(inm for _, p, inm in log if p != "/robots.txt")
+    forced, stats = _crawl(base, force=True)
+    assert len(forced) == 2 and stats["not_modified"] == 0
+
+# ----- where the crawler may go -----
+@pytest.mark.parametrize("url", ["http://127.0.0.1/", "http://localhost:8000/", "http://10.1.2.3/",
+                                 "http://169.254.169.254/latest/meta-data/", "http://[::1]/", "file:///etc/passwd"])
+def test_internal_urls_are_blocked(url):
+    with pytest.raises(scraper.BlockedURL):
+        asyncio.run(scraper.check_url(url, allow_private=False))
+
+def test_allowed_hosts(monkeypatch):
+    monkeypatch.setattr(scraper, "ALLOWED_HOSTS", {"example.com"})
+    asyncio.run(scraper.check_url("https://www.example.com/x", allow_private=True))
+    with pytest.raises(scraper.BlockedURL):
+        asyncio.run(scraper.check_url("https://example.org/", allow_private=True))
+
+def test_crawler_refuses_loopback_without_opt_in(db, site):
+    base, log, _ = site
+    records, stats = _crawl(base, allow_private=False)
+    assert records == [] and stats["page_errors"] == 1 and log == []
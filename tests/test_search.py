@@ -0,0 +1,44 @@
+import pytest
+
+from app import places_db, search
+
+_PLACES = [
+    ("n1", "Namche Bazaar Lodge", "lodging", 27.8050, 86.7140, {"cuisine": "nepali"}),
+    ("n2", "Namaste Cafe", "cafe", 27.8060, 86.7150, {}),
+    ("n3", "Tengboche Bakery", "cafe", 27.8360, 86.7640, {"cuisine": "bakery"}),
+    ("n4", "Namche Bakery", "cafe", 27.7000, 86.6000, {}),
+    ("n5", "Pheriche Hospital", "clinic", 27.8950, 86.8190, {}),
+]
+
+@pytest.fixture
+def places(tmp_db):
+    places_db.init_db()
+    places_db.bulk_upsert([{"source": "osm", "source_id": sid, "name": n, "kind": k, "lat": la, "lon": lo, "tags": t}
+                           for sid, n, k, la, lo, t in _PLACES])
+
+def _names(hits):
+    return [h["name"] for h in hits]
+
+def test_fts_prefix_matches_every_token(places):
+    hits = search.search("namc baz")
+    assert _names(hits) == ["Namche Bazaar Lodge"]
+    assert hits[0]["match"] == "fts"
+
+def test_fts_syntax_is_not_passed_through(places):
+    assert search.search('bakery" OR "*') != [] and search.search("()") == []
+
+def test_kind_filter_and_distance_boost(places):
+    assert set(_names(search.search("bakery", kind="cafe"))) == {"Tengboche Bakery", "Namche Bakery"}
+    near = search.search("bakery", lat=27.7001, lon=86.6001)
+    assert near[0]["name"] == "Namche Bakery" and near[0]["distance_m"] < 50
+
+def test_fuzzy_fallback_tolerates_typos(places):
+    hits = search.search("tengbochee bakry")
+    assert _names(hits)[:1] == ["Tengboche Bakery"]
+    assert hits[0]["match"] == "fuzzy"
+    assert search.search("zzzzqqq") == []
+
+def test_fts_hits_rank_above_fuzzy_and_are_not_repeated(places):
+    hits = search.search("pheriche", limit=5)
+    assert [h["match"] for h in hits][:1] == ["fts"]
+    assert len({h["id"] for h in hits}) == len(hits)